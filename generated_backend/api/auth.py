@@ -430,6 +430,8 @@ def register_auth_routes(app):
         try:
             page = request.args.get('page', 1, type=int)
             limit = request.args.get('limit', 20, type=int)
+            cursor = request.args.get('cursor', '')
+            with_total = request.args.get('with_total', '') in ('1', 'true')
             search = request.args.get('search', '')
             
             query = User.query
@@ -440,10 +442,18 @@ def register_auth_routes(app):
                     User.email.contains(search)
                 )
             
-            total = query.count()
-            users = query.order_by(User.created_at.desc()).offset((page - 1) * limit).limit(limit).all()
+            # 按 (created_at, id) 游标分页，总数默认为估算值
+            from dao.pagination import paginate_query, InvalidCursorError
+            try:
+                result = paginate_query(
+                    query, User.created_at, User.id, limit,
+                    cursor=cursor, offset=(page - 1) * limit, with_total=with_total
+                )
+            except InvalidCursorError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
+            total = result['total']
             
-            users_data = [user.to_dict() for user in users]
+            users_data = [user.to_dict() for user in result['items']]
             
             return jsonify({
                 'success': True,
@@ -452,7 +462,10 @@ def register_auth_routes(app):
                     'page': page,
                     'limit': limit,
                     'total': total,
-                    'pages': (total + limit - 1) // limit
+                    'total_exact': result['total_exact'],
+                    'pages': (total + limit - 1) // limit,
+                    'has_more': result['has_more'],
+                    'next_cursor': result['next_cursor']
                 }
             })
             
@@ -78,6 +78,8 @@ def register_document_routes(app):
             # 获取查询参数
             page = request.args.get('page', 1, type=int)
             limit = request.args.get('limit', 20, type=int)
+            cursor = request.args.get('cursor', '')
+            with_total = request.args.get('with_total', '') in ('1', 'true')
             search = request.args.get('search', '')
             project_id = request.args.get('project_id', type=int)
             status = request.args.get('status', '')
@@ -127,9 +129,16 @@ def register_document_routes(app):
             if file_type:
                 query = query.filter(Document.file_type == file_type)
             
-            # 分页
-            total = query.count()
-            documents = query.order_by(Document.created_at.desc()).offset((page - 1) * limit).limit(limit).all()
+            # 按 (created_at, id) 游标分页，总数默认为估算值
+            from dao.pagination import paginate_query, pagination_headers, InvalidCursorError
+            try:
+                result = paginate_query(
+                    query, Document.created_at, Document.id, limit,
+                    cursor=cursor, offset=(page - 1) * limit, with_total=with_total
+                )
+            except InvalidCursorError as e:
+                return jsonify({'error': str(e)}), 400
+            documents = result['items']
             
             # 转换为字典列表，使用简化的格式与mock保持一致
             documents_data = []
@@ -153,8 +162,8 @@ def register_document_routes(app):
                 }
                 documents_data.append(doc_dict)
 
-            # 直接返回文档数组，与mock格式完全一致
-            return jsonify(documents_data)
+            # 直接返回文档数组，与mock格式完全一致；下一页游标和总数通过响应头返回
+            return jsonify(documents_data), 200, pagination_headers(result)
             
         except Exception as e:
             current_app.logger.error(f"重试文档处理失败: {e}")
@@ -258,6 +267,7 @@ def register_document_routes(app):
     @app.route('/api/documents/upload', methods=['POST'])
     def upload_document():
         """上传文档"""
+        stored_upload = None
         try:
             # 先进行基本的文件检查，再进行认证
             if 'file' not in request.files:
@@ -298,275 +308,186 @@ def register_document_routes(app):
             document_name = request.form.get('name', file.filename)
             label = request.form.get('label')  # 获取label参数
 
-            # 优先使用project_id，如果没有则使用project_name（向后兼容）
-            if project_id:
-                try:
-                    project_id = int(project_id)
-                    project = Project.query.get(project_id)
-                    current_app.logger.info(f"使用project_id查找项目: {project_id}, 找到项目: {project.name if project else 'None'}")
-                    if not project:
-                        return jsonify({'success': False, 'error': '项目不存在'}), 404
-                except ValueError:
-                    return jsonify({'success': False, 'error': '项目ID格式错误'}), 400
-            elif project_name:
-                # 向后兼容：使用项目名称查找
-                project = Project.query.filter_by(name=project_name).first()
-                current_app.logger.info(f"使用project_name查找项目: {project_name}, 找到项目ID: {project.id if project else 'None'}")
-                if not project:
-                    return jsonify({'success': False, 'error': '项目不存在'}), 404
-            else:
-                return jsonify({'success': False, 'error': '缺少项目信息'}), 400
+            project, error_response = _resolve_upload_project(project_id, project_name, current_user)
+            if error_response:
+                return error_response
 
-            # 检查用户是否有权限向此项目上传文档
-            if current_user.role != UserRole.ADMIN:
-                if (project.created_by != current_user.id and
-                    project.assigned_to != current_user.id):
-                    return jsonify({'error': '您没有权限向此项目上传文档'}), 403
-            
-            # 先获取文件类型（使用原始文件名）
             original_filename = file.filename
-            file_type = get_file_type(original_filename)
+            file_path = _build_upload_path(project, original_filename)
 
-            # 生成安全的文件名
-            filename = secure_filename(original_filename)
+            # 保存文件到内容存储，项目文件夹中的文件通过硬链接生成（相同内容只存一份）
+            from services.blob_store import blob_store
+            source_hash, file_size, blob_created = blob_store.save_stream(file.stream, file_path)
+            stored_upload = (file_path, source_hash, blob_created)
 
-            # 如果secure_filename过滤掉了所有字符（比如中文文件名），使用原始扩展名
-            if not filename or '.' not in filename:
-                # 提取原始扩展名
-                if '.' in original_filename:
-                    ext = original_filename.rsplit('.', 1)[1]
-                    filename = f"document.{ext}"
-                else:
-                    filename = "document"
+            upload_response = _create_uploaded_document(
+                app, project, current_user, original_filename, document_name, label,
+                file_path, file_size, source_hash, file.mimetype
+            )
+            return jsonify(upload_response), 201
+            
+        except Exception as e:
+            db.session.rollback()
+            _discard_uncommitted_upload(stored_upload)
+            current_app.logger.error(f"上传文档失败: {e}")
+            return jsonify({'success': False, 'error': '上传文档失败'}), 500
 
-            unique_filename = f"{uuid.uuid4().hex}_{filename}"
+    def _chunked_upload_error(e):
+        """分片上传错误响应（附带已接收的字节数，客户端据此续传）"""
+        body = {'success': False, 'error': e.message}
+        if e.received_bytes is not None:
+            body['received_bytes'] = e.received_bytes
+        return jsonify(body), e.status_code
 
-            # 确保上传目录存在 - 使用项目的folder_uuid创建子目录
-            upload_folder = current_app.config.get('UPLOAD_FOLDER', 'uploads')
-            project_folder = os.path.join(upload_folder, project.folder_uuid)
+    @app.route('/api/documents/uploads', methods=['POST'])
+    @token_required
+    def init_chunked_upload():
+        """初始化分片上传（大文件使用，分片通过 PUT /api/documents/uploads/<upload_id>/chunks 上传）"""
+        from services.chunked_upload_service import chunked_upload_service, ChunkedUploadError
+        try:
+            current_user = request.current_user
+            data = request.get_json() or {}
 
-            # 创建项目文件夹（如果不存在）
-            if not os.path.exists(project_folder):
-                os.makedirs(project_folder)
+            original_filename = data.get('filename')
+            if not original_filename:
+                return jsonify({'success': False, 'error': '缺少文件名'}), 400
 
-            # 保存文件到项目特定的文件夹
-            file_path = os.path.join(project_folder, unique_filename)
-            file.save(file_path)
+            # 与普通上传相同的文件类型检查
+            file_ext = original_filename.rsplit('.', 1)[1].lower() if '.' in original_filename else ''
+            if file_ext in ['doc', 'docx']:
+                return jsonify({'message': '暂不支持该格式，请转化成PDF格式上传'}), 400
+            if not allowed_file(original_filename):
+                return jsonify({'success': False, 'error': '不支持的文件类型'}), 400
 
-            # 获取文件信息
-            file_size = os.path.getsize(file_path)
-            
-            # 处理label参数
-            document_label = None
-            if label:
-                try:
-                    from db_models import DocumentLabel, DOCUMENT_LABEL_NAMES
-                    # 直接将前端传来的英文值转换为枚举
-                    if hasattr(DocumentLabel, label):
-                        document_label = getattr(DocumentLabel, label)
-                        current_app.logger.info(f"找到文档标签: {label} -> {document_label}")
-                    else:
-                        # 如果传来的是中文，通过映射找到对应的枚举
-                        for enum_item in DocumentLabel:
-                            if DOCUMENT_LABEL_NAMES.get(enum_item) == label:
-                                document_label = enum_item
-                                current_app.logger.info(f"通过中文标签找到枚举: {label} -> {document_label}")
-                                break
-                        if not document_label:
-                            current_app.logger.warning(f"未找到匹配的文档标签: {label}")
-                except Exception as e:
-                    current_app.logger.warning(f"处理文档标签失败: {e}")
-            
-            # 如果有label，修改document_name添加中文前缀
-            final_document_name = document_name
-            if document_label:
-                from db_models import DOCUMENT_LABEL_NAMES
-                chinese_label = DOCUMENT_LABEL_NAMES.get(document_label)
-                if chinese_label:
-                    label_prefix = chinese_label + "_"
-                    # 检查是否已经有前缀了（避免重复添加）
-                    if not document_name.startswith(label_prefix):
-                        final_document_name = label_prefix + document_name
-                    current_app.logger.info(f"添加中文标签前缀: {chinese_label} -> {final_document_name}")
-                else:
-                    current_app.logger.warning(f"无法找到标签的中文名称: {document_label}")
-            
-            # 创建文档记录 - 初始状态为UPLOADING
-            document = Document(
-                name=final_document_name,  # 使用添加了label前缀的文件名
-                original_filename=original_filename,  # 使用原始文件名
-                file_path=file_path,
-                file_size=file_size,
-                file_type=file_type,
-                mime_type=file.mimetype,
-                project_id=project.id,
-                status=DocumentStatus.UPLOADING,  # 初始状态为上传中
-                progress=0,
-                upload_by=current_user.id,  # 使用当前用户ID
-                label=document_label  # 添加label字段
+            try:
+                total_size = int(data.get('size'))
+            except (TypeError, ValueError):
+                return jsonify({'success': False, 'error': '文件大小格式错误'}), 400
+
+            project, error_response = _resolve_upload_project(data.get('project_id'), data.get('project'), current_user)
+            if error_response:
+                return error_response
+
+            upload_session = chunked_upload_service.create_session(
+                project, current_user, original_filename,
+                document_name=data.get('name') or original_filename,
+                label=data.get('label'),
+                mime_type=data.get('mime_type'),
+                total_size=total_size,
+                expected_hash=data.get('sha256')
             )
-            
-            db.session.add(document)
-            db.session.commit()
-            
-            # 记录日志
-            log_action(
-                user_id=document.upload_by,
-                action='document_upload_start',
-                resource_type='document',
-                resource_id=document.id,
-                details=f'开始上传文档: {document.name}'
+            return jsonify({'success': True, 'data': upload_session.to_dict()}), 201
+
+        except ChunkedUploadError as e:
+            return _chunked_upload_error(e)
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"初始化分片上传失败: {e}")
+            return jsonify({'success': False, 'error': '初始化分片上传失败'}), 500
+
+    @app.route('/api/documents/uploads/<upload_id>', methods=['GET'])
+    @token_required
+    def get_chunked_upload(upload_id):
+        """获取分片上传进度（续传时从 received_bytes 继续）"""
+        from services.chunked_upload_service import chunked_upload_service, ChunkedUploadError
+        try:
+            upload_session = chunked_upload_service.get_session(upload_id, request.current_user)
+            return jsonify({'success': True, 'data': upload_session.to_dict()})
+        except ChunkedUploadError as e:
+            return _chunked_upload_error(e)
+        except Exception as e:
+            current_app.logger.error(f"获取分片上传进度失败: {e}")
+            return jsonify({'success': False, 'error': '获取分片上传进度失败'}), 500
+
+    @app.route('/api/documents/uploads/<upload_id>/chunks', methods=['PUT'])
+    @token_required
+    def put_upload_chunk(upload_id):
+        """
+        上传一个分片
+
+        请求体为分片的原始字节（application/octet-stream），查询参数 offset 为分片起始位置，
+        可选请求头 X-Chunk-SHA256 为分片校验值
+        """
+        from services.chunked_upload_service import chunked_upload_service, ChunkedUploadError
+        try:
+            try:
+                offset = int(request.args.get('offset', ''))
+            except ValueError:
+                return jsonify({'success': False, 'error': '缺少或错误的offset参数'}), 400
+
+            upload_session = chunked_upload_service.write_chunk(
+                upload_id, request.current_user, offset,
+                length=request.content_length,
+                stream=request.stream,
+                chunk_hash=request.headers.get('X-Chunk-SHA256')
             )
-            
-            # 先返回上传完成状态的文档信息
-            upload_response = {
+            return jsonify({
                 'success': True,
                 'data': {
-                    'id': document.id,
-                    'name': document.name,
-                    'project': project.name,
-                    'project_id': project.id,  # 添加项目ID
-                    'type': document.file_type,  # 直接使用数据库中的原始值
-                    'size': document.format_file_size(),
-                    'status': 'uploading',
-                    'uploadTime': document.created_at.strftime('%Y-%m-%d %H:%M'),
-                    'progress': 0
-                },
-                'message': '文档上传开始'
-            }
-            
-            # 记录上传完成日志
-            log_action(
-                user_id=document.upload_by,
-                action='document_upload_complete',
-                resource_type='document',
-                resource_id=document.id,
-                details=f'文档上传完成: {document.name}'
+                    'upload_id': upload_session.id,
+                    'received_bytes': upload_session.received_bytes,
+                    'total_size': upload_session.total_size
+                }
+            })
+        except ChunkedUploadError as e:
+            return _chunked_upload_error(e)
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"上传分片失败: {e}")
+            return jsonify({'success': False, 'error': '上传分片失败'}), 500
+
+    @app.route('/api/documents/uploads/<upload_id>/complete', methods=['POST'])
+    @token_required
+    def complete_chunked_upload(upload_id):
+        """完成分片上传：校验文件后创建文档记录并启动文档处理（与普通上传相同）"""
+        from services.chunked_upload_service import chunked_upload_service, ChunkedUploadError
+        from services.blob_store import blob_store
+        stored_upload = None
+        try:
+            current_user = request.current_user
+            upload_session, part_path, source_hash = chunked_upload_service.finish(upload_id, current_user)
+
+            # 纳入内容存储并在项目文件夹中生成文件
+            project = upload_session.project
+            file_path = _build_upload_path(project, upload_session.original_filename)
+            blob_created = blob_store.store_file(part_path, source_hash, upload_session.total_size, file_path)
+            stored_upload = (file_path, source_hash, blob_created)
+
+            # 会话状态与文档记录在同一事务中提交
+            upload_response = _create_uploaded_document(
+                app, project, current_user, upload_session.original_filename, upload_session.document_name,
+                upload_session.label, file_path, upload_session.total_size, source_hash, upload_session.mime_type
             )
-            
-            # 触发文档处理
-            from services.document_processor import document_processor
-            
-            # 保存文档ID和项目名，避免会话问题
-            doc_id = document.id
-            project_name_for_log = project.name
-            
-            # 检查是否为md文件
-            if file_type == 'markdown':
-                # md文件直接处理
-                def process_md_file():
-                    """处理md文件"""
-                    try:
-                        with app.app_context():
-                            current_app.logger.info(f"开始处理md文件: {doc_id}")
-                            success = document_processor.process_markdown_file(doc_id)
-                            
-                            if success:
-                                current_app.logger.info(f"md文件处理完成: {doc_id}")
-                                # 知识库创建和上传由document_processor处理，这里不再重复调用
-                                
-                                # 记录活动日志
-                                try:
-                                    from services.stats_service import ActivityLogger
-                                    doc = Document.query.get(doc_id)
-                                    if doc:
-                                        user = User.query.get(doc.upload_by)
-                                        user_name = user.full_name if user else 'Unknown'
-                                        ActivityLogger.log_document_uploaded(
-                                            doc.id, doc.name, project_name_for_log, doc.upload_by, user_name
-                                        )
-                                except Exception as e:
-                                    current_app.logger.warning(f"记录活动日志失败: {e}")
-                            else:
-                                current_app.logger.error(f"md文件处理失败: {doc_id}")
-                                
-                    except Exception as e:
-                        current_app.logger.error(f"md文件处理异常: {e}")
-                
-                # 在后台线程中处理md文件
-                import threading
-                thread = threading.Thread(target=process_md_file)
-                thread.daemon = True
-                thread.start()
-            elif file_type == 'word':
-                # Word文件处理
-                def process_word_file():
-                    """处理Word文件"""
-                    try:
-                        with app.app_context():
-                            current_app.logger.info(f"开始处理Word文件: {doc_id}")
-                            success = document_processor.process_word_file(doc_id)
-                            
-                            if success:
-                                current_app.logger.info(f"Word文件处理完成: {doc_id}")
-                                # 知识库创建和上传由document_processor处理，这里不再重复调用
-                                
-                                # 记录活动日志
-                                try:
-                                    from services.stats_service import ActivityLogger
-                                    doc = Document.query.get(doc_id)
-                                    if doc:
-                                        user = User.query.get(doc.upload_by)
-                                        user_name = user.username if user else 'Unknown'
-                                        ActivityLogger.log_document_uploaded(
-                                            doc.id, doc.name, project_name_for_log, doc.upload_by, user_name
-                                        )
-                                except Exception as e:
-                                    current_app.logger.warning(f"记录活动日志失败: {e}")
-                            else:
-                                current_app.logger.error(f"Word文件处理失败: {doc_id}")
-                                
-                    except Exception as e:
-                        current_app.logger.error(f"Word文件处理异常: {e}")
-                
-                # 在后台线程中处理Word文件
-                import threading
-                thread = threading.Thread(target=process_word_file)
-                thread.daemon = True
-                thread.start()
-            else:
-                # 非md和Word文件，使用外部API处理
-                def start_document_processing():
-                    """启动文档处理"""
-                    try:
-                        with app.app_context():
-                            current_app.logger.info(f"开始文档处理: {doc_id}")
-                            success = document_processor.process_document(doc_id)
-                            
-                            if success:
-                                current_app.logger.info(f"文档处理完成: {doc_id}")
-                                # 知识库创建和上传由document_processor处理，这里不再重复调用
-                                
-                                # 记录活动日志
-                                try:
-                                    from services.stats_service import ActivityLogger
-                                    doc = Document.query.get(doc_id)
-                                    if doc:
-                                        user = User.query.get(doc.upload_by)
-                                        user_name = user.username if user else 'Unknown'
-                                        ActivityLogger.log_document_uploaded(
-                                            doc.id, doc.name, project_name_for_log, doc.upload_by, user_name
-                                        )
-                                except Exception as e:
-                                    current_app.logger.warning(f"记录活动日志失败: {e}")
-                            else:
-                                current_app.logger.error(f"文档处理失败: {doc_id}")
-                                
-                    except Exception as e:
-                        current_app.logger.error(f"文档处理异常: {e}")
-                
-                # 在后台线程中启动文档处理
-                import threading
-                thread = threading.Thread(target=start_document_processing)
-                thread.daemon = True
-                thread.start()
-            
+            upload_session.document_id = upload_response['data']['id']
+            db.session.commit()
+
+            # 提交后删除临时文件（失败时保留，客户端可以重试完成请求）
+            chunked_upload_service.remove_part_files(upload_id)
             return jsonify(upload_response), 201
-            
+
+        except ChunkedUploadError as e:
+            db.session.rollback()
+            return _chunked_upload_error(e)
         except Exception as e:
             db.session.rollback()
-            current_app.logger.error(f"上传文档失败: {e}")
-            return jsonify({'success': False, 'error': '上传文档失败'}), 500
+            _discard_uncommitted_upload(stored_upload)
+            current_app.logger.error(f"完成分片上传失败: {e}")
+            return jsonify({'success': False, 'error': '完成分片上传失败'}), 500
+
+    @app.route('/api/documents/uploads/<upload_id>', methods=['DELETE'])
+    @token_required
+    def abort_chunked_upload(upload_id):
+        """取消分片上传"""
+        from services.chunked_upload_service import chunked_upload_service, ChunkedUploadError
+        try:
+            chunked_upload_service.abort(upload_id, request.current_user)
+            return jsonify({'success': True, 'message': '上传已取消'})
+        except ChunkedUploadError as e:
+            return _chunked_upload_error(e)
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"取消分片上传失败: {e}")
+            return jsonify({'success': False, 'error': '取消分片上传失败'}), 500
     
     @app.route('/api/documents/<int:document_id>/status', methods=['GET'])
     def get_document_status(document_id):
@@ -841,6 +762,7 @@ def register_document_routes(app):
 
             document_name = document.name
             file_path = document.file_path
+            blob_hash = document.blob_hash
 
             # 记录日志
             log_action(
@@ -863,7 +785,9 @@ def register_document_routes(app):
             from services.document_processor import document_processor
             document_processor.delete_processed_document(document)
             
-            # 删除数据库记录
+            # 删除数据库记录，同时释放文件内容的引用
+            from services.blob_store import blob_store
+            blob_store.release(blob_hash)
             db.session.delete(document)
             db.session.commit()
             
@@ -873,6 +797,9 @@ def register_document_routes(app):
                     os.remove(file_path)
             except Exception as e:
                 current_app.logger.warning(f"删除原始文件失败: {e}")
+
+            # 没有其他文档引用时删除文件内容
+            blob_store.purge_unreferenced([blob_hash])
             
             return jsonify({
                 'success': True,
@@ -884,6 +811,28 @@ def register_document_routes(app):
             current_app.logger.error(f"删除文档失败: {e}")
             return jsonify({'success': False, 'error': '删除文档失败'}), 500
 
+    @app.route('/api/documents/processing/stats', methods=['GET'])
+    @token_required
+    def get_document_processing_stats():
+        """获取文档处理执行器的队列深度、等待时间等指标"""
+        try:
+            from services.document_executor import document_executor
+            return jsonify({'success': True, 'data': document_executor.get_stats()})
+        except Exception as e:
+            current_app.logger.error(f"获取文档处理指标失败: {e}")
+            return jsonify({'success': False, 'error': '获取文档处理指标失败'}), 500
+
+    @app.route('/api/documents/storage/stats', methods=['GET'])
+    @token_required
+    def get_document_storage_stats():
+        """获取上传文件内容存储的占用和去重指标"""
+        try:
+            from services.blob_store import blob_store
+            return jsonify({'success': True, 'data': blob_store.get_stats()})
+        except Exception as e:
+            current_app.logger.error(f"获取文件存储指标失败: {e}")
+            return jsonify({'success': False, 'error': '获取文件存储指标失败'}), 500
+
     @app.route('/api/documents/<int:document_id>/retry', methods=['POST'])
     @token_required
     def retry_document_processing(document_id):
@@ -936,9 +885,9 @@ def register_document_routes(app):
             from services.document_processor import DocumentProcessor
             processor = DocumentProcessor()
 
-            # 获取当前应用实例，用于传递给异步线程
+            # 获取当前应用实例，用于传递给执行器（手动重试优先处理）
             app = current_app._get_current_object()
-            processor.process_document_async(document.id, app)
+            processor.process_document_async(document.id, app, interactive=True)
 
             # 记录操作日志
             log_action(
@@ -959,6 +908,297 @@ def register_document_routes(app):
             db.session.rollback()
             return jsonify({'success': False, 'error': '服务器内部错误'}), 500
 
+def _resolve_upload_project(project_id, project_name, current_user):
+    """
+    查找上传目标项目并检查上传权限
+
+    Returns:
+        tuple: (项目, None) 或 (None, 错误响应)
+    """
+    # 优先使用project_id，如果没有则使用project_name（向后兼容）
+    if project_id:
+        try:
+            project_id = int(project_id)
+        except (TypeError, ValueError):
+            return None, (jsonify({'success': False, 'error': '项目ID格式错误'}), 400)
+        project = Project.query.get(project_id)
+        current_app.logger.info(f"使用project_id查找项目: {project_id}, 找到项目: {project.name if project else 'None'}")
+        if not project:
+            return None, (jsonify({'success': False, 'error': '项目不存在'}), 404)
+    elif project_name:
+        # 向后兼容：使用项目名称查找
+        project = Project.query.filter_by(name=project_name).first()
+        current_app.logger.info(f"使用project_name查找项目: {project_name}, 找到项目ID: {project.id if project else 'None'}")
+        if not project:
+            return None, (jsonify({'success': False, 'error': '项目不存在'}), 404)
+    else:
+        return None, (jsonify({'success': False, 'error': '缺少项目信息'}), 400)
+
+    # 检查用户是否有权限向此项目上传文档
+    if current_user.role != UserRole.ADMIN:
+        if (project.created_by != current_user.id and
+            project.assigned_to != current_user.id):
+            return None, (jsonify({'error': '您没有权限向此项目上传文档'}), 403)
+
+    return project, None
+
+def _build_upload_path(project, original_filename):
+    """生成上传文件在项目文件夹中的保存路径（uploads/{folder_uuid}/{uuid}_{文件名}）"""
+    # 生成安全的文件名
+    filename = secure_filename(original_filename)
+
+    # 如果secure_filename过滤掉了所有字符（比如中文文件名），使用原始扩展名
+    if not filename or '.' not in filename:
+        # 提取原始扩展名
+        if '.' in original_filename:
+            ext = original_filename.rsplit('.', 1)[1]
+            filename = f"document.{ext}"
+        else:
+            filename = "document"
+
+    unique_filename = f"{uuid.uuid4().hex}_{filename}"
+
+    # 确保上传目录存在 - 使用项目的folder_uuid创建子目录
+    upload_folder = current_app.config.get('UPLOAD_FOLDER', 'uploads')
+    project_folder = os.path.join(upload_folder, project.folder_uuid)
+
+    # 创建项目文件夹（如果不存在）
+    os.makedirs(project_folder, exist_ok=True)
+
+    return os.path.join(project_folder, unique_filename)
+
+def _discard_uncommitted_upload(stored_upload):
+    """
+    上传失败时删除已生成但没有提交文档记录的文件（文档记录已提交后的失败不删除）
+
+    Args:
+        stored_upload: (项目文件路径, 内容哈希, 是否新建了内容文件)，文件尚未生成时为None
+    """
+    if not stored_upload:
+        return
+    file_path, source_hash, blob_created = stored_upload
+    try:
+        if Document.query.filter_by(file_path=file_path).first() is not None:
+            return
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.warning(f"检查上传文档记录失败，保留文件: {file_path}, {e}")
+        return
+    from services.blob_store import blob_store
+    blob_store.discard(source_hash, file_path, blob_created)
+
+def _create_uploaded_document(app, project, current_user, original_filename, document_name, label,
+                              file_path, file_size, source_hash, mime_type):
+    """
+    为已保存的上传文件创建文档记录并提交文档处理（普通上传和分片上传共用）
+
+    Returns:
+        dict: 上传接口的响应数据
+    """
+    # 先获取文件类型（使用原始文件名）
+    file_type = get_file_type(original_filename)
+
+    # 处理label参数
+    document_label = None
+    if label:
+        try:
+            from db_models import DocumentLabel, DOCUMENT_LABEL_NAMES
+            # 直接将前端传来的英文值转换为枚举
+            if hasattr(DocumentLabel, label):
+                document_label = getattr(DocumentLabel, label)
+                current_app.logger.info(f"找到文档标签: {label} -> {document_label}")
+            else:
+                # 如果传来的是中文，通过映射找到对应的枚举
+                for enum_item in DocumentLabel:
+                    if DOCUMENT_LABEL_NAMES.get(enum_item) == label:
+                        document_label = enum_item
+                        current_app.logger.info(f"通过中文标签找到枚举: {label} -> {document_label}")
+                        break
+                if not document_label:
+                    current_app.logger.warning(f"未找到匹配的文档标签: {label}")
+        except Exception as e:
+            current_app.logger.warning(f"处理文档标签失败: {e}")
+    
+    # 如果有label，修改document_name添加中文前缀
+    final_document_name = document_name
+    if document_label:
+        from db_models import DOCUMENT_LABEL_NAMES
+        chinese_label = DOCUMENT_LABEL_NAMES.get(document_label)
+        if chinese_label:
+            label_prefix = chinese_label + "_"
+            # 检查是否已经有前缀了（避免重复添加）
+            if not document_name.startswith(label_prefix):
+                final_document_name = label_prefix + document_name
+            current_app.logger.info(f"添加中文标签前缀: {chinese_label} -> {final_document_name}")
+        else:
+            current_app.logger.warning(f"无法找到标签的中文名称: {document_label}")
+    
+    # 创建文档记录 - 初始状态为UPLOADING
+    document = Document(
+        name=final_document_name,  # 使用添加了label前缀的文件名
+        original_filename=original_filename,  # 使用原始文件名
+        file_path=file_path,
+        file_size=file_size,
+        file_type=file_type,
+        mime_type=mime_type,
+        project_id=project.id,
+        status=DocumentStatus.UPLOADING,  # 初始状态为上传中
+        progress=0,
+        upload_by=current_user.id,  # 使用当前用户ID
+        label=document_label,  # 添加label字段
+        source_hash=source_hash,
+        blob_hash=source_hash
+    )
+    
+    db.session.add(document)
+    db.session.commit()
+    
+    # 记录日志
+    log_action(
+        user_id=document.upload_by,
+        action='document_upload_start',
+        resource_type='document',
+        resource_id=document.id,
+        details=f'开始上传文档: {document.name}'
+    )
+    
+    # 先返回上传完成状态的文档信息
+    upload_response = {
+        'success': True,
+        'data': {
+            'id': document.id,
+            'name': document.name,
+            'project': project.name,
+            'project_id': project.id,  # 添加项目ID
+            'type': document.file_type,  # 直接使用数据库中的原始值
+            'size': document.format_file_size(),
+            'status': 'uploading',
+            'uploadTime': document.created_at.strftime('%Y-%m-%d %H:%M'),
+            'progress': 0
+        },
+        'message': '文档上传开始'
+    }
+    
+    # 记录上传完成日志
+    log_action(
+        user_id=document.upload_by,
+        action='document_upload_complete',
+        resource_type='document',
+        resource_id=document.id,
+        details=f'文档上传完成: {document.name}'
+    )
+    
+    # 触发文档处理
+    from services.document_processor import document_processor
+    
+    # 保存文档ID和项目名，避免会话问题
+    doc_id = document.id
+    project_name_for_log = project.name
+    
+    # 检查是否为md文件
+    if file_type == 'markdown':
+        # md文件直接处理
+        def process_md_file():
+            """处理md文件"""
+            try:
+                with app.app_context():
+                    current_app.logger.info(f"开始处理md文件: {doc_id}")
+                    success = document_processor.process_markdown_file(doc_id)
+                    
+                    if success:
+                        current_app.logger.info(f"md文件处理完成: {doc_id}")
+                        # 知识库创建和上传由document_processor处理，这里不再重复调用
+                        
+                        # 记录活动日志
+                        try:
+                            from services.stats_service import ActivityLogger
+                            doc = Document.query.get(doc_id)
+                            if doc:
+                                user = User.query.get(doc.upload_by)
+                                user_name = user.full_name if user else 'Unknown'
+                                ActivityLogger.log_document_uploaded(
+                                    doc.id, doc.name, project_name_for_log, doc.upload_by, user_name
+                                )
+                        except Exception as e:
+                            current_app.logger.warning(f"记录活动日志失败: {e}")
+                    else:
+                        current_app.logger.error(f"md文件处理失败: {doc_id}")
+                        
+            except Exception as e:
+                current_app.logger.error(f"md文件处理异常: {e}")
+        
+        # 提交到文档处理执行器处理md文件
+        document_processor.submit_document_task(doc_id, process_md_file, app)
+    elif file_type == 'word':
+        # Word文件处理
+        def process_word_file():
+            """处理Word文件"""
+            try:
+                with app.app_context():
+                    current_app.logger.info(f"开始处理Word文件: {doc_id}")
+                    success = document_processor.process_word_file(doc_id)
+                    
+                    if success:
+                        current_app.logger.info(f"Word文件处理完成: {doc_id}")
+                        # 知识库创建和上传由document_processor处理，这里不再重复调用
+                        
+                        # 记录活动日志
+                        try:
+                            from services.stats_service import ActivityLogger
+                            doc = Document.query.get(doc_id)
+                            if doc:
+                                user = User.query.get(doc.upload_by)
+                                user_name = user.username if user else 'Unknown'
+                                ActivityLogger.log_document_uploaded(
+                                    doc.id, doc.name, project_name_for_log, doc.upload_by, user_name
+                                )
+                        except Exception as e:
+                            current_app.logger.warning(f"记录活动日志失败: {e}")
+                    else:
+                        current_app.logger.error(f"Word文件处理失败: {doc_id}")
+                        
+            except Exception as e:
+                current_app.logger.error(f"Word文件处理异常: {e}")
+        
+        # 提交到文档处理执行器处理Word文件
+        document_processor.submit_document_task(doc_id, process_word_file, app)
+    else:
+        # 非md和Word文件，使用外部API处理
+        def start_document_processing():
+            """启动文档处理"""
+            try:
+                with app.app_context():
+                    current_app.logger.info(f"开始文档处理: {doc_id}")
+                    success = document_processor.process_document(doc_id)
+                    
+                    if success:
+                        current_app.logger.info(f"文档处理完成: {doc_id}")
+                        # 知识库创建和上传由document_processor处理，这里不再重复调用
+                        
+                        # 记录活动日志
+                        try:
+                            from services.stats_service import ActivityLogger
+                            doc = Document.query.get(doc_id)
+                            if doc:
+                                user = User.query.get(doc.upload_by)
+                                user_name = user.username if user else 'Unknown'
+                                ActivityLogger.log_document_uploaded(
+                                    doc.id, doc.name, project_name_for_log, doc.upload_by, user_name
+                                )
+                        except Exception as e:
+                            current_app.logger.warning(f"记录活动日志失败: {e}")
+                    else:
+                        current_app.logger.error(f"文档处理失败: {doc_id}")
+                        
+            except Exception as e:
+                current_app.logger.error(f"文档处理异常: {e}")
+        
+        # 提交到文档处理执行器启动文档处理
+        document_processor.submit_document_task(doc_id, start_document_processing, app)
+    
+
+    return upload_response
+
 def _check_and_create_knowledge_base(doc_id, project_name):
     """
     检查并创建知识库
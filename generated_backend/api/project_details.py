@@ -106,6 +106,8 @@ def register_project_detail_routes(app):
             # 获取查询参数
             limit = request.args.get('limit', 50, type=int)
             offset = request.args.get('offset', 0, type=int)
+            cursor = request.args.get('cursor', '')
+            with_total = request.args.get('with_total', '') in ('1', 'true')
             status = request.args.get('status')  # 可选的状态过滤
             
             # 构建查询
@@ -115,24 +117,29 @@ def register_project_detail_routes(app):
             if status:
                 query = query.filter(ProjectTimeline.status == status)
             
-            # 按事件日期降序排列
-            query = query.order_by(desc(ProjectTimeline.event_date))
-            
-            # 分页
-            timeline_events = query.offset(offset).limit(limit).all()
-            total_count = query.count()
+            # 按 (事件日期, id) 降序游标分页，总数默认为估算值
+            from dao.pagination import paginate_query, InvalidCursorError
+            try:
+                result = paginate_query(
+                    query, ProjectTimeline.event_date, ProjectTimeline.id, limit,
+                    cursor=cursor, offset=offset, with_total=with_total
+                )
+            except InvalidCursorError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
             
             # 转换为字典格式
-            data = [event.to_dict() for event in timeline_events]
+            data = [event.to_dict() for event in result['items']]
             
             return jsonify({
                 'success': True,
                 'data': data,
                 'pagination': {
-                    'total': total_count,
+                    'total': result['total'],
+                    'total_exact': result['total_exact'],
                     'limit': limit,
-                    'offset': offset,
-                    'has_more': offset + limit < total_count
+                    'offset': 0 if cursor else offset,
+                    'has_more': result['has_more'],
+                    'next_cursor': result['next_cursor']
                 }
             })
             
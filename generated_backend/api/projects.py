@@ -21,9 +21,11 @@ def register_project_routes(app):
     def get_projects():
         """获取项目列表"""
         try:
-            # 获取查询参数
+            # 获取查询参数（传 cursor 时按游标翻页，page 参数保留兼容）
             page = request.args.get('page', 1, type=int)
             limit = request.args.get('limit', 20, type=int)
+            cursor = request.args.get('cursor', '')
+            with_total = request.args.get('with_total', '') in ('1', 'true')
             search = request.args.get('search', '')
             project_type = request.args.get('type', '')
             status = request.args.get('status', '')
@@ -71,33 +73,31 @@ def register_project_routes(app):
                     # 如果转换失败，记录日志但不过滤
                     current_app.logger.warning(f"Invalid project status: {status}")
 
-            # 分页
-            total = query.count()
-            projects = query.order_by(Project.updated_at.desc()).offset((page - 1) * limit).limit(limit).all()
+            # 按 (updated_at, id) 游标分页，总数默认为估算值
+            from dao.pagination import paginate_query, pagination_headers, InvalidCursorError
+            try:
+                result = paginate_query(
+                    query, Project.updated_at, Project.id, limit,
+                    cursor=cursor, offset=(page - 1) * limit, with_total=with_total
+                )
+            except InvalidCursorError as e:
+                return jsonify({'error': str(e)}), 400
+            projects = result['items']
+
+            # 一次查询统计本页所有项目的文档数量（非管理员只统计有权限访问的文档）
+            from services.stats_aggregator import StatsAggregator
+            document_counts = StatsAggregator.project_document_counts(
+                [project.id for project in projects], user=current_user
+            )
 
             # 转换为字典列表，使用模型的to_dict方法确保包含所有字段
-            projects_data = []
-            for project in projects:
-                project_dict = project.to_dict()
-                
-                # 根据用户权限重新计算文档数量
-                if current_user.role != UserRole.ADMIN:
-                    # 非管理员只能看到自己上传的文档或有权限访问的文档
-                    accessible_docs_count = Document.query.filter(
-                        Document.project_id == project.id
-                    ).filter(
-                        or_(
-                            Document.upload_by == current_user.id,
-                            project.created_by == current_user.id,
-                            project.assigned_to == current_user.id
-                        )
-                    ).count()
-                    project_dict['documents'] = accessible_docs_count
-                
-                projects_data.append(project_dict)
-
-            # 直接返回项目数组，与mock格式完全一致
-            return jsonify(projects_data)
+            projects_data = [
+                project.to_dict(document_count=document_counts[project.id])
+                for project in projects
+            ]
+
+            # 直接返回项目数组，与mock格式完全一致；下一页游标和总数通过响应头返回
+            return jsonify(projects_data), 200, pagination_headers(result)
 
         except Exception as e:
             current_app.logger.error(f"获取项目列表失败: {e}")
@@ -338,6 +338,14 @@ def register_project_routes(app):
             # 跟踪删除过程中的警告信息（仅用于后续步骤）
             warnings = []
 
+            # 项目文档引用的文件内容，删除后只检查这些内容是否还被引用
+            blob_hashes = [
+                blob_hash for (blob_hash,) in db.session.query(Document.blob_hash).filter(
+                    Document.project_id == project.id,
+                    Document.blob_hash.isnot(None)
+                ).distinct()
+            ]
+
             # 删除项目相关的所有文档文件
             try:
                 from services.document_processor import document_processor
@@ -359,10 +367,23 @@ def register_project_routes(app):
                 current_app.logger.warning(f"删除项目报告文件失败: {report_error}")
                 # 继续删除操作，不因为报告文件删除失败而中断
 
+            # 删除项目上传会话的临时文件（会话记录随项目级联删除，之后无法再按会话清理）
+            try:
+                from services.chunked_upload_service import chunked_upload_service
+                chunked_upload_service.remove_project_part_files(project.id)
+            except Exception as upload_error:
+                error_detail = f"上传临时文件删除失败: {str(upload_error)}"
+                warnings.append(error_detail)
+                current_app.logger.warning(f"删除项目上传临时文件失败: {upload_error}")
+
             # 删除数据库记录（依赖级联删除）
             db.session.delete(project)
             db.session.commit()
 
+            # 删除不再被任何文档引用的文件内容
+            from services.blob_store import blob_store
+            blob_store.purge_unreferenced(blob_hashes)
+
             current_app.logger.info(f"项目删除成功: {project_name}")
 
             # 构建响应消息
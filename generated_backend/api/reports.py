@@ -5,6 +5,7 @@
 import os
 import time
 import json
+import hashlib
 import requests
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
@@ -20,18 +21,25 @@ from websocket_handlers import (
 from db_models import Project, AnalysisReport, ReportType, ReportStatus, ProjectStatus
 
 # 导入PDF转换服务
-from services.pdf_converter import convert_report_to_pdf, is_pdf_conversion_available
-from services.md_to_pdf_converter import MarkdownToPDFConverter
+from services.pdf_converter import is_pdf_conversion_available
 from services.markdown_postprocessor import process_markdown_content
+from services.markdown_engine import IncrementalMarkdownProcessor
+from services.stream_buffer import ChunkBuffer
+from services.report_render_cache import report_render_cache
+from services.report_artifact_service import report_artifact_service
+from services.pdf_render_pool import pdf_render_pool, PDFRenderBusyError
+from services.http_client import http_client
+from services.knowledge_base_service import knowledge_base_service
 from database import db
 
 # 导入认证装饰器
 from api.auth import token_required
 
-# 全局变量：跟踪正在进行的工作流
-import threading
-active_workflows = {}  # {project_id: {'workflow_run_id': str, 'stop_flag': bool, 'thread': Thread}}
-workflow_lock = threading.Lock()
+# 跨worker跟踪正在进行的工作流（所属worker、task_id、停止标志、心跳）
+from services.workflow_registry import workflow_registry
+
+# 报告生成任务队列（Web请求只负责入队）
+from services.report_job_queue import report_job_queue, ReportJobAdmissionError, start_embedded_report_worker
 
 # 导入配置（如果需要的话）
 # from config import Config
@@ -100,45 +108,12 @@ def delete_non_project_files(dataset_id, project_id):
         
         current_app.logger.info(f"项目 {project_id} 共有 {len(project_documents)} 个文档，文件id集合大小: {len(project_file_ids)}")
         
-        # 获取知识库中的所有文档
-        RAG_API_BASE_URL = current_app.config.get('RAG_API_BASE_URL')
-        RAG_API_KEY = current_app.config.get('RAG_API_KEY')
-        
-        list_url = f"{RAG_API_BASE_URL}/api/v1/datasets/{dataset_id}/documents"
-        headers = {"Authorization": f"Bearer {RAG_API_KEY}"}
-        params = {"page_size": 100}
-        
-        list_res = requests.get(list_url, headers=headers, params=params, timeout=30)
-        list_res.raise_for_status()
-        list_res_json = list_res.json()
-        
-        if list_res_json.get("code") != 0:
-            raise Exception(f"查询文档列表失败: {list_res_json.get('message')}")
-        
-        docs = list_res_json.get("data", {}).get("docs", [])
-        
-        # 筛选出非项目文件并删除
-        deleted_count = 0
-        for doc in docs:
-            doc_id = doc.get("id")
-            doc_name = doc.get("name", "")
-            
-            # 检查文件名是否在项目文件名集合中
-            if doc_id not in project_file_ids:
-                # 删除非项目文件
-                delete_url = f"{RAG_API_BASE_URL}/api/v1/datasets/{dataset_id}/documents"
-                delete_data = {"ids": [doc_id]}
-                delete_res = requests.delete(delete_url, headers=headers, json=delete_data, timeout=30)
-                
-                if delete_res.status_code == 200:
-                    delete_res_json = delete_res.json()
-                    if delete_res_json.get("code") == 0:
-                        current_app.logger.info(f"成功删除非项目文件: {doc_name} (ID: {doc_id})")
-                        deleted_count += 1
-                    else:
-                        current_app.logger.error(f"删除非项目文件失败: {doc_name} (ID: {doc_id}), 错误: {delete_res_json.get('message')}")
-                else:
-                    current_app.logger.error(f"删除非项目文件请求失败: {doc_name} (ID: {doc_id}), 状态码: {delete_res.status_code}")
+        # 分页获取知识库中的全部文档，筛选出非项目文件后批量删除
+        docs = knowledge_base_service.list_dataset_documents(dataset_id)
+        stray_ids = [doc.get("id") for doc in docs if doc.get("id") not in project_file_ids]
+        if stray_ids:
+            current_app.logger.info(f"知识库 {dataset_id} 中有 {len(stray_ids)} 个非项目文件待删除")
+        deleted_count = knowledge_base_service.delete_dataset_documents(dataset_id, stray_ids) if stray_ids else 0
         
         current_app.logger.info(f"共删除 {deleted_count} 个非项目文件")
         return True
@@ -155,22 +130,8 @@ def check_parsing_status(dataset_id, project_id=None):
         if project_id:
             delete_non_project_files(dataset_id, project_id)
         
-        # 真实检查：获取文档列表并检查解析状态
-        RAG_API_BASE_URL = current_app.config.get('RAG_API_BASE_URL')
-        RAG_API_KEY = current_app.config.get('RAG_API_KEY')
-
-        list_url = f"{RAG_API_BASE_URL}/api/v1/datasets/{dataset_id}/documents"
-        headers = {"Authorization": f"Bearer {RAG_API_KEY}"}
-        params = {"page_size": 100}
-
-        list_res = requests.get(list_url, headers=headers, params=params, timeout=30)
-        list_res.raise_for_status()
-        list_res_json = list_res.json()
-
-        if list_res_json.get("code") != 0:
-            raise Exception(f"查询文档列表失败: {list_res_json.get('message')}")
-
-        docs = list_res_json.get("data", {}).get("docs", [])
+        # 真实检查：获取全部文档并检查解析状态（与上面的清理共用同一次列表查询）
+        docs = knowledge_base_service.list_dataset_documents(dataset_id)
         return all(doc.get("progress", 0.0) >= 1.0 for doc in docs)
 
     except Exception as e:
@@ -178,6 +139,32 @@ def check_parsing_status(dataset_id, project_id=None):
         return False
 
 
+def _schedule_report_prerender(project_id, file_path):
+    """报告保存后提交HTML/PDF后台预渲染任务"""
+    try:
+        app = current_app._get_current_object()
+        report_artifact_service.schedule_prerender(app, project_id, file_path)
+    except Exception as e:
+        current_app.logger.warning(f"提交报告预渲染任务失败: {e}")
+
+
+def _conditional_json(payload, etag):
+    """
+    返回带ETag的JSON响应，客户端If-None-Match命中时直接返回304
+
+    Args:
+        payload: 响应数据
+        etag: 响应ETag（不含引号）
+    """
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(payload)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
 def register_report_routes(app):
     """注册报告相关路由"""
 
@@ -219,20 +206,19 @@ def register_report_routes(app):
                 
                 # 检查报告状态，如果正在生成则检查是否真的有活跃工作流
                 if project.report_status == ReportStatus.GENERATING:
-                    # 检查是否真的有活跃的工作流
-                    with workflow_lock:
-                        if project_id in active_workflows:
-                            return jsonify({"success": False, "error": "报告正在生成中，请稍后再试"}), 400
-                        else:
-                            # 没有活跃工作流，重置状态
-                            current_app.logger.info(f"项目 {project_id} 状态为GENERATING但没有活跃工作流，重置状态")
-                            project.report_status = ReportStatus.NOT_GENERATED
-                            try:
-                                db.session.commit()
-                                current_app.logger.info("已重置项目状态为NOT_GENERATED")
-                            except Exception as e:
-                                current_app.logger.error(f"重置项目状态失败: {str(e)}")
-                                db.session.rollback()
+                    # 检查是否真的有活跃的工作流（任意worker）
+                    if workflow_registry.is_active(project_id):
+                        return jsonify({"success": False, "error": "报告正在生成中，请稍后再试"}), 400
+                    else:
+                        # 没有活跃工作流（或所属worker心跳已过期），重置状态
+                        current_app.logger.info(f"项目 {project_id} 状态为GENERATING但没有活跃工作流，重置状态")
+                        project.report_status = ReportStatus.NOT_GENERATED
+                        try:
+                            db.session.commit()
+                            current_app.logger.info("已重置项目状态为NOT_GENERATED")
+                        except Exception as e:
+                            current_app.logger.error(f"重置项目状态失败: {str(e)}")
+                            db.session.rollback()
 
                 # 检查报告状态和文件是否存在
                 if project.report_status == ReportStatus.GENERATED:
@@ -289,14 +275,15 @@ def register_report_routes(app):
                                 "继续完善系统功能，确保生产环境的稳定性。\n"
                             ]
 
-                            report_content = ""
+                            report_buffer = ChunkBuffer()
                             for i, chunk in enumerate(content_chunks):
-                                report_content += chunk
+                                report_buffer.append(chunk)
                                 # 发送内容块事件
                                 yield f"data: {json.dumps({'event': 'content', 'content': chunk, 'workflow_run_id': workflow_run_id}, ensure_ascii=False)}\n\n"
                                 # 模拟处理时间
                                 time.sleep(0.5)
 
+                            report_content = report_buffer.getvalue()
                             events = ['workflow_started', 'content_generated', 'workflow_finished']
                         else:
                             # 调用真实的流式报告生成API
@@ -345,15 +332,14 @@ def register_report_routes(app):
             if not project:
                 return jsonify({"success": False, "error": "项目不存在"}), 404
 
-            # 获取task_id并调用Dify停止接口
+            # 设置停止标志并通知所属worker，获取task_id调用Dify停止接口
             task_id = None
-            with workflow_lock:
-                if project_id in active_workflows:
-                    active_workflows[project_id]['stop_flag'] = True
-                    task_id = active_workflows[project_id].get('task_id')
-                    current_app.logger.info(f"设置项目 {project_id} 的停止标志，task_id: {task_id}")
-                else:
-                    current_app.logger.warning(f"项目 {project_id} 没有活跃的工作流")
+            workflow_info = workflow_registry.request_stop(project_id)
+            if workflow_info:
+                task_id = workflow_info.get('task_id')
+                current_app.logger.info(f"设置项目 {project_id} 的停止标志，task_id: {task_id}，所属worker: {workflow_info.get('owner')}")
+            else:
+                current_app.logger.warning(f"项目 {project_id} 没有活跃的工作流")
 
             # 如果有task_id，调用Dify的停止接口
             if task_id:
@@ -366,6 +352,11 @@ def register_report_routes(app):
                 except Exception as stop_error:
                     current_app.logger.error(f"调用Dify停止接口异常: {stop_error}")
 
+            # 取消尚未开始执行（或等待重试）的任务
+            cancelled_jobs = report_job_queue.cancel_project_jobs(project_id)
+            if cancelled_jobs:
+                current_app.logger.info(f"已取消项目 {project_id} 排队中的 {cancelled_jobs} 个报告生成任务")
+
             # 更新项目报告状态为已取消（使用NOT_GENERATED作为取消状态）
             project.report_status = ReportStatus.NOT_GENERATED
             db.session.commit()
@@ -399,17 +390,18 @@ def register_report_routes(app):
             if not project:
                 return jsonify({"success": False, "error": "项目不存在"}), 404
 
-            # 检查是否有活跃的工作流
-            with workflow_lock:
-                is_generating = project_id in active_workflows
-                workflow_info = active_workflows.get(project_id, {})
+            # 检查是否有活跃的工作流或排队中的任务
+            workflow_info = workflow_registry.get(project_id)
+            pending_job = report_job_queue.get_active_job(project_id)
+            is_generating = workflow_info is not None or pending_job is not None
 
             return jsonify({
                 "success": True,
                 "data": {
                     "isGenerating": is_generating,
                     "reportStatus": project.report_status.value if project.report_status else "not_generated",
-                    "workflowInfo": workflow_info if is_generating else None
+                    "workflowInfo": workflow_info if is_generating else None,
+                    "job": pending_job.to_dict() if pending_job else None
                 }
             })
 
@@ -417,6 +409,37 @@ def register_report_routes(app):
             current_app.logger.error(f"获取生成状态失败: {str(e)}")
             return jsonify({"success": False, "error": str(e)}), 500
 
+    @app.route('/api/report-jobs/<int:job_id>', methods=['GET'])
+    @token_required
+    def get_report_job(job_id):
+        """
+        查询报告生成任务状态
+        """
+        try:
+            job = report_job_queue.get_job(job_id)
+            if not job:
+                return jsonify({"success": False, "error": "任务不存在"}), 404
+
+            job_data = job.to_dict()
+            job_data['queue_position'] = report_job_queue.get_queue_position(job)
+            return jsonify({"success": True, "data": job_data})
+
+        except Exception as e:
+            current_app.logger.error(f"获取报告生成任务失败: {str(e)}")
+            return jsonify({"success": False, "error": str(e)}), 500
+
+    @app.route('/api/report-jobs/stats', methods=['GET'])
+    @token_required
+    def get_report_job_stats():
+        """
+        获取报告生成任务队列统计
+        """
+        try:
+            return jsonify({"success": True, "data": report_job_queue.get_stats()})
+        except Exception as e:
+            current_app.logger.error(f"获取报告生成队列统计失败: {str(e)}")
+            return jsonify({"success": False, "error": str(e)}), 500
+
     @app.route('/api/generate_report', methods=['POST'])
     def generate_report():
         """
@@ -469,20 +492,19 @@ def register_report_routes(app):
 
             # 检查报告状态，如果正在生成则检查是否真的有活跃工作流
             if project.report_status == ReportStatus.GENERATING:
-                # 检查是否真的有活跃的工作流
-                with workflow_lock:
-                    if project_id in active_workflows:
-                        return jsonify({"success": False, "error": "报告正在生成中，请稍后再试"}), 400
-                    else:
-                        # 没有活跃工作流，重置状态
-                        current_app.logger.info(f"项目 {project_id} 状态为GENERATING但没有活跃工作流，重置状态")
-                        project.report_status = ReportStatus.NOT_GENERATED
-                        try:
-                            db.session.commit()
-                            current_app.logger.info("已重置项目状态为NOT_GENERATED")
-                        except Exception as e:
-                            current_app.logger.error(f"重置项目状态失败: {str(e)}")
-                            db.session.rollback()
+                # 检查是否真的有活跃的工作流（任意worker）
+                if workflow_registry.is_active(project_id) or report_job_queue.get_active_job(project_id):
+                    return jsonify({"success": False, "error": "报告正在生成中，请稍后再试"}), 400
+                else:
+                    # 没有活跃工作流（或所属worker心跳已过期），重置状态
+                    current_app.logger.info(f"项目 {project_id} 状态为GENERATING但没有活跃工作流，重置状态")
+                    project.report_status = ReportStatus.NOT_GENERATED
+                    try:
+                        db.session.commit()
+                        current_app.logger.info("已重置项目状态为NOT_GENERATED")
+                    except Exception as e:
+                        current_app.logger.error(f"重置项目状态失败: {str(e)}")
+                        db.session.rollback()
 
             # 检查报告状态和文件是否存在
             if project.report_status == ReportStatus.GENERATED:
@@ -519,7 +541,17 @@ def register_report_routes(app):
                     current_app.logger.error(f"项目 {project_id} 文档解析尚未完成")
                     return jsonify({"success": False, "error": "文档解析尚未完成，请等待解析完成后再生成报告"}), 400
 
-            # 更新项目状态为处理中，报告状态为正在生成
+            # 写入报告生成任务队列，由报告生成worker按并发上限和租户公平调度执行
+            try:
+                job = report_job_queue.enqueue(project, dataset_id, company_name, knowledge_name)
+            except ReportJobAdmissionError as admission_error:
+                db.session.rollback()
+                current_app.logger.warning(f"项目 {project_id} 报告生成任务被拒绝: {admission_error}")
+                response = jsonify({"success": False, "error": str(admission_error)})
+                response.headers['Retry-After'] = str(admission_error.retry_after)
+                return response, 429
+
+            # 更新项目状态为处理中，报告状态为正在生成（与任务在同一事务中提交）
             # 保持当前进度或重新计算进度，不重置为0
             current_progress = project.progress or calculate_project_progress(project_id)
             project.status = ProjectStatus.PROCESSING
@@ -530,47 +562,16 @@ def register_report_routes(app):
             # 项目WebSocket房间ID
             project_room_id = f"project_{project_id}"
 
-            # 获取当前应用实例
-            app = current_app._get_current_object()
-
-            # 异步执行报告生成
-            def async_generate_report():
-                """异步执行报告生成的函数"""
-                # 在异步线程中设置应用上下文
-                with app.app_context():
-                    try:
-                        # 通过WebSocket广播开始事件
-                        socketio = current_app.socketio
-                        broadcast_workflow_event(socketio, project_room_id, 'generation_started', {
-                            'company_name': company_name,
-                            'knowledge_name': knowledge_name,
-                            'project_id': project_id,
-                            'message': '开始生成报告...'
-                        })
-
-                        # 执行实际的报告生成逻辑
-                        _execute_report_generation(dataset_id, company_name, knowledge_name, project_id, project_room_id)
-
-                    except Exception as e:
-                        current_app.logger.error(f"异步报告生成失败: {str(e)}")
-                        # 广播错误事件
-                        try:
-                            socketio = current_app.socketio
-                            broadcast_workflow_error(socketio, project_room_id, f"报告生成失败: {str(e)}", project_id)
-                        except Exception as ws_error:
-                            current_app.logger.error(f"WebSocket错误广播失败: {ws_error}")
-
-            # 启动异步任务
-            import threading
-            thread = threading.Thread(target=async_generate_report)
-            thread.daemon = True
-            thread.start()
+            # 嵌入模式下确保当前进程的worker已启动（独立worker模式下不做任何事）
+            start_embedded_report_worker(current_app._get_current_object())
 
             # 立即返回，让前端连接WebSocket
             return jsonify({
                 "success": True,
                 "message": "报告生成已开始",
                 "project_id": project_id,
+                "job_id": job.id,
+                "queue_position": report_job_queue.get_queue_position(job),
                 "websocket_room": project_room_id,
                 "status": "generating"
             })
@@ -579,159 +580,6 @@ def register_report_routes(app):
             current_app.logger.error(f"生成报告失败: {str(e)}")
             return jsonify({"success": False, "error": f"生成报告失败: {str(e)}"}), 500
 
-    def _execute_report_generation(dataset_id, company_name, knowledge_name, project_id, project_room_id):
-        """执行实际的报告生成逻辑"""
-        try:
-            socketio = current_app.socketio
-
-            # 注：解析状态检查已在主函数中完成，这里不再重复检查
-
-            # 对于测试数据，返回模拟响应
-            if dataset_id and dataset_id.startswith('test_'):
-                # 模拟工作流ID和内容
-                mock_workflow_id = f"workflow_{int(time.time())}"
-                mock_content = f"""# {company_name} 征信分析报告
-
-## 公司基本信息
-- 公司名称：{company_name}
-- 知识库：{knowledge_name}
-- 生成时间：{time.strftime('%Y-%m-%d %H:%M:%S')}
-
-## 征信评估
-这是一个测试报告，用于验证系统功能。
-
-### 主要发现
-1. 测试数据处理正常
-2. API接口工作正常
-3. 报告生成流程完整
-
-### 建议
-继续完善系统功能，确保生产环境的稳定性。
-"""
-
-                # 不使用假的模拟事件，保持空列表
-                mock_events = []
-
-                # 存储到全局变量
-                workflow_events[mock_workflow_id] = {
-                    'events': mock_events,
-                    'content': mock_content,
-                    'metadata': {'test': True, 'company': company_name},
-                    'timestamp': time.time(),
-                    'company_name': company_name
-                }
-
-                # 对测试内容进行markdown后处理
-                try:
-                    current_app.logger.info("开始对测试报告内容进行后处理...")
-                    processed_mock_content = process_markdown_content(mock_content)
-                    current_app.logger.info("测试报告内容后处理完成")
-                    mock_content = processed_mock_content
-                except Exception as e:
-                    current_app.logger.error(f"测试报告内容后处理失败: {e}")
-                    # 即使后处理失败，仍然使用原始内容
-
-                # 保存报告到本地文件
-                file_path = save_report_to_file(company_name, mock_content, project_id)
-                current_app.logger.info(f"测试报告已保存到: {file_path}")
-
-                # 保存报告路径到数据库
-                if project_id:
-                    try:
-                        project = Project.query.get(project_id)
-                        if project:
-                            project.report_path = file_path
-                            db.session.commit()
-                            current_app.logger.info(f"报告路径已保存到数据库: {file_path}")
-                    except Exception as db_error:
-                        current_app.logger.error(f"保存报告路径到数据库失败: {db_error}")
-
-                # 通过WebSocket广播测试报告完成
-                broadcast_workflow_complete(socketio, project_room_id, mock_content, project_id)
-                return
-
-            # 真实的流式调用报告生成API
-            try:
-                # 注册活跃工作流
-                with workflow_lock:
-                    active_workflows[project_id] = {
-                        'workflow_run_id': f"workflow_{int(time.time())}",
-                        'stop_flag': False
-                    }
-
-                # 调用流式报告生成API，传递项目房间ID用于WebSocket广播
-                report_content, workflow_run_id, events = call_report_generation_api_streaming(company_name, knowledge_name, project_id, project_room_id)
-
-                # 保存报告到本地文件
-                file_path = save_report_to_file(company_name, report_content, project_id)
-
-                # 保存报告路径到数据库
-                if project_id:
-                    try:
-                        project = Project.query.get(project_id)
-                        if project:
-                            project.report_path = file_path
-                            db.session.commit()
-                            current_app.logger.info(f"报告路径已保存到数据库: {file_path}")
-                    except Exception as db_error:
-                        current_app.logger.error(f"保存报告路径到数据库失败: {db_error}")
-
-                current_app.logger.info(f"报告生成成功，已保存到: {file_path}")
-
-                # 更新项目报告状态为已生成
-                project = Project.query.get(project_id)
-                if project:
-                    project.report_status = ReportStatus.GENERATED
-                    project.report_path = file_path
-                    # 报告生成完成，更新项目状态和进度
-                    project.status = ProjectStatus.COMPLETED
-                    project.progress = 100
-                    db.session.commit()
-
-                # 通过WebSocket广播报告完成
-                broadcast_workflow_complete(socketio, project_room_id, report_content)
-
-                # 清理活跃工作流
-                with workflow_lock:
-                    if project_id in active_workflows:
-                        del active_workflows[project_id]
-
-            except Exception as api_error:
-                current_app.logger.error(f"调用外部API失败: {str(api_error)}")
-
-                # 清理活跃工作流
-                with workflow_lock:
-                    if project_id in active_workflows:
-                        del active_workflows[project_id]
-
-                # 通过WebSocket广播错误事件
-                try:
-                    socketio = current_app.socketio
-                    # 这里我们没有workflow_run_id，所以使用一个临时ID
-                    temp_workflow_id = f"error_{int(time.time())}"
-                    broadcast_workflow_error(socketio, temp_workflow_id, f"调用外部API失败: {str(api_error)}")
-                except Exception as ws_error:
-                    current_app.logger.error(f"WebSocket错误广播失败: {ws_error}")
-
-                raise Exception(f"调用外部API失败: {str(api_error)}")
-
-        except Exception as e:
-            current_app.logger.error(f"生成报告失败: {str(e)}")
-
-            # 重置项目报告状态为未生成
-            try:
-                project = Project.query.get(project_id)
-                if project:
-                    project.report_status = ReportStatus.NOT_GENERATED
-                    db.session.commit()
-            except Exception as db_error:
-                current_app.logger.error(f"重置报告状态失败: {str(db_error)}")
-
-            # 通过WebSocket广播错误
-            broadcast_workflow_error(socketio, project_room_id, f"生成报告失败: {str(e)}")
-
-
-
     @app.route('/api/projects/<int:project_id>/report', methods=['GET'])
     def get_project_report(project_id):
         """
@@ -795,11 +643,8 @@ def register_report_routes(app):
 
             # 读取报告内容
             try:
-                with open(project.report_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-
                 # 检查内容是否为空
-                if not content or content.strip() == "":
+                if os.path.getsize(project.report_path) == 0:
                     return jsonify({
                         "success": False,
                         "error": "该项目尚未生成报告",
@@ -808,22 +653,32 @@ def register_report_routes(app):
                         "report_status": report_status
                     }), 404
 
-                # 对内容进行后处理，修复表格等格式问题
-                try:
-                    processed_content = process_markdown_content(content)
-                    current_app.logger.info("报告内容后处理完成")
-                except Exception as process_error:
-                    current_app.logger.warning(f"报告内容后处理失败，使用原内容: {process_error}")
-                    processed_content = content
+                # ETag同时包含项目名称和报告状态，项目信息变化时客户端能拿到新数据
+                project_digest = hashlib.md5(f"{company_name}|{report_status}".encode('utf-8')).hexdigest()[:8]
+                etag = f"{report_render_cache.get_etag(project.report_path, 'markdown')}-{project_digest}"
+                if request.if_none_match.contains(etag):
+                    return _conditional_json(None, etag)
 
-                return jsonify({
+                # 对内容进行后处理，修复表格等格式问题（命中缓存时直接读取后处理结果）
+                processed_content, _ = report_render_cache.get_processed_markdown(project.report_path)
+
+                if not processed_content or processed_content.strip() == "":
+                    return jsonify({
+                        "success": False,
+                        "error": "该项目尚未生成报告",
+                        "has_report": False,
+                        "company_name": company_name,
+                        "report_status": report_status
+                    }), 404
+
+                return _conditional_json({
                     "success": True,
                     "content": processed_content,
                     "file_path": project.report_path,
                     "company_name": company_name,
                     "has_report": True,
                     "report_status": report_status
-                })
+                }, etag)
             except Exception as read_error:
                 current_app.logger.error(f"读取报告文件失败: {read_error}")
                 return jsonify({
@@ -869,8 +724,9 @@ def register_report_routes(app):
             # 保存报告路径用于删除文件
             report_path = project.report_path
 
-            # 删除报告文件
+            # 删除报告文件及其渲染缓存
             if report_path and os.path.exists(report_path):
+                report_render_cache.invalidate(report_path)
                 try:
                     os.remove(report_path)
                     current_app.logger.info(f"已删除报告文件: {report_path}")
@@ -880,6 +736,7 @@ def register_report_routes(app):
 
             # 清空数据库中的报告路径，并重置项目状态和进度
             try:
+                report_artifact_service.delete_artifacts(project)
                 project.report_status = ReportStatus.NOT_GENERATED
                 project.report_path = None
 
@@ -890,14 +747,16 @@ def register_report_routes(app):
                 project_progress = calculate_project_progress(project_id)
                 project.progress = project_progress
 
+                # 取消排队中的报告生成任务
+                report_job_queue.cancel_project_jobs(project_id)
+
                 db.session.commit()
                 current_app.logger.info(f"已清空项目 {project_id} 的报告路径，重置状态为COLLECTING，进度为{project_progress}%")
 
                 # 🔧 修复：清空活跃工作流和流式内容
-                with workflow_lock:
-                    if project_id in active_workflows:
-                        del active_workflows[project_id]
-                        current_app.logger.info(f"已清空项目 {project_id} 的活跃工作流")
+                if workflow_registry.is_active(project_id):
+                    workflow_registry.unregister(project_id, force=True)
+                    current_app.logger.info(f"已清空项目 {project_id} 的活跃工作流")
 
                 # 🔧 修复：广播清空事件，让前端清空流式内容
                 try:
@@ -969,12 +828,11 @@ def register_report_routes(app):
                     "error": "报告文件不存在"
                 }), 404
 
-            # 读取Markdown报告内容
+            # 读取后处理后的Markdown报告内容
             try:
-                with open(project.report_path, 'r', encoding='utf-8') as f:
-                    md_content = f.read()
+                processed_md_content, _ = report_render_cache.get_processed_markdown(project.report_path)
 
-                if not md_content or md_content.strip() == "":
+                if not processed_md_content or processed_md_content.strip() == "":
                     return jsonify({
                         "success": False,
                         "error": "报告内容为空"
@@ -987,24 +845,31 @@ def register_report_routes(app):
                     "error": "读取报告文件失败"
                 }), 500
 
-            # 转换为PDF
-            current_app.logger.info(f"开始将项目 {project_id} 的报告转换为PDF")
+            # 转换为PDF，同一份报告只渲染一次，之后直接使用缓存
+            current_app.logger.info(f"开始获取项目 {project_id} 的PDF报告")
 
-            # 对Markdown内容进行后处理
             try:
-                processed_md_content = process_markdown_content(md_content)
-                current_app.logger.info("PDF转换前的Markdown后处理完成")
-            except Exception as process_error:
-                current_app.logger.warning(f"Markdown后处理失败，使用原内容: {process_error}")
-                processed_md_content = md_content
-
-            success, message, pdf_path = convert_report_to_pdf(processed_md_content, project.name, project.report_path)
-
-            if not success or not pdf_path:
-                current_app.logger.error(f"PDF转换失败: {message}")
+                if report_artifact_service.is_artifact_fresh(project.report_path, project.report_pdf_path):
+                    # 使用报告生成后预渲染好的PDF
+                    pdf_path = project.report_pdf_path
+                    etag = report_render_cache.get_etag(project.report_path, 'pdf')
+                else:
+                    pdf_path, etag = report_render_cache.get_pdf_path(project.report_path)
+            except PDFRenderBusyError as busy_error:
+                current_app.logger.warning(f"PDF渲染队列已满: 项目 {project_id}")
+                response = jsonify({
+                    "success": False,
+                    "error": "PDF生成任务繁忙，请稍后重试",
+                    "retry_after": busy_error.retry_after
+                })
+                response.status_code = 429
+                response.headers['Retry-After'] = str(busy_error.retry_after)
+                return response
+            except Exception as convert_error:
+                current_app.logger.error(f"PDF转换失败: {convert_error}")
                 return jsonify({
                     "success": False,
-                    "error": f"PDF转换失败: {message}"
+                    "error": f"PDF转换失败: {str(convert_error)}"
                 }), 500
 
             try:
@@ -1015,41 +880,23 @@ def register_report_routes(app):
 
                 download_filename = f"{safe_company_name}_征信报告.pdf"
 
-                current_app.logger.info(f"PDF转换成功，开始下载: {pdf_path}")
+                current_app.logger.info(f"开始下载PDF: {pdf_path}")
 
-                # 发送文件并在发送后清理临时文件
-                def cleanup_after_send():
-                    """发送完成后清理临时文件"""
-                    try:
-                        if os.path.exists(pdf_path):
-                            os.unlink(pdf_path)
-                            current_app.logger.info(f"已清理临时PDF文件: {pdf_path}")
-                    except Exception as cleanup_error:
-                        current_app.logger.warning(f"清理临时PDF文件失败: {cleanup_error}")
-
-                # 使用Flask的send_file发送PDF文件
+                # 使用Flask的send_file发送PDF文件，If-None-Match命中时返回304
                 response = send_file(
                     pdf_path,
                     as_attachment=True,
                     download_name=download_filename,
-                    mimetype='application/pdf'
+                    mimetype='application/pdf',
+                    etag=etag,
+                    conditional=True
                 )
-
-                # 注册清理函数（在响应发送后执行）
-                @response.call_on_close
-                def cleanup_temp_file():
-                    cleanup_after_send()
+                response.headers['Cache-Control'] = 'private, no-cache'
 
                 return response
 
             except Exception as send_error:
                 current_app.logger.error(f"发送PDF文件失败: {send_error}")
-                # 清理临时文件
-                try:
-                    if pdf_path and os.path.exists(pdf_path):
-                        os.unlink(pdf_path)
-                except:
-                    pass
                 return jsonify({
                     "success": False,
                     "error": "发送PDF文件失败"
@@ -1062,6 +909,17 @@ def register_report_routes(app):
                 "error": f"下载PDF报告失败: {str(e)}"
             }), 500
 
+    @app.route('/api/reports/pdf-render/stats', methods=['GET'])
+    @token_required
+    def get_pdf_render_stats():
+        """
+        获取PDF渲染进程池的运行指标（队列深度、渲染耗时等）
+        """
+        return jsonify({
+            "success": True,
+            "data": pdf_render_pool.get_stats()
+        })
+
     @app.route('/api/projects/<int:project_id>/report/html', methods=['GET'])
     @token_required
     def get_project_report_html(project_id):
@@ -1101,12 +959,11 @@ def register_report_routes(app):
                     "error": "该项目尚未生成报告"
                 }), 404
 
-            # 读取Markdown报告内容
+            # 读取后处理后的Markdown报告内容
             try:
-                with open(project.report_path, 'r', encoding='utf-8') as f:
-                    md_content = f.read()
+                processed_md_content, _ = report_render_cache.get_processed_markdown(project.report_path)
 
-                if not md_content or md_content.strip() == "":
+                if not processed_md_content or processed_md_content.strip() == "":
                     return jsonify({
                         "success": False,
                         "error": "该项目尚未生成报告"
@@ -1119,27 +976,23 @@ def register_report_routes(app):
                     "error": "该项目尚未生成报告"
                 }), 404
 
-            # 转换为HTML
+            # 转换为HTML（命中缓存时直接读取已渲染的HTML）
             try:
-                # 对Markdown内容进行后处理
-                try:
-                    processed_md_content = process_markdown_content(md_content)
-                    current_app.logger.info("HTML转换前的Markdown后处理完成")
-                except Exception as process_error:
-                    current_app.logger.warning(f"Markdown后处理失败，使用原内容: {process_error}")
-                    processed_md_content = md_content
+                project_digest = hashlib.md5(project.name.encode('utf-8')).hexdigest()[:8]
+                etag = f"{report_render_cache.get_etag(project.report_path, 'html')}-{project_digest}"
+                if request.if_none_match.contains(etag):
+                    return _conditional_json(None, etag)
 
-                converter = MarkdownToPDFConverter()
-                html_content = converter.convert_markdown_to_html(processed_md_content, project.report_path)
+                html_content, _ = report_render_cache.get_html(project.report_path)
 
-                return jsonify({
+                return _conditional_json({
                     "success": True,
                     "data": {
                         "html_content": html_content,
                         "company_name": project.name,
                         "file_path": project.report_path
                     }
-                })
+                }, etag)
 
             except Exception as convert_error:
                 current_app.logger.error(f"Markdown转HTML失败: {convert_error}")
@@ -1190,12 +1043,11 @@ def register_report_routes(app):
                     "error": "报告文件不存在"
                 }), 404
 
-            # 读取Markdown报告内容
+            # 读取后处理后的Markdown报告内容
             try:
-                with open(project.report_path, 'r', encoding='utf-8') as f:
-                    md_content = f.read()
+                processed_md_content, _ = report_render_cache.get_processed_markdown(project.report_path)
 
-                if not md_content or md_content.strip() == "":
+                if not processed_md_content or processed_md_content.strip() == "":
                     return jsonify({
                         "success": False,
                         "error": "报告内容为空"
@@ -1208,35 +1060,27 @@ def register_report_routes(app):
                     "error": "读取报告文件失败"
                 }), 500
 
-            # 转换为HTML
+            # 转换为HTML（命中缓存时直接发送已渲染的HTML文件）
             try:
-                # 对Markdown内容进行后处理
-                try:
-                    processed_md_content = process_markdown_content(md_content)
-                    current_app.logger.info("HTML下载前的Markdown后处理完成")
-                except Exception as process_error:
-                    current_app.logger.warning(f"Markdown后处理失败，使用原内容: {process_error}")
-                    processed_md_content = md_content
-
-                converter = MarkdownToPDFConverter()
-                html_content = converter.convert_markdown_to_html(processed_md_content, project.report_path)
-
-                # 创建HTML文件的响应
-                from flask import Response
+                if report_artifact_service.is_artifact_fresh(project.report_path, project.report_html_path):
+                    # 使用报告生成后预渲染好的HTML
+                    html_path = project.report_html_path
+                    etag = report_render_cache.get_etag(project.report_path, 'html')
+                else:
+                    html_path, etag = report_render_cache.get_html_path(project.report_path)
 
-                # 设置文件名，使用URL编码处理中文
-                import urllib.parse
+                # 设置文件名，send_file会按RFC 5987处理中文文件名
                 filename = f"{project.name}_征信报告.html"
-                encoded_filename = urllib.parse.quote(filename.encode('utf-8'))
 
-                response = Response(
-                    html_content,
+                response = send_file(
+                    html_path,
+                    as_attachment=True,
+                    download_name=filename,
                     mimetype='text/html',
-                    headers={
-                        'Content-Disposition': f'attachment; filename*=UTF-8\'\'{encoded_filename}',
-                        'Content-Type': 'text/html; charset=utf-8'
-                    }
+                    etag=etag,
+                    conditional=True
                 )
+                response.headers['Cache-Control'] = 'private, no-cache'
 
                 current_app.logger.info(f"HTML报告下载成功: 项目 {project_id}")
                 return response
@@ -1255,6 +1099,204 @@ def register_report_routes(app):
                 "error": f"下载HTML报告失败: {str(e)}"
             }), 500
 
+
+def _execute_report_generation(dataset_id, company_name, knowledge_name, project_id, project_room_id, final_attempt=True):
+    """
+    执行实际的报告生成逻辑
+
+    Args:
+        final_attempt: 是否为任务的最后一次执行，失败时只有最后一次才重置报告状态并广播错误，
+            否则广播重试事件，由任务队列按退避时间重新调度
+
+    Raises:
+        Exception: 报告生成失败
+    """
+    socketio = current_app.socketio
+    try:
+        # 注：解析状态检查已在主函数中完成，这里不再重复检查
+
+        # 对于测试数据，返回模拟响应
+        if dataset_id and dataset_id.startswith('test_'):
+            # 模拟工作流ID和内容
+            mock_workflow_id = f"workflow_{int(time.time())}"
+            mock_content = f"""# {company_name} 征信分析报告
+
+## 公司基本信息
+- 公司名称：{company_name}
+- 知识库：{knowledge_name}
+- 生成时间：{time.strftime('%Y-%m-%d %H:%M:%S')}
+
+## 征信评估
+这是一个测试报告，用于验证系统功能。
+
+### 主要发现
+1. 测试数据处理正常
+2. API接口工作正常
+3. 报告生成流程完整
+
+### 建议
+继续完善系统功能，确保生产环境的稳定性。
+"""
+
+            # 不使用假的模拟事件，保持空列表
+            mock_events = []
+
+            # 存储到全局变量
+            workflow_events[mock_workflow_id] = {
+                'events': mock_events,
+                'content': mock_content,
+                'metadata': {'test': True, 'company': company_name},
+                'timestamp': time.time(),
+                'company_name': company_name
+            }
+
+            # 对测试内容进行markdown后处理
+            try:
+                current_app.logger.info("开始对测试报告内容进行后处理...")
+                processed_mock_content = process_markdown_content(mock_content)
+                current_app.logger.info("测试报告内容后处理完成")
+                mock_content = processed_mock_content
+            except Exception as e:
+                current_app.logger.error(f"测试报告内容后处理失败: {e}")
+                # 即使后处理失败，仍然使用原始内容
+
+            # 保存报告到本地文件
+            file_path = save_report_to_file(company_name, mock_content, project_id)
+            current_app.logger.info(f"测试报告已保存到: {file_path}")
+
+            # 保存报告路径到数据库
+            if project_id:
+                try:
+                    project = Project.query.get(project_id)
+                    if project:
+                        project.report_path = file_path
+                        project.report_html_path = None
+                        project.report_pdf_path = None
+                        db.session.commit()
+                        current_app.logger.info(f"报告路径已保存到数据库: {file_path}")
+                        _schedule_report_prerender(project_id, file_path)
+                except Exception as db_error:
+                    current_app.logger.error(f"保存报告路径到数据库失败: {db_error}")
+
+            # 通过WebSocket广播测试报告完成
+            broadcast_workflow_complete(socketio, project_room_id, mock_content, project_id)
+            return
+
+        # 注册活跃工作流，项目已由其他worker在生成时不重复调用工作流；
+        # 抛出异常使任务按失败处理（退避重试，最后一次时重置报告状态并广播错误）
+        if workflow_registry.register(project_id, f"workflow_{int(time.time())}") is None:
+            raise Exception(f"项目 {project_id} 已有正在进行的报告生成")
+
+        # 真实的流式调用报告生成API
+        try:
+
+            # 调用流式报告生成API，传递项目房间ID用于WebSocket广播
+            report_content, workflow_run_id, events = call_report_generation_api_streaming(company_name, knowledge_name, project_id, project_room_id)
+
+            # 保存报告到本地文件
+            file_path = save_report_to_file(company_name, report_content, project_id)
+
+            # 保存报告路径到数据库
+            if project_id:
+                try:
+                    project = Project.query.get(project_id)
+                    if project:
+                        project.report_path = file_path
+                        db.session.commit()
+                        current_app.logger.info(f"报告路径已保存到数据库: {file_path}")
+                except Exception as db_error:
+                    current_app.logger.error(f"保存报告路径到数据库失败: {db_error}")
+
+            current_app.logger.info(f"报告生成成功，已保存到: {file_path}")
+
+            # 更新项目报告状态为已生成
+            project = Project.query.get(project_id)
+            if project:
+                project.report_status = ReportStatus.GENERATED
+                project.report_path = file_path
+                project.report_html_path = None
+                project.report_pdf_path = None
+                # 报告生成完成，更新项目状态和进度
+                project.status = ProjectStatus.COMPLETED
+                project.progress = 100
+                db.session.commit()
+
+                # 后台预渲染HTML和PDF，下载时直接发送文件
+                _schedule_report_prerender(project_id, file_path)
+
+            # 通过WebSocket广播报告完成
+            broadcast_workflow_complete(socketio, project_room_id, report_content)
+
+            # 清理活跃工作流
+            workflow_registry.unregister(project_id)
+
+        except Exception as api_error:
+            current_app.logger.error(f"调用外部API失败: {str(api_error)}")
+
+            # 清理活跃工作流
+            workflow_registry.unregister(project_id)
+
+            # 通过WebSocket广播错误事件
+            try:
+                socketio = current_app.socketio
+                # 这里我们没有workflow_run_id，所以使用一个临时ID
+                temp_workflow_id = f"error_{int(time.time())}"
+                broadcast_workflow_error(socketio, temp_workflow_id, f"调用外部API失败: {str(api_error)}")
+            except Exception as ws_error:
+                current_app.logger.error(f"WebSocket错误广播失败: {ws_error}")
+
+            raise Exception(f"调用外部API失败: {str(api_error)}")
+
+    except Exception as e:
+        current_app.logger.error(f"生成报告失败: {str(e)}")
+
+        if not final_attempt:
+            # 保持GENERATING状态，等待任务队列重试
+            broadcast_workflow_event(socketio, project_room_id, 'generation_retrying', {
+                'project_id': project_id,
+                'message': f"报告生成失败，稍后自动重试: {str(e)}"
+            })
+            raise
+
+        # 重置项目报告状态为未生成
+        try:
+            project = Project.query.get(project_id)
+            if project:
+                project.report_status = ReportStatus.NOT_GENERATED
+                db.session.commit()
+        except Exception as db_error:
+            db.session.rollback()
+            current_app.logger.error(f"重置报告状态失败: {str(db_error)}")
+
+        # 通过WebSocket广播错误
+        broadcast_workflow_error(socketio, project_room_id, f"生成报告失败: {str(e)}")
+        raise
+
+
+def execute_report_job(job, final_attempt=True):
+    """
+    执行报告生成任务（由报告生成worker调用，需要在应用上下文中）
+
+    Args:
+        job: ReportJob
+        final_attempt: 是否为最后一次执行
+
+    Raises:
+        Exception: 报告生成失败
+    """
+    project_room_id = f"project_{job.project_id}"
+    broadcast_workflow_event(current_app.socketio, project_room_id, 'generation_started', {
+        'company_name': job.company_name,
+        'knowledge_name': job.knowledge_name,
+        'project_id': job.project_id,
+        'job_id': job.id,
+        'attempt': job.attempts,
+        'message': '开始生成报告...'
+    })
+    _execute_report_generation(job.dataset_id, job.company_name, job.knowledge_name,
+                               job.project_id, project_room_id, final_attempt=final_attempt)
+
+
 def call_report_generation_api_streaming(company_name, knowledge_name, project_id=None, project_room_id=None):
     """调用报告生成API - 流式模式"""
     try:
@@ -1283,7 +1325,7 @@ def call_report_generation_api_streaming(company_name, knowledge_name, project_i
         if current_app.config.get('DEBUG', False):
             current_app.logger.info(f"请求数据: {request_data}")
 
-        response = requests.post(
+        response = http_client.post(
             report_api_url,
             headers={
                 'Authorization': f'Bearer {api_key}',
@@ -1291,7 +1333,8 @@ def call_report_generation_api_streaming(company_name, knowledge_name, project_i
             },
             json=request_data,
             stream=True,  # 启用流式响应
-            timeout=1200  # 10分钟超时
+            timeout=1200,  # 10分钟超时
+            endpoint='dify.workflow_stream'
         )
 
         # 检查HTTP状态码
@@ -1382,14 +1425,15 @@ def call_report_generation_api(company_name, knowledge_name, project_id=None):
 
         current_app.logger.info(f"请求数据: {request_data}")
 
-        response = requests.post(
+        response = http_client.post(
             report_api_url,
             headers={
                 'Authorization': f'Bearer {api_key}',
                 'Content-Type': 'application/json'
             },
             json=request_data,
-            timeout=1200  # 10分钟超时
+            timeout=1200,  # 10分钟超时
+            endpoint='dify.workflow'
         )
 
         # 检查HTTP状态码
@@ -1459,6 +1503,29 @@ def call_report_generation_api(company_name, knowledge_name, project_id=None):
 
 
 
+def _broadcast_processed_blocks(project_room_id, blocks):
+    """
+    广播已完成后处理的内容块，块之间以空行分隔，前端按顺序拼接即为完整报告
+
+    Args:
+        project_room_id: 项目房间ID
+        blocks: 后处理后的内容块列表
+    """
+    if not project_room_id or not blocks:
+        return
+    try:
+        socketio = current_app.socketio
+        for block in blocks:
+            broadcast_workflow_content(socketio, project_room_id, block + '\n\n')
+        # 简化日志：只在调试模式下打印广播详情
+        if current_app.config.get('DEBUG', False):
+            print(f"已广播{len(blocks)}个内容块到房间 {project_room_id}")
+    except Exception as e:
+        # 简化日志：只在调试模式下打印WebSocket广播失败详情
+        if current_app.config.get('DEBUG', False):
+            print(f"WebSocket内容广播失败: {e}")
+
+
 def parse_dify_streaming_response(response, company_name="", project_id=None, project_room_id=None):
     """
     解析 Dify 流式响应，实时存储事件到数据库
@@ -1472,7 +1539,9 @@ def parse_dify_streaming_response(response, company_name="", project_id=None, pr
         tuple: (workflow_run_id, full_content, metadata, events, task_id)
     """
     workflow_run_id = f"workflow_{int(time.time())}"  # 新接口没有workflow_run_id， ourselves generate one
-    full_content = ""
+    # 流式后处理：内容块到达时即对已完整的表格、标题、列表等做后处理，流结束时只需处理剩余部分
+    # （保存报告时 save_report_to_file 还会再做一次全文后处理，见该函数说明）
+    markdown_processor = IncrementalMarkdownProcessor()
     metadata = {}
     events = []
     sequence_number = 0
@@ -1484,11 +1553,10 @@ def parse_dify_streaming_response(response, company_name="", project_id=None, pr
         if not line:
             continue
 
-        # 检查停止标志
-        with workflow_lock:
-            if project_id in active_workflows and active_workflows[project_id].get('stop_flag', False):
-                print(f"检测到停止标志，终止项目 {project_id} 的流式处理")
-                break
+        # 检查停止标志（停止请求可能来自其他worker）
+        if workflow_registry.should_stop(project_id):
+            print(f"检测到停止标志，终止项目 {project_id} 的流式处理")
+            break
 
         # 解析 SSE 格式数据
         line_str = line.decode('utf-8') if isinstance(line, bytes) else line
@@ -1517,13 +1585,11 @@ def parse_dify_streaming_response(response, company_name="", project_id=None, pr
                     if task_id is None or task_id != current_task_id:
                         task_id = current_task_id
                         print(f"🔑 提取到task_id: {task_id}")
-                        # 保存task_id到活跃工作流中
-                        with workflow_lock:
-                            if project_id in active_workflows:
-                                active_workflows[project_id]['task_id'] = task_id
-                                print(f"✅ 已保存task_id到项目 {project_id}")
-                            else:
-                                print(f"⚠️ 项目 {project_id} 不在活跃工作流中")
+                        # 保存task_id到工作流注册表，停止请求落在其他worker时也能调用停止接口
+                        if workflow_registry.set_task_id(project_id, task_id):
+                            print(f"✅ 已保存task_id到项目 {project_id}")
+                        else:
+                            print(f"⚠️ 项目 {project_id} 不在活跃工作流中")
 
                 # 提取生成的内容
                 content_chunk = None
@@ -1532,30 +1598,18 @@ def parse_dify_streaming_response(response, company_name="", project_id=None, pr
                 elif 'message' in data:
                     content_chunk = data['message']
 
-                # 如果找到内容块，累积到完整内容并广播
+                # 如果找到内容块，交给流式后处理器，并广播已完成后处理的块
                 # 注意：不使用strip()检查，因为空格和换行符也是重要的格式信息
                 if content_chunk is not None and content_chunk != "":
-                    # 累积内容
-                    full_content += content_chunk
+                    completed_blocks = markdown_processor.feed(content_chunk)
                     # 简化日志：每累积1000个字符才打印一次长度
                     # 简化日志：只在调试模式下打印累积内容信息
                     if current_app.config.get('DEBUG', False):
-                        if len(full_content) % 1000 < len(content_chunk):
-                            print(f"累积内容，当前总长度: {len(full_content)}")
+                        if markdown_processor.raw_length % 1000 < len(content_chunk):
+                            print(f"累积内容，当前总长度: {markdown_processor.raw_length}")
                         print(f"内容块详情: {repr(content_chunk[:100])}")
 
-                    # 通过WebSocket广播内容到项目房间
-                    try:
-                        socketio = current_app.socketio
-                        if project_room_id:
-                            broadcast_workflow_content(socketio, project_room_id, content_chunk)
-                            # 简化日志：只在调试模式下打印广播详情
-                            if current_app.config.get('DEBUG', False):
-                                print(f"已广播内容块到房间 {project_room_id}: {repr(content_chunk[:50])}")
-                    except Exception as e:
-                        # 简化日志：只在调试模式下打印WebSocket广播失败详情
-                        if current_app.config.get('DEBUG', False):
-                            print(f"WebSocket内容广播失败: {e}")
+                    _broadcast_processed_blocks(project_room_id, completed_blocks)
 
                 # 提取事件信息
                 if 'event' in data:
@@ -1611,6 +1665,11 @@ def parse_dify_streaming_response(response, company_name="", project_id=None, pr
                     print(f"JSON 解析错误: {e}, 原始数据: {data_str}")
                 continue
 
+    # 处理流结束时剩余的内容（被停止时同样保留已生成的部分）
+    # 完整内容只在此处拼接一次，完成广播、返回值和事件缓存共用同一个字符串
+    _broadcast_processed_blocks(project_room_id, markdown_processor.flush())
+    full_content = markdown_processor.get_content()
+
     # 流式解析完成，广播完成事件到项目房间
     try:
         socketio = current_app.socketio
@@ -1625,23 +1684,10 @@ def parse_dify_streaming_response(response, company_name="", project_id=None, pr
             print(f"WebSocket完成事件广播失败: {e}")
 
     # 清理活跃工作流（无论是正常完成还是被停止）
-    with workflow_lock:
-        if project_id in active_workflows:
-            del active_workflows[project_id]
-            # 简化日志：只在调试模式下打印清理信息
-            if current_app.config.get('DEBUG', False):
-                print(f"已清理项目 {project_id} 的活跃工作流")
-
-    # 对最终内容进行markdown后处理
-    if full_content:
-        try:
-            current_app.logger.info("开始对流式报告内容进行后处理...")
-            processed_content = process_markdown_content(full_content)
-            current_app.logger.info("流式报告内容后处理完成")
-            full_content = processed_content
-        except Exception as e:
-            current_app.logger.error(f"流式报告内容后处理失败: {e}")
-            # 即使后处理失败，仍然返回原始内容
+    workflow_registry.unregister(project_id)
+    # 简化日志：只在调试模式下打印清理信息
+    if current_app.config.get('DEBUG', False):
+        print(f"已清理项目 {project_id} 的活跃工作流")
 
     # 简化日志：只在调试模式下打印详细解析信息
     if current_app.config.get('DEBUG', False):
@@ -1653,9 +1699,15 @@ def parse_dify_streaming_response(response, company_name="", project_id=None, pr
 
 
 def save_report_to_file(company_name, content, project_id=None):
-    """保存报告内容到本地文件"""
+    """
+    保存报告内容到本地文件
+
+    写入前总是对全文再做一次后处理：流式生成和测试报告传入的是已经后处理过一次的内容，
+    后处理不是幂等的（再次处理可能继续修改表格、列表等格式），保留这一次全文处理使保存的报告
+    与此前"先后处理全文、保存时再处理一次"的结果一致
+    """
     try:
-        # 对内容进行后处理，修复表格等格式问题
+        # 对内容进行第二次全文后处理，修复表格等格式问题
         current_app.logger.info("开始对报告内容进行后处理...")
         processed_content = process_markdown_content(content)
         current_app.logger.info("报告内容后处理完成")
@@ -1730,11 +1782,12 @@ def call_dify_stop_api(task_id):
         current_app.logger.info(f"调用Dify停止接口: {stop_url}")
 
         # 发送停止请求
-        response = requests.post(
+        response = http_client.post(
             stop_url,
             headers=headers,
             json=payload,
-            timeout=10
+            timeout=10,
+            endpoint='dify.stop'
         )
 
         if response.status_code == 200:
@@ -13,6 +13,8 @@ from db_models import (
     Project, Document, User, SystemLog, ActivityLog, StatisticsHistory,
     ProjectType, ProjectStatus, RiskLevel, StatType
 )
+from services.stats_aggregator import StatsAggregator
+from services.stat_counters import stat_counter_service
 
 def generate_activity_title(log):
     """生成用户友好的活动标题"""
@@ -61,23 +63,20 @@ def calculate_relative_time(created_at):
 
 def get_current_realtime_stats():
     """获取当前实时统计数据"""
-    stats = {}
-
-    # 项目统计
-    stats['total_projects'] = Project.query.count()
-    stats['enterprise_projects'] = Project.query.filter_by(type=ProjectType.ENTERPRISE).count()
-    stats['individual_projects'] = Project.query.filter_by(type=ProjectType.INDIVIDUAL).count()
-
-    # 风险统计
-    stats['high_risk_projects'] = Project.query.filter_by(risk_level=RiskLevel.HIGH).count()
-    stats['medium_risk_projects'] = Project.query.filter_by(risk_level=RiskLevel.MEDIUM).count()
-    stats['low_risk_projects'] = Project.query.filter_by(risk_level=RiskLevel.LOW).count()
-
-    # 评分统计
-    avg_score_result = db.session.query(func.avg(Project.score)).scalar()
-    stats['average_score'] = round(float(avg_score_result), 1) if avg_score_result else 0
-
-    return stats
+    project_stats = stat_counter_service.get_values()
+
+    return {
+        # 项目统计
+        'total_projects': project_stats['total_projects'],
+        'enterprise_projects': project_stats['enterprise_projects'],
+        'individual_projects': project_stats['individual_projects'],
+        # 风险统计
+        'high_risk_projects': project_stats['high_risk_projects'],
+        'medium_risk_projects': project_stats['medium_risk_projects'],
+        'low_risk_projects': project_stats['low_risk_projects'],
+        # 评分统计
+        'average_score': project_stats['average_score']
+    }
 
 def register_stats_routes(app):
     """注册统计相关路由"""
@@ -86,62 +85,43 @@ def register_stats_routes(app):
     def get_dashboard_stats():
         """获取仪表板统计数据"""
         try:
-            # 项目统计
-            total_projects = Project.query.count()
-            completed_projects = Project.query.filter_by(status=ProjectStatus.COMPLETED).count()
-            processing_projects = Project.query.filter_by(status=ProjectStatus.PROCESSING).count()
-            collecting_projects = Project.query.filter_by(status=ProjectStatus.COLLECTING).count()
-            
+            # 按主键读取实时统计计数器
+            stats = stat_counter_service.get_values()
+
+            total_projects = stats['total_projects']
+            completed_projects = stats['completed_projects']
             completion_rate = (completed_projects / total_projects * 100) if total_projects > 0 else 0
-            
-            # 文档统计
-            total_documents = Document.query.count()
-            completed_documents = Document.query.filter_by(status='completed').count()
-            processing_documents = Document.query.filter_by(status='processing').count()
-            failed_documents = Document.query.filter_by(status='failed').count()
-            
+
+            total_documents = stats['total_documents']
+            completed_documents = stats['completed_documents']
             doc_completion_rate = (completed_documents / total_documents * 100) if total_documents > 0 else 0
-            
-            # 用户统计
-            total_users = User.query.count()
-            # 假设最近30天内有活动的用户为活跃用户
-            thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-            active_users = User.query.filter(User.last_login >= thirty_days_ago).count()
-            
-            # 风险分析统计
-            high_risk_projects = Project.query.filter_by(risk_level=RiskLevel.HIGH).count()
-            medium_risk_projects = Project.query.filter_by(risk_level=RiskLevel.MEDIUM).count()
-            low_risk_projects = Project.query.filter_by(risk_level=RiskLevel.LOW).count()
-            
-            # 平均评分
-            avg_score_result = db.session.query(func.avg(Project.score)).scalar()
-            average_score = round(float(avg_score_result), 1) if avg_score_result else 0
-            
+
             dashboard_stats = {
                 'projects': {
                     'total': total_projects,
                     'completed': completed_projects,
-                    'processing': processing_projects,
-                    'collecting': collecting_projects,
+                    'processing': stats['processing_projects'],
+                    'collecting': stats['collecting_projects'],
                     'completion_rate': round(completion_rate, 1)
                 },
                 'documents': {
                     'total': total_documents,
                     'completed': completed_documents,
-                    'processing': processing_documents,
-                    'failed': failed_documents,
+                    'processing': stats['processing_documents'],
+                    'failed': stats['failed_documents'],
                     'completion_rate': round(doc_completion_rate, 1)
                 },
                 'users': {
-                    'total': total_users,
-                    'active': active_users
+                    'total': stats['total_users'],
+                    # 最近30天内登录过的用户为活跃用户
+                    'active': stats['recently_active_users']
                 },
                 'risk_analysis': {
-                    'high_risk': high_risk_projects,
-                    'medium_risk': medium_risk_projects,
-                    'low_risk': low_risk_projects
+                    'high_risk': stats['high_risk_projects'],
+                    'medium_risk': stats['medium_risk_projects'],
+                    'low_risk': stats['low_risk_projects']
                 },
-                'average_score': average_score
+                'average_score': stats['average_score']
             }
             
             return jsonify({
@@ -264,50 +244,24 @@ def register_stats_routes(app):
     def get_project_distribution():
         """获取项目分布统计"""
         try:
-            # 按类型分布
-            type_distribution = {}
-            for project_type in ProjectType:
-                count = Project.query.filter_by(type=project_type).count()
-                type_distribution[project_type.value] = count
-            
-            # 按状态分布
-            status_distribution = {}
-            for project_status in ProjectStatus:
-                count = Project.query.filter_by(status=project_status).count()
-                status_distribution[project_status.value] = count
-            
-            # 按风险等级分布
-            risk_distribution = {}
-            for risk_level in RiskLevel:
-                count = Project.query.filter_by(risk_level=risk_level).count()
-                risk_distribution[risk_level.value] = count
-            
-            # 按评分区间分布
-            score_ranges = [
-                (0, 60, '低分'),
-                (60, 80, '中等'),
-                (80, 90, '良好'),
-                (90, 100, '优秀')
-            ]
-            
-            score_distribution = {}
-            for min_score, max_score, label in score_ranges:
-                count = Project.query.filter(
-                    and_(
-                        Project.score >= min_score,
-                        Project.score < max_score if max_score < 100 else Project.score <= max_score
-                    )
-                ).count()
-                score_distribution[label] = count
+            # 可选的评分区间边界，如 ?score_edges=0,60,80,90,100
+            score_edges = None
+            if request.args.get('score_edges'):
+                try:
+                    score_edges = [int(edge) for edge in request.args['score_edges'].split(',')]
+                except ValueError:
+                    score_edges = []
+                if len(score_edges) < 2 or any(low >= high for low, high in zip(score_edges, score_edges[1:])):
+                    return jsonify({
+                        'success': False,
+                        'error': '评分区间边界需为递增的整数列表'
+                    }), 400
+
+            distribution = StatsAggregator.cached_project_distribution(score_edges)
             
             return jsonify({
                 'success': True,
-                'data': {
-                    'type_distribution': type_distribution,
-                    'status_distribution': status_distribution,
-                    'risk_distribution': risk_distribution,
-                    'score_distribution': score_distribution
-                }
+                'data': distribution
             })
             
         except Exception as e:
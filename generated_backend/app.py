@@ -16,6 +16,7 @@ from config import Config
 from utils import setup_logging
 from database import init_db
 from websocket_handlers import register_websocket_handlers
+from api.auth import admin_required
 
 def test_database_connection(app):
     """测试MySQL数据库连接"""
@@ -38,7 +39,7 @@ app = Flask(__name__)
 app.config.from_object(Config)
 
 # 启用CORS支持 - 允许所有来源
-CORS(app, origins="*")
+CORS(app, origins="*", expose_headers=['X-Next-Cursor', 'X-Total-Count', 'X-Total-Count-Exact'])
 
 # 创建SocketIO实例 - 支持多worker模式
 redis_url = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
@@ -69,6 +70,10 @@ else:
 # 初始化数据库
 db = init_db(app)
 
+# 注册统计计数器维护事件（项目、文档、用户变更时在同一事务中更新计数器）
+from services.stat_counters import register_stat_counter_hooks
+register_stat_counter_hooks()
+
 # 测试数据库连接
 with app.app_context():
     test_database_connection(app)
@@ -119,6 +124,13 @@ def health_check():
             "timestamp": time.time()
         }), 503
 
+@app.route('/health/outbound', methods=['GET'])
+@admin_required
+def outbound_health_check():
+    """外部服务（RAGFlow、Dify、文档转换）的熔断状态和接口耗时分布（包含内部服务地址，仅管理员可访问）"""
+    from services.http_client import http_client
+    return jsonify(http_client.get_stats()), 200
+
 # 全局错误处理
 @app.errorhandler(404)
 def not_found(error):
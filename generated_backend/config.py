@@ -75,7 +75,12 @@ class Config:
 
     # 文件上传配置
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or 'uploads'
+    BLOB_STORE_FOLDER = os.environ.get('BLOB_STORE_FOLDER') or 'blobs'  # 按内容去重的上传文件存储，需与上传目录在同一文件系统才能硬链接
     MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 16MB
+    # 分片上传配置（单个分片需小于MAX_CONTENT_LENGTH）
+    UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))  # 8MB
+    UPLOAD_MAX_FILE_SIZE = int(os.environ.get('UPLOAD_MAX_FILE_SIZE', 1024 * 1024 * 1024))  # 1GB
+    UPLOAD_SESSION_TTL = int(os.environ.get('UPLOAD_SESSION_TTL', 86400))  # 未完成的上传保留1天
     ALLOWED_EXTENSIONS = {'pdf', 'doc', 'docx', 'xls','csv', 'xlsx', 'txt', 'jpg', 'jpeg', 'png', 'md'}
 
     # JWT配置
@@ -97,6 +102,26 @@ class Config:
     # 文档处理服务API配置
     DOCUMENT_PROCESS_API_URL = os.environ.get('DOCUMENT_PROCESS_API_URL', 'http://localhost:7860/api/process')
 
+    # 报告渲染缓存配置（后处理Markdown、HTML、PDF）
+    REPORT_RENDER_CACHE_DIR = os.environ.get('REPORT_RENDER_CACHE_DIR', os.path.join('output', '.render_cache'))
+    REPORT_RENDER_CACHE_MAX_BYTES = int(os.environ.get('REPORT_RENDER_CACHE_MAX_BYTES', 512 * 1024 * 1024))  # 512MB
+
+    # PDF渲染进程池配置（每个gunicorn worker各一个进程池，整机渲染进程数 = worker数 × PDF_RENDER_WORKERS，
+    # 默认4-8个worker时为4-8个WeasyPrint进程；同一报告在多个worker中同时请求时只渲染一次）
+    PDF_RENDER_WORKERS = int(os.environ.get('PDF_RENDER_WORKERS', 1))
+    PDF_RENDER_MAX_QUEUE = int(os.environ.get('PDF_RENDER_MAX_QUEUE', 8))
+    PDF_RENDER_TIMEOUT = int(os.environ.get('PDF_RENDER_TIMEOUT', 180))
+
+    # WebSocket内容广播合并配置：缓冲内容达到时间间隔或字节数时合并为一帧发送
+    WS_CONTENT_FLUSH_INTERVAL_MS = int(os.environ.get('WS_CONTENT_FLUSH_INTERVAL_MS', 200))
+    WS_CONTENT_FLUSH_BYTES = int(os.environ.get('WS_CONTENT_FLUSH_BYTES', 4096))
+
+    # WebSocket重连补发配置：每个工作流房间保留的最近帧数，工作流结束后保留的秒数，
+    # 以及未结束的房间多久没有新帧后过期（USE_REDIS_BROKER开启时帧保存在Redis中，各worker共享）
+    WS_REPLAY_BUFFER_FRAMES = int(os.environ.get('WS_REPLAY_BUFFER_FRAMES', 2000))
+    WS_REPLAY_RETENTION_SECONDS = int(os.environ.get('WS_REPLAY_RETENTION_SECONDS', 600))
+    WS_REPLAY_ACTIVE_TTL_SECONDS = int(os.environ.get('WS_REPLAY_ACTIVE_TTL_SECONDS', 3600))
+
 class DevelopmentConfig(Config):
     """开发环境配置"""
     DEBUG = True
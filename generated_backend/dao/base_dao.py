@@ -208,18 +208,29 @@ class BaseDAO:
         """
         return self.count(**filters) > 0
     
-    def paginate(self, page: int = 1, per_page: int = 20, **filters) -> Dict[str, Any]:
+    def paginate(self, page: int = 1, per_page: int = 20, cursor: Optional[str] = None,
+                 with_total: bool = False, **filters) -> Dict[str, Any]:
         """
         分页查询
         
+        按 (created_at, id) 倒序排列（模型没有 created_at 时按 id），传入游标时从游标位置继续读取，
+        否则按页码读取；总数默认为估算值
+        
         Args:
-            page: 页码
+            page: 页码（未传游标时使用）
             per_page: 每页数量
+            cursor: 上一页返回的 next_cursor
+            with_total: 是否计算精确总数
             **filters: 筛选条件
             
         Returns:
             分页结果字典
+            
+        Raises:
+            InvalidCursorError: 游标无效
         """
+        from dao.pagination import paginate_query
+        
         try:
             query = self.session.query(self.model_class)
             
@@ -227,35 +238,42 @@ class BaseDAO:
                 if hasattr(self.model_class, key):
                     query = query.filter(getattr(self.model_class, key) == value)
             
-            pagination = query.paginate(
-                page=page,
-                per_page=per_page,
-                error_out=False
+            id_column = self.model_class.id
+            sort_column = getattr(self.model_class, 'created_at', id_column)
+            result = paginate_query(
+                query, sort_column, id_column, per_page,
+                cursor=cursor, offset=(page - 1) * per_page, with_total=with_total
             )
+            total = result['total']
+            pages = (total + per_page - 1) // per_page if per_page else 0
             
             return {
-                'items': pagination.items,
-                'total': pagination.total,
-                'page': pagination.page,
-                'per_page': pagination.per_page,
-                'pages': pagination.pages,
-                'has_prev': pagination.has_prev,
-                'has_next': pagination.has_next,
-                'prev_num': pagination.prev_num,
-                'next_num': pagination.next_num
+                'items': result['items'],
+                'total': total,
+                'total_exact': result['total_exact'],
+                'page': page,
+                'per_page': per_page,
+                'pages': pages,
+                'has_prev': page > 1 and not cursor,
+                'has_next': result['has_more'],
+                'prev_num': page - 1 if page > 1 and not cursor else None,
+                'next_num': page + 1 if result['has_more'] else None,
+                'next_cursor': result['next_cursor']
             }
         except SQLAlchemyError as e:
             current_app.logger.error(f"分页查询失败: {e}")
             return {
                 'items': [],
                 'total': 0,
+                'total_exact': True,
                 'page': page,
                 'per_page': per_page,
                 'pages': 0,
                 'has_prev': False,
                 'has_next': False,
                 'prev_num': None,
-                'next_num': None
+                'next_num': None,
+                'next_cursor': None
             }
     
     def bulk_create(self, data_list: List[Dict[str, Any]]) -> List[T]:
@@ -0,0 +1,179 @@
+"""
+游标分页
+列表按 (排序列, id) 倒序排列，下一页从上一页最后一行的 (排序列, id) 之后继续读取，
+配合 (排序列, id) 复合索引，翻到任意深度都只读取一页的行（OFFSET 需要先扫描并丢弃前面所有行）；
+总数默认使用执行计划的估算值，精确总数需要显式请求
+"""
+
+import json
+import base64
+import binascii
+from datetime import date, datetime
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Query
+
+
+class InvalidCursorError(ValueError):
+    """分页游标无法解析或不属于当前列表"""
+
+
+def _table_name(sort_column) -> str:
+    """排序列所属的表名（不同表的同名列，如 users.created_at 与 documents.created_at，游标不能互用）"""
+    return sort_column.expression.table.name
+
+
+def encode_cursor(sort_column, sort_value, row_id: int) -> str:
+    """
+    生成不透明游标（URL安全的base64编码JSON）
+
+    Args:
+        sort_column: 排序列，游标中记录表名和列名，防止用于其他表或其他排序的列表
+        sort_value: 最后一行的排序列值
+        row_id: 最后一行的ID
+    """
+    if isinstance(sort_value, (datetime, date)):
+        sort_value = sort_value.isoformat()
+    payload = json.dumps({'t': _table_name(sort_column), 'k': sort_column.key, 'v': sort_value, 'id': row_id},
+                         separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(sort_column, cursor: str) -> Tuple[Any, int]:
+    """
+    解析游标
+
+    Returns:
+        tuple: (排序列值, ID)
+
+    Raises:
+        InvalidCursorError: 游标格式错误或表、排序列不一致
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        if payload['t'] != _table_name(sort_column) or payload['k'] != sort_column.key:
+            raise InvalidCursorError('分页游标与当前列表不匹配')
+        row_id = int(payload['id'])
+        value = payload['v']
+        python_type = sort_column.type.python_type
+        if python_type is datetime:
+            value = datetime.fromisoformat(value)
+        elif python_type is date:
+            value = date.fromisoformat(value)
+        return value, row_id
+    except InvalidCursorError:
+        raise
+    except (ValueError, TypeError, KeyError, UnicodeError, binascii.Error, NotImplementedError):
+        raise InvalidCursorError('分页游标无效')
+
+
+def estimate_count(query: Query) -> Tuple[int, bool]:
+    """
+    估算查询结果的行数
+
+    MySQL 上读取 EXPLAIN 中每张表的预估行数和过滤比例相乘得到估算值，不扫描数据；
+    其他数据库或估算失败时退回精确的 COUNT
+
+    Returns:
+        tuple: (行数, 是否精确)
+    """
+    query = query.order_by(None)
+    session = query.session
+    bind = session.get_bind()
+    if bind.dialect.name == 'mysql':
+        try:
+            compiled = query.statement.compile(dialect=bind.dialect, compile_kwargs={'render_postcompile': True})
+            rows = session.connection().exec_driver_sql('EXPLAIN ' + str(compiled), compiled.params).mappings().all()
+            estimate = 1.0
+            planned = False
+            for row in rows:
+                if row.get('rows') is None:
+                    continue
+                estimate *= float(row['rows']) * float(row.get('filtered') or 100) / 100
+                planned = True
+            if planned:
+                return int(round(estimate)), False
+        except Exception:
+            pass
+    return query.count(), True
+
+
+def paginate_query(query: Query, sort_column, id_column, limit: int, cursor: Optional[str] = None,
+                   offset: int = 0, with_total: bool = False) -> Dict[str, Any]:
+    """
+    按 (排序列, id) 倒序分页
+
+    传入游标时从游标位置之后读取（忽略 offset）；不传游标时按 offset 读取，兼容旧的页码参数，
+    第一页两种方式相同。每次多读一行判断是否还有下一页，不执行 COUNT
+
+    Args:
+        query: 已包含筛选条件的查询
+        sort_column: 排序列（如 Project.updated_at）
+        id_column: 主键列，排序列相同时按ID排序
+        limit: 每页数量
+        cursor: 上一页返回的 next_cursor
+        offset: 偏移量（未传游标时使用）
+        with_total: 是否计算精确总数，默认返回估算值
+
+    Returns:
+        dict: items、next_cursor（没有下一页时为None）、has_more、total、total_exact
+
+    Raises:
+        InvalidCursorError: 游标无效
+    """
+    limit = max(limit, 1)
+    page_query = query
+    if cursor:
+        sort_value, row_id = decode_cursor(sort_column, cursor)
+        offset = 0
+        # 等价于 (排序列, id) < (值, id)，拆开写让 MySQL 对复合索引使用范围扫描
+        page_query = page_query.filter(and_(
+            sort_column <= sort_value,
+            or_(sort_column < sort_value, id_column < row_id)
+        ))
+    else:
+        offset = max(offset, 0)
+
+    page_query = page_query.order_by(sort_column.desc(), id_column.desc())
+    if offset:
+        page_query = page_query.offset(offset)
+    rows = page_query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    items = rows[:limit]
+
+    next_cursor = None
+    if has_more:
+        last = items[-1]
+        next_cursor = encode_cursor(sort_column, getattr(last, sort_column.key), getattr(last, id_column.key))
+
+    if with_total:
+        total, total_exact = query.order_by(None).count(), True
+    elif not cursor and not has_more:
+        # 已读到最后一页，总数可以直接得出
+        total, total_exact = offset + len(items), True
+    else:
+        total, total_exact = estimate_count(query)
+        if not cursor:
+            # 估算值不应小于已经确定存在的行数
+            total = max(total, offset + len(items) + (1 if has_more else 0))
+
+    return {
+        'items': items,
+        'next_cursor': next_cursor,
+        'has_more': has_more,
+        'total': total,
+        'total_exact': total_exact
+    }
+
+
+def pagination_headers(page: Dict[str, Any]) -> Dict[str, str]:
+    """直接返回数组的列表接口通过响应头返回下一页游标和总数"""
+    headers = {
+        'X-Total-Count': str(page['total']),
+        'X-Total-Count-Exact': '1' if page['total_exact'] else '0'
+    }
+    if page['next_cursor']:
+        headers['X-Next-Cursor'] = page['next_cursor']
+    return headers
@@ -83,6 +83,20 @@ class ReportStatus(enum.Enum):
     GENERATED = 'generated'                    # 已生成
     CANCELLED = 'cancelled'                    # 已取消
 
+class ReportJobStatus(enum.Enum):
+    """报告生成任务状态枚举"""
+    QUEUED = 'queued'                          # 排队中（含等待重试）
+    RUNNING = 'running'                        # 执行中
+    SUCCEEDED = 'succeeded'                    # 已完成
+    FAILED = 'failed'                          # 失败（重试次数用尽）
+    CANCELLED = 'cancelled'                    # 已取消
+
+class UploadSessionStatus(enum.Enum):
+    """分片上传会话状态枚举"""
+    UPLOADING = 'uploading'                    # 接收分片中
+    COMPLETED = 'completed'                    # 已合并并创建文档
+    ABORTED = 'aborted'                        # 已取消或过期
+
 class ProjectMemberRole(enum.Enum):
     """项目成员角色枚举"""
     OWNER = 'owner'
@@ -215,6 +229,8 @@ class Project(db.Model):
     # 报告相关字段
     report_path = db.Column(db.String(500))  # 征信报告文件路径
     report_status = db.Column(db.Enum(ReportStatus), default=ReportStatus.NOT_GENERATED, nullable=False)  # 报告状态
+    report_html_path = db.Column(db.String(500))  # 预渲染的HTML报告文件路径
+    report_pdf_path = db.Column(db.String(500))  # 预渲染的PDF报告文件路径
 
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     assigned_to = db.Column(db.Integer, db.ForeignKey('users.id'))
@@ -226,8 +242,13 @@ class Project(db.Model):
     members = db.relationship('ProjectMember', backref='project', lazy='dynamic', cascade='all, delete-orphan')
     reports = db.relationship('AnalysisReport', backref='project', lazy='dynamic', cascade='all, delete-orphan')
     
-    def to_dict(self):
-        """转换为字典"""
+    def to_dict(self, document_count=None):
+        """
+        转换为字典
+
+        Args:
+            document_count: 预先批量统计的文档数量，提供时不再单独查询
+        """
         return {
             'id': self.id,
             'name': self.name,
@@ -241,7 +262,7 @@ class Project(db.Model):
             'progress': self.progress,
             'created_by': self.created_by,
             'assigned_to': self.assigned_to,
-            'documents': self.documents.count(),  # 使用count()方法更高效
+            'documents': self.documents.count() if document_count is None else document_count,
             'lastUpdate': self.updated_at.strftime('%Y-%m-%d'),
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat(),
@@ -287,6 +308,12 @@ class Document(db.Model):
     
     # 知识库相关字段
     rag_document_id = db.Column(db.String(100))      # RAG系统中的文档ID
+
+    # 内容哈希（SHA-256），重建知识库时只处理内容有变化的文档
+    source_hash = db.Column(db.String(64))           # 最近一次处理时源文件的哈希
+    processed_hash = db.Column(db.String(64))        # 处理后Markdown文件的哈希
+    kb_synced_hash = db.Column(db.String(64))        # 已上传到知识库的处理后文件哈希
+    blob_hash = db.Column(db.String(64))             # 源文件在内容存储中的哈希（文件由内容存储链接生成时）
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
@@ -874,3 +901,149 @@ class StatisticsHistory(db.Model):
 
     def __repr__(self):
         return f'<StatisticsHistory {self.stat_date}-{self.stat_type.value if self.stat_type else ""}>'
+
+class ReportJob(db.Model):
+    """报告生成任务模型（任务队列）"""
+    __tablename__ = 'report_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False)
+    tenant_id = db.Column(db.Integer, nullable=False)  # 公平调度的租户（项目创建者）
+
+    # 生成参数
+    dataset_id = db.Column(db.String(100))
+    company_name = db.Column(db.String(200), nullable=False)
+    knowledge_name = db.Column(db.String(200))
+
+    # 调度状态
+    status = db.Column(db.Enum(ReportJobStatus), default=ReportJobStatus.QUEUED, nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)  # 已执行次数
+    max_attempts = db.Column(db.Integer, default=3, nullable=False)  # 最大执行次数
+    next_run_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)  # 最早执行时间（重试退避）
+    locked_by = db.Column(db.String(100))  # 执行任务的worker
+    heartbeat_at = db.Column(db.DateTime)  # 执行中的心跳时间
+    last_error = db.Column(db.Text)  # 最近一次失败原因
+    cancel_requested = db.Column(db.Boolean, default=False, nullable=False)  # 执行中被用户停止，失败后不再重试
+
+    # 时间信息
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    # 关系
+    project = db.relationship('Project', backref=db.backref('report_jobs', cascade='all, delete-orphan', lazy='dynamic'), lazy='select')
+
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'id': self.id,
+            'project_id': self.project_id,
+            'tenant_id': self.tenant_id,
+            'company_name': self.company_name,
+            'status': self.status.value if self.status else None,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'next_run_at': self.next_run_at.isoformat() if self.next_run_at else None,
+            'locked_by': self.locked_by,
+            'last_error': self.last_error,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
+        }
+
+    def __repr__(self):
+        return f'<ReportJob {self.id}: project {self.project_id} {self.status.value if self.status else ""}>'
+
+class FileBlob(db.Model):
+    """文件内容存储模型（按SHA-256去重，引用计数归零时删除）"""
+    __tablename__ = 'file_blobs'
+
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, default=0, nullable=False)  # 引用该内容的文档数
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'sha256': self.sha256,
+            'size': self.size,
+            'ref_count': self.ref_count,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
+        }
+
+    def __repr__(self):
+        return f'<FileBlob {self.sha256[:12]} refs={self.ref_count}>'
+
+class UploadSession(db.Model):
+    """分片上传会话模型（分片按顺序追加写入临时文件，可从已接收的位置续传）"""
+    __tablename__ = 'upload_sessions'
+
+    id = db.Column(db.String(32), primary_key=True)  # 上传ID（uuid）
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+
+    # 文件信息
+    original_filename = db.Column(db.String(255), nullable=False)
+    document_name = db.Column(db.String(255), nullable=False)
+    label = db.Column(db.String(50))
+    mime_type = db.Column(db.String(100))
+    total_size = db.Column(db.BigInteger, nullable=False)  # 声明的文件总大小
+    chunk_size = db.Column(db.Integer, nullable=False)  # 单个分片的最大字节数
+    expected_hash = db.Column(db.String(64))  # 客户端提供的SHA-256（可选，合并时校验）
+
+    # 上传进度
+    status = db.Column(db.Enum(UploadSessionStatus), default=UploadSessionStatus.UPLOADING, nullable=False)
+    received_bytes = db.Column(db.BigInteger, default=0, nullable=False)
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id', ondelete='SET NULL'))
+
+    # 时间信息
+    expires_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    # 关系
+    project = db.relationship('Project', backref=db.backref('upload_sessions', cascade='all, delete-orphan', lazy='dynamic'), lazy='select')
+
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'upload_id': self.id,
+            'project_id': self.project_id,
+            'filename': self.original_filename,
+            'name': self.document_name,
+            'status': self.status.value if self.status else None,
+            'total_size': self.total_size,
+            'chunk_size': self.chunk_size,
+            'received_bytes': self.received_bytes,
+            'document_id': self.document_id,
+            'expires_at': self.expires_at.isoformat(),
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
+        }
+
+    def __repr__(self):
+        return f'<UploadSession {self.id}: {self.received_bytes}/{self.total_size}>'
+
+class StatCounter(db.Model):
+    """实时统计计数器模型（由项目、文档、用户的增删改事件在同一事务中维护，定期与实际数据校对）"""
+    __tablename__ = 'stat_counters'
+
+    name = db.Column(db.String(100), primary_key=True)  # 计数器名称，与统计聚合的字段名一致
+    value = db.Column(db.BigInteger, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'name': self.name,
+            'value': self.value,
+            'updated_at': self.updated_at.isoformat()
+        }
+
+    def __repr__(self):
+        return f'<StatCounter {self.name}={self.value}>'
@@ -69,6 +69,14 @@ def when_ready(server):
     except Exception as e:
         server.log.error(f"When-ready回调异常: {e}")
 
+    # 在主进程中刷新一次字体缓存，worker通过环境变量继承结果，不再重复执行fc-cache
+    try:
+        from services.md_to_pdf_converter import refresh_system_fonts
+        refresh_system_fonts()
+        server.log.info("PDF渲染字体缓存已就绪")
+    except Exception as e:
+        server.log.warning(f"PDF渲染字体初始化失败: {e}")
+
 def worker_int(worker):
     """Worker收到SIGINT信号时的回调"""
     try:
@@ -108,6 +116,45 @@ def post_fork(server, worker):
     except Exception as e:
         server.log.error(f"Post-fork回调异常: {e}")
     
+def post_worker_init(worker):
+    """Worker初始化完成后的回调"""
+    # 每个worker只初始化一次PDF渲染资源（FontConfiguration、CSS），请求处理时直接复用
+    try:
+        from services.md_to_pdf_converter import get_shared_converter
+        get_shared_converter()
+        worker.log.info(f"Worker {worker.pid} PDF渲染器已初始化")
+    except Exception as e:
+        worker.log.warning(f"Worker {worker.pid} PDF渲染器初始化失败: {e}")
+
+    # 嵌入模式下每个worker执行报告生成任务（REPORT_JOB_EXECUTION=worker 时由 report_worker.py 执行）
+    try:
+        from services.report_job_queue import start_embedded_report_worker
+        if start_embedded_report_worker(worker.wsgi):
+            worker.log.info(f"Worker {worker.pid} 报告生成任务执行器已启动")
+    except Exception as e:
+        worker.log.warning(f"Worker {worker.pid} 报告生成任务执行器启动失败: {e}")
+
+    # 知识库解析状态轮询器（集群内由持有MySQL命名锁的worker实际轮询），重启后继续跟踪解析中的文档
+    try:
+        from services.parse_status_poller import parse_status_poller
+        parse_status_poller.start(worker.wsgi)
+    except Exception as e:
+        worker.log.warning(f"Worker {worker.pid} 解析状态轮询器启动失败: {e}")
+
+    # 统计计数器定期校对（集群内同一时间只有一个worker执行）
+    try:
+        from services.stat_counters import stat_counter_service
+        stat_counter_service.start(worker.wsgi)
+    except Exception as e:
+        worker.log.warning(f"Worker {worker.pid} 统计计数器校对线程启动失败: {e}")
+
+    # 定期清理过期的分片上传会话和残留的临时文件
+    try:
+        from services.chunked_upload_service import chunked_upload_service
+        chunked_upload_service.start(worker.wsgi)
+    except Exception as e:
+        worker.log.warning(f"Worker {worker.pid} 分片上传清理线程启动失败: {e}")
+
 def pre_exec(server):
     """重新加载应用前的回调"""
     try:
@@ -152,6 +199,20 @@ def worker_exit(server, worker):
     except Exception as e:
         server.log.error(f"Worker退出回调异常: {e}")
 
+    # 等待执行中的文档处理任务完成，排队中的文档标记为失败以便重试
+    try:
+        from services.document_executor import document_executor
+        document_executor.shutdown(timeout=int(os.environ.get('DOCUMENT_PROCESS_DRAIN_TIMEOUT', graceful_timeout - 10)))
+    except Exception as e:
+        server.log.warning(f"关闭文档处理执行器失败: {e}")
+
+    # 关闭该worker创建的PDF渲染子进程
+    try:
+        from services.pdf_render_pool import pdf_render_pool
+        pdf_render_pool.shutdown()
+    except Exception as e:
+        server.log.warning(f"关闭PDF渲染进程池失败: {e}")
+
 def nworkers_changed(server, new_value, old_value):
     """Worker数量变化时的回调"""
     try:
@@ -43,6 +43,8 @@ CREATE TABLE projects (
     knowledge_base_name VARCHAR(200),
     report_path VARCHAR(500),
     report_status ENUM('NOT_GENERATED', 'GENERATING', 'GENERATED', 'CANCELLED') NOT NULL DEFAULT 'NOT_GENERATED',
+    report_html_path VARCHAR(500),
+    report_pdf_path VARCHAR(500),
     created_by INTEGER NOT NULL,
     assigned_to INTEGER,
     created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
@@ -71,6 +73,10 @@ CREATE TABLE documents (
     processing_started_at DATETIME,
     processed_at DATETIME,
     rag_document_id VARCHAR(100),
+    source_hash CHAR(64),
+    processed_hash CHAR(64),
+    kb_synced_hash CHAR(64),
+    blob_hash CHAR(64),
     created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     FOREIGN KEY (project_id) REFERENCES projects(id),
@@ -286,6 +292,68 @@ CREATE TABLE statistics_history (
     UNIQUE KEY unique_stat (stat_date, stat_type)
 );
 
+-- 创建报告生成任务表
+CREATE TABLE report_jobs (
+    id INTEGER PRIMARY KEY AUTO_INCREMENT,
+    project_id INTEGER NOT NULL,
+    tenant_id INTEGER NOT NULL,
+    dataset_id VARCHAR(100),
+    company_name VARCHAR(200) NOT NULL,
+    knowledge_name VARCHAR(200),
+    status ENUM('QUEUED', 'RUNNING', 'SUCCEEDED', 'FAILED', 'CANCELLED') NOT NULL DEFAULT 'QUEUED',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    next_run_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_by VARCHAR(100),
+    heartbeat_at DATETIME,
+    last_error TEXT,
+    cancel_requested BOOLEAN NOT NULL DEFAULT FALSE,
+    started_at DATETIME,
+    finished_at DATETIME,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE
+);
+
+-- 创建文件内容存储表（按SHA-256去重的上传文件及其引用计数）
+CREATE TABLE file_blobs (
+    sha256 CHAR(64) PRIMARY KEY,
+    size BIGINT NOT NULL,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- 创建分片上传会话表
+CREATE TABLE upload_sessions (
+    id VARCHAR(32) PRIMARY KEY,
+    project_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    original_filename VARCHAR(255) NOT NULL,
+    document_name VARCHAR(255) NOT NULL,
+    label VARCHAR(50),
+    mime_type VARCHAR(100),
+    total_size BIGINT NOT NULL,
+    chunk_size INTEGER NOT NULL,
+    expected_hash CHAR(64),
+    status ENUM('UPLOADING', 'COMPLETED', 'ABORTED') NOT NULL DEFAULT 'UPLOADING',
+    received_bytes BIGINT NOT NULL DEFAULT 0,
+    document_id INTEGER,
+    expires_at DATETIME NOT NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE,
+    FOREIGN KEY (user_id) REFERENCES users(id),
+    FOREIGN KEY (document_id) REFERENCES documents(id) ON DELETE SET NULL
+);
+
+-- 创建实时统计计数器表（由应用在项目、文档、用户变更时维护，首次读取时从实际数据初始化）
+CREATE TABLE stat_counters (
+    name VARCHAR(100) PRIMARY KEY,
+    value BIGINT NOT NULL DEFAULT 0,
+    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
 -- 插入种子用户数据
 -- 密码: admin - admin123, user1/user2/user3 - user123
 INSERT INTO users (username, email, password_hash, phone, role, is_active, last_login) VALUES
@@ -310,6 +378,8 @@ CREATE INDEX idx_users_email ON users(email);
 CREATE INDEX idx_users_username ON users(username);
 CREATE INDEX idx_users_role ON users(role);
 CREATE INDEX idx_users_is_active ON users(is_active);
+CREATE INDEX idx_users_created_at_id ON users(created_at, id);
+CREATE INDEX idx_users_last_login ON users(last_login);
 
 CREATE INDEX idx_projects_created_by ON projects(created_by);
 CREATE INDEX idx_projects_assigned_to ON projects(assigned_to);
@@ -318,12 +388,15 @@ CREATE INDEX idx_projects_type ON projects(type);
 CREATE INDEX idx_projects_risk_level ON projects(risk_level);
 CREATE INDEX idx_projects_folder_uuid ON projects(folder_uuid);
 CREATE INDEX idx_projects_created_at ON projects(created_at);
+CREATE INDEX idx_projects_updated_at_id ON projects(updated_at, id);
 
 CREATE INDEX idx_documents_project_id ON documents(project_id);
 CREATE INDEX idx_documents_upload_by ON documents(upload_by);
 CREATE INDEX idx_documents_status ON documents(status);
 CREATE INDEX idx_documents_label ON documents(label);
-CREATE INDEX idx_documents_created_at ON documents(created_at);
+CREATE INDEX idx_documents_created_at_id ON documents(created_at, id);
+CREATE INDEX idx_documents_project_created_at_id ON documents(project_id, created_at, id);
+CREATE INDEX idx_documents_source_hash ON documents(source_hash);
 
 CREATE INDEX idx_project_members_project_id ON project_members(project_id);
 CREATE INDEX idx_project_members_user_id ON project_members(user_id);
@@ -356,6 +429,12 @@ CREATE INDEX idx_project_timeline_project_id ON project_timeline(project_id);
 CREATE INDEX idx_project_timeline_event_type ON project_timeline(event_type);
 CREATE INDEX idx_project_timeline_status ON project_timeline(status);
 CREATE INDEX idx_project_timeline_event_date ON project_timeline(event_date);
+CREATE INDEX idx_project_timeline_project_event_date_id ON project_timeline(project_id, event_date, id);
 
 CREATE INDEX idx_statistics_history_stat_date ON statistics_history(stat_date);
-CREATE INDEX idx_statistics_history_stat_type ON statistics_history(stat_type);
\ No newline at end of file
+CREATE INDEX idx_statistics_history_stat_type ON statistics_history(stat_type);
+
+CREATE INDEX idx_report_jobs_status_next_run ON report_jobs(status, next_run_at);
+CREATE INDEX idx_report_jobs_tenant_status ON report_jobs(tenant_id, status);
+CREATE INDEX idx_report_jobs_project_status ON report_jobs(project_id, status);
+CREATE INDEX idx_upload_sessions_status_expires ON upload_sessions(status, expires_at);
\ No newline at end of file
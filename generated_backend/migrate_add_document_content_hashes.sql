@@ -0,0 +1,13 @@
+-- 数据库迁移脚本：添加文档内容哈希到 documents 表
+-- 执行日期: 2026-10-16
+
+USE `credit_db`;
+
+-- 源文件、处理后Markdown文件和已上传知识库内容的SHA-256哈希，重建知识库时按哈希比对只处理变化的文档
+ALTER TABLE documents
+ADD COLUMN source_hash CHAR(64) AFTER rag_document_id,
+ADD COLUMN processed_hash CHAR(64) AFTER source_hash,
+ADD COLUMN kb_synced_hash CHAR(64) AFTER processed_hash;
+
+-- 验证修改
+DESCRIBE documents;
@@ -0,0 +1,24 @@
+-- 数据库迁移脚本：添加文件内容存储表，documents 表添加内容存储哈希
+-- 执行日期: 2026-10-16
+
+USE `credit_db`;
+
+-- 按SHA-256去重的上传文件，ref_count为引用该内容的文档数
+CREATE TABLE IF NOT EXISTS file_blobs (
+    sha256 CHAR(64) PRIMARY KEY,
+    size BIGINT NOT NULL,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- 源文件由内容存储链接生成时记录其哈希，删除文档时释放引用
+ALTER TABLE documents
+ADD COLUMN blob_hash CHAR(64) AFTER kb_synced_hash;
+
+-- 按源文件哈希查找可复用的处理结果
+CREATE INDEX idx_documents_source_hash ON documents(source_hash);
+
+-- 验证修改
+DESCRIBE file_blobs;
+DESCRIBE documents;
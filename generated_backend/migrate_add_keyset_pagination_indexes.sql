@@ -0,0 +1,18 @@
+-- 数据库迁移脚本：添加列表游标分页使用的复合索引
+-- 执行日期: 2026-10-16
+
+USE `credit_db`;
+
+-- 列表按 (排序列, id) 倒序游标分页，复合索引使翻页直接定位到游标位置，无需扫描前面的行
+CREATE INDEX idx_projects_updated_at_id ON projects(updated_at, id);
+CREATE INDEX idx_users_created_at_id ON users(created_at, id);
+CREATE INDEX idx_project_timeline_project_event_date_id ON project_timeline(project_id, event_date, id);
+
+-- 文档列表：(created_at, id) 替换原 created_at 单列索引，按项目筛选时使用 (project_id, created_at, id)
+CREATE INDEX idx_documents_created_at_id ON documents(created_at, id);
+CREATE INDEX idx_documents_project_created_at_id ON documents(project_id, created_at, id);
+DROP INDEX idx_documents_created_at ON documents;
+
+-- 验证修改
+SHOW INDEX FROM projects;
+SHOW INDEX FROM documents;
@@ -0,0 +1,12 @@
+-- 数据库迁移脚本：添加报告预渲染产物路径到 projects 表
+-- 执行日期: 2026-10-16
+
+USE `credit_db`;
+
+-- 报告生成完成后后台预渲染的HTML和PDF文件路径
+ALTER TABLE projects
+ADD COLUMN report_html_path VARCHAR(500) AFTER report_status,
+ADD COLUMN report_pdf_path VARCHAR(500) AFTER report_html_path;
+
+-- 验证修改
+DESCRIBE projects;
@@ -0,0 +1,11 @@
+-- 数据库迁移脚本：添加执行中报告生成任务的取消标记到 report_jobs 表
+-- 执行日期: 2026-10-16
+
+USE `credit_db`;
+
+-- 用户停止生成时标记执行中的任务，该次执行失败后直接取消，不再按退避重试
+ALTER TABLE report_jobs
+ADD COLUMN cancel_requested BOOLEAN NOT NULL DEFAULT FALSE AFTER last_error;
+
+-- 验证修改
+DESCRIBE report_jobs;
@@ -0,0 +1,33 @@
+-- 数据库迁移脚本：添加报告生成任务表 report_jobs
+-- 执行日期: 2026-10-16
+
+USE `credit_db`;
+
+-- 创建报告生成任务表
+CREATE TABLE report_jobs (
+    id INTEGER PRIMARY KEY AUTO_INCREMENT,
+    project_id INTEGER NOT NULL,
+    tenant_id INTEGER NOT NULL,
+    dataset_id VARCHAR(100),
+    company_name VARCHAR(200) NOT NULL,
+    knowledge_name VARCHAR(200),
+    status ENUM('QUEUED', 'RUNNING', 'SUCCEEDED', 'FAILED', 'CANCELLED') NOT NULL DEFAULT 'QUEUED',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    next_run_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_by VARCHAR(100),
+    heartbeat_at DATETIME,
+    last_error TEXT,
+    started_at DATETIME,
+    finished_at DATETIME,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE
+);
+
+CREATE INDEX idx_report_jobs_status_next_run ON report_jobs(status, next_run_at);
+CREATE INDEX idx_report_jobs_tenant_status ON report_jobs(tenant_id, status);
+CREATE INDEX idx_report_jobs_project_status ON report_jobs(project_id, status);
+
+-- 验证修改
+DESCRIBE report_jobs;
@@ -0,0 +1,14 @@
+-- 数据库迁移脚本：添加实时统计计数器表 stat_counters
+-- 执行日期: 2026-10-16
+
+USE `credit_db`;
+
+-- 创建实时统计计数器表（无需初始化数据，应用首次读取或定期校对时从实际数据计算）
+CREATE TABLE stat_counters (
+    name VARCHAR(100) PRIMARY KEY,
+    value BIGINT NOT NULL DEFAULT 0,
+    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- 验证修改
+DESCRIBE stat_counters;
@@ -0,0 +1,33 @@
+-- 数据库迁移脚本：添加分片上传会话表 upload_sessions
+-- 执行日期: 2026-10-16
+
+USE `credit_db`;
+
+-- 创建分片上传会话表
+CREATE TABLE upload_sessions (
+    id VARCHAR(32) PRIMARY KEY,
+    project_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    original_filename VARCHAR(255) NOT NULL,
+    document_name VARCHAR(255) NOT NULL,
+    label VARCHAR(50),
+    mime_type VARCHAR(100),
+    total_size BIGINT NOT NULL,
+    chunk_size INTEGER NOT NULL,
+    expected_hash CHAR(64),
+    status ENUM('UPLOADING', 'COMPLETED', 'ABORTED') NOT NULL DEFAULT 'UPLOADING',
+    received_bytes BIGINT NOT NULL DEFAULT 0,
+    document_id INTEGER,
+    expires_at DATETIME NOT NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE,
+    FOREIGN KEY (user_id) REFERENCES users(id),
+    FOREIGN KEY (document_id) REFERENCES documents(id) ON DELETE SET NULL
+);
+
+-- 清理过期会话使用的索引
+CREATE INDEX idx_upload_sessions_status_expires ON upload_sessions(status, expires_at);
+
+-- 验证修改
+DESCRIBE upload_sessions;
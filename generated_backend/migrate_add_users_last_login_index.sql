@@ -0,0 +1,10 @@
+-- 数据库迁移脚本：添加 users.last_login 索引
+-- 执行日期: 2026-10-16
+
+USE `credit_db`;
+
+-- 仪表板的最近活跃用户数按 last_login 范围实时统计
+CREATE INDEX idx_users_last_login ON users(last_login);
+
+-- 验证修改
+SHOW INDEX FROM users;
@@ -0,0 +1,60 @@
+"""
+报告生成worker入口
+独立于Web进程运行，从 report_jobs 任务表领取报告生成任务执行。
+
+使用方式:
+    REPORT_JOB_EXECUTION=worker gunicorn -c gunicorn_config.py app:app   # Web进程只负责入队
+    REPORT_JOB_EXECUTION=worker python report_worker.py                 # 可按需启动多个worker进程
+
+环境变量:
+    REPORT_WORKER_CONCURRENCY: 每个worker进程同时执行的任务数（默认2）
+    REPORT_WORKER_POLL_INTERVAL: 队列为空时的轮询间隔秒数（默认2）
+    REPORT_WORKER_DRAIN_TIMEOUT: 收到退出信号后等待执行中任务完成的秒数（默认600）
+
+注意: 生成过程通过WebSocket实时推送内容，worker与Web进程分离时需要 USE_REDIS_BROKER=true，
+推送经Redis消息队列转发给Web进程中的客户端。
+"""
+
+# SocketIO使用eventlet模式，与gunicorn的eventlet worker保持一致
+import eventlet
+eventlet.monkey_patch()
+
+import os
+import signal
+import logging
+import threading
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('report_worker')
+
+
+def main():
+    from app import app
+    from services.report_job_queue import ReportJobWorker
+
+    if os.environ.get('USE_REDIS_BROKER', 'false').lower() != 'true':
+        logger.warning("未启用USE_REDIS_BROKER，报告生成内容无法实时推送到Web进程中的WebSocket客户端")
+
+    worker = ReportJobWorker(app)
+    shutdown = threading.Event()
+
+    def handle_signal(signum, frame):
+        logger.info(f"收到信号 {signum}，停止领取新任务并等待执行中的任务完成")
+        shutdown.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    worker.start()
+    while not shutdown.wait(1):
+        pass
+
+    worker.stop(timeout=int(os.environ.get('REPORT_WORKER_DRAIN_TIMEOUT', 600)))
+    logger.info("报告生成worker已退出")
+
+
+if __name__ == '__main__':
+    main()
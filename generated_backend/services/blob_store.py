@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+上传文件内容存储
+上传文件按SHA-256存放在内容存储目录中（每份内容只存一份），项目目录中的文件通过硬链接
+（跨文件系统时使用reflink，都不支持时复制）生成；file_blobs 表记录每份内容被多少文档引用，
+引用数归零后才删除内容文件
+"""
+
+import os
+import errno
+import shutil
+import hashlib
+import logging
+import tempfile
+
+from flask import current_app
+from sqlalchemy import text, func
+
+from database import db
+from db_models import FileBlob
+
+# Linux FICLONE ioctl（btrfs、xfs等文件系统的写时复制克隆）
+FICLONE = 0x40049409
+
+
+class BlobStore:
+    """按内容寻址的上传文件存储"""
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.chunk_size = int(os.environ.get('BLOB_STORE_CHUNK_SIZE', 1024 * 1024))
+        self._stats = {
+            'stored': 0,
+            'deduplicated': 0,
+            'bytes_written': 0,
+            'bytes_deduplicated': 0,
+            'hardlinks': 0,
+            'reflinks': 0,
+            'copies': 0,
+            'purged': 0
+        }
+
+    def _root(self):
+        return current_app.config.get('BLOB_STORE_FOLDER', 'blobs')
+
+    def blob_path(self, sha256):
+        """内容文件路径：<根目录>/ab/cd/<sha256>"""
+        return os.path.join(self._root(), sha256[:2], sha256[2:4], sha256)
+
+    def tmp_dir(self):
+        """临时文件目录（与内容文件同一目录树，纳入存储时可以直接重命名）"""
+        path = os.path.join(self._root(), 'tmp')
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def save_stream(self, stream, dest_path):
+        """
+        保存上传内容并在目标路径生成文件
+
+        内容先边写临时文件边计算哈希，再增加引用计数（行锁持有到调用方提交事务，
+        期间其他进程不会删除同一内容），内容已存在时只丢弃临时文件，不再写入新数据
+
+        Args:
+            stream: 可读的二进制流（如上传文件的 file.stream）
+            dest_path: 项目目录中的目标文件路径
+
+        Returns:
+            tuple: (sha256, 文件大小, 是否新建了内容文件)
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir())
+        try:
+            hasher = hashlib.sha256()
+            size = 0
+            with os.fdopen(fd, 'wb') as f:
+                while True:
+                    chunk = stream.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+            sha256 = hasher.hexdigest()
+            created = self.store_file(tmp_path, sha256, size, dest_path)
+            return sha256, size, created
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def store_file(self, tmp_path, sha256, size, dest_path):
+        """
+        将已计算哈希的临时文件纳入内容存储并在目标路径生成文件（不提交事务）
+
+        Args:
+            tmp_path: 内容存储目录下的临时文件（硬链接为内容文件，保留原文件由调用方在提交后删除）
+            sha256: 文件内容的SHA-256
+            size: 文件大小
+            dest_path: 项目目录中的目标文件路径
+
+        Returns:
+            bool: 是否新建了内容文件（事务未能提交时由 discard 据此删除）
+        """
+        self._acquire(sha256, size)
+
+        path = self.blob_path(sha256)
+        created = False
+        if os.path.exists(path) and os.path.getsize(path) == size:
+            self._stats['deduplicated'] += 1
+            self._stats['bytes_deduplicated'] += size
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.exists(path):
+                os.remove(path)  # 大小不一致的残留文件
+            os.chmod(tmp_path, 0o444)  # 内容文件与项目文件共享inode，设为只读防止被改写
+            try:
+                os.link(tmp_path, path)
+            except OSError:
+                shutil.copyfile(tmp_path, path)
+            created = True
+            self._stats['stored'] += 1
+            self._stats['bytes_written'] += size
+
+        try:
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            self._materialize(path, dest_path)
+        except Exception:
+            self._remove_files(dest_path, path if created else None)
+            raise
+        return created
+
+    def discard(self, sha256, dest_path, created):
+        """
+        上传的文档记录未能提交时删除已生成的文件（调用方已回滚事务）
+
+        项目目录中的文件直接删除；内容文件只在由本次上传新建、且没有 file_blobs 记录时删除
+        （检查时锁定该哈希，并发上传同一内容时要么已创建记录而保留文件，要么等待删除完成后重新放置）
+
+        Args:
+            sha256: 文件内容的SHA-256
+            dest_path: 项目目录中的目标文件路径
+            created: store_file 是否新建了内容文件
+        """
+        try:
+            blob_path = None
+            if created and sha256:
+                blob = FileBlob.query.filter_by(sha256=sha256).with_for_update().first()
+                if blob is None:
+                    blob_path = self.blob_path(sha256)
+            self._remove_files(dest_path, blob_path)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            self.logger.warning(f"清理未提交的上传文件失败: {dest_path}, {e}")
+
+    def _remove_files(self, *paths):
+        for path in paths:
+            if path and os.path.exists(path):
+                os.remove(path)
+
+    def _acquire(self, sha256, size):
+        """增加引用计数（不存在时创建记录）"""
+        if db.engine.dialect.name == 'mysql':
+            db.session.execute(text(
+                "INSERT INTO file_blobs (sha256, size, ref_count, created_at, updated_at) "
+                "VALUES (:sha256, :size, 1, UTC_TIMESTAMP(), UTC_TIMESTAMP()) "
+                "ON DUPLICATE KEY UPDATE ref_count = ref_count + 1, updated_at = UTC_TIMESTAMP()"
+            ), {'sha256': sha256, 'size': size})
+            return
+        blob = FileBlob.query.filter_by(sha256=sha256).with_for_update().first()
+        if blob:
+            blob.ref_count += 1
+        else:
+            db.session.add(FileBlob(sha256=sha256, size=size, ref_count=1))
+        db.session.flush()
+
+    def _materialize(self, source, dest_path):
+        """按 硬链接 -> reflink -> 复制 的顺序生成目标文件"""
+        try:
+            os.link(source, dest_path)
+            self._stats['hardlinks'] += 1
+            return
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                raise
+
+        try:
+            import fcntl
+            with open(source, 'rb') as src, open(dest_path, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            self._stats['reflinks'] += 1
+            return
+        except (ImportError, OSError):
+            pass
+
+        shutil.copyfile(source, dest_path)
+        self._stats['copies'] += 1
+
+    def release(self, sha256):
+        """
+        减少引用计数（不提交事务，调用方提交后再调用 purge_unreferenced 删除内容文件）
+
+        Args:
+            sha256: 文档的 blob_hash，为空时忽略
+        """
+        if not sha256:
+            return
+        FileBlob.query.filter(FileBlob.sha256 == sha256, FileBlob.ref_count > 0).update({
+            FileBlob.ref_count: FileBlob.ref_count - 1
+        }, synchronize_session=False)
+
+    def purge_unreferenced(self, hashes=None, limit=500):
+        """
+        删除引用数为0的内容文件和记录
+
+        删除在持有行锁时进行，与并发的上传互斥：上传方会在锁释放后重新创建记录并放置内容文件。
+        项目目录中已硬链接的文件不受影响
+
+        Args:
+            hashes: 只检查这些哈希（按主键加锁，不影响其他内容的上传）。
+                不传时扫描全表并锁定扫描到的行，会阻塞并发上传，只用于离线维护
+            limit: 单次最多删除的记录数
+
+        Returns:
+            int: 删除的内容数
+        """
+        try:
+            query = FileBlob.query.filter(FileBlob.ref_count <= 0)
+            if hashes is not None:
+                hashes = [h for h in hashes if h]
+                if not hashes:
+                    return 0
+                query = query.filter(FileBlob.sha256.in_(hashes))
+            blobs = query.limit(limit).with_for_update().all()
+            for blob in blobs:
+                path = self.blob_path(blob.sha256)
+                if os.path.exists(path):
+                    os.remove(path)
+                db.session.delete(blob)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            self.logger.warning(f"清理未引用的文件内容失败: {e}")
+            return 0
+
+        self._stats['purged'] += len(blobs)
+        return len(blobs)
+
+    def get_stats(self):
+        """获取存储用量（实际占用与按引用计算的逻辑大小）和当前进程的写入指标"""
+        blob_count, stored_bytes, logical_bytes = db.session.query(
+            func.count(FileBlob.sha256),
+            func.coalesce(func.sum(FileBlob.size), 0),
+            func.coalesce(func.sum(FileBlob.size * FileBlob.ref_count), 0)
+        ).filter(FileBlob.ref_count > 0).one()
+        stats = dict(self._stats)
+        stats.update({
+            'blobs': blob_count,
+            'stored_bytes': int(stored_bytes),
+            'logical_bytes': int(logical_bytes),
+            'saved_bytes': int(logical_bytes) - int(stored_bytes)
+        })
+        return stats
+
+
+# 全局内容存储实例
+blob_store = BlobStore()
@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+"""
+分片上传服务
+大文件按 初始化 -> 逐个上传分片 -> 完成 的流程上传：分片请求体直接按块写入暂存文件（不经过表单解析，
+也不持有数据库连接和行锁），校验后用条件更新推进已接收的字节数并写入临时文件，中断后可从该位置续传；
+整个文件的SHA-256在完成时计算一次；后台线程定期清理过期会话和没有会话记录的临时文件
+"""
+
+import os
+import glob
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from database import db
+from db_models import UploadSession, UploadSessionStatus, UserRole
+from services.blob_store import blob_store
+
+
+class ChunkedUploadError(Exception):
+    """分片上传请求不合法"""
+
+    def __init__(self, message, status_code=400, received_bytes=None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.received_bytes = received_bytes
+
+
+class ChunkedUploadService:
+    """分片上传服务"""
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.read_size = int(os.environ.get('UPLOAD_STREAM_READ_SIZE', 256 * 1024))
+        self.lock_timeout = int(os.environ.get('UPLOAD_CHUNK_LOCK_TIMEOUT', 30))
+        self.purge_interval = int(os.environ.get('UPLOAD_PURGE_INTERVAL', 600))
+        self._app = None
+        self._thread = None
+        self._thread_pid = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def part_path(self, upload_id):
+        """会话的临时文件路径（位于内容存储的临时目录，完成时可直接重命名为内容文件）"""
+        return os.path.join(blob_store.tmp_dir(), f"upload_{upload_id}.part")
+
+    def create_session(self, project, user, original_filename, document_name, label, mime_type,
+                       total_size, expected_hash=None):
+        """
+        创建上传会话
+
+        Args:
+            project: 目标项目（已检查上传权限）
+            user: 当前用户
+            original_filename: 原始文件名
+            document_name: 文档名称
+            label: 文档标签（与普通上传相同的取值）
+            mime_type: 文件MIME类型
+            total_size: 文件总大小
+            expected_hash: 客户端计算的SHA-256（可选）
+
+        Returns:
+            UploadSession: 已提交的会话
+        """
+        max_file_size = current_app.config.get('UPLOAD_MAX_FILE_SIZE', 1024 * 1024 * 1024)
+        if total_size <= 0:
+            raise ChunkedUploadError('文件大小必须大于0')
+        if total_size > max_file_size:
+            raise ChunkedUploadError(f'文件大小超过上限（{max_file_size}字节）', 413)
+        if expected_hash and (len(expected_hash) != 64 or any(c not in '0123456789abcdef' for c in expected_hash.lower())):
+            raise ChunkedUploadError('sha256格式错误')
+
+        self.purge_expired()
+
+        upload_session = UploadSession(
+            id=uuid.uuid4().hex,
+            project_id=project.id,
+            user_id=user.id,
+            original_filename=original_filename,
+            document_name=document_name,
+            label=label,
+            mime_type=mime_type,
+            total_size=total_size,
+            chunk_size=current_app.config.get('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024),
+            expected_hash=expected_hash.lower() if expected_hash else None,
+            status=UploadSessionStatus.UPLOADING,
+            received_bytes=0,
+            expires_at=datetime.utcnow() + timedelta(seconds=current_app.config.get('UPLOAD_SESSION_TTL', 86400))
+        )
+        open(self.part_path(upload_session.id), 'wb').close()
+        db.session.add(upload_session)
+        db.session.commit()
+        return upload_session
+
+    def get_session(self, upload_id, user, for_update=False):
+        """
+        获取会话并检查权限（只有创建者和管理员可以操作）
+
+        Raises:
+            ChunkedUploadError: 会话不存在或无权限
+        """
+        query = UploadSession.query.filter_by(id=upload_id)
+        if for_update:
+            query = query.with_for_update()
+        upload_session = query.first()
+        if not upload_session:
+            raise ChunkedUploadError('上传会话不存在', 404)
+        if upload_session.user_id != user.id and user.role != UserRole.ADMIN:
+            raise ChunkedUploadError('您没有权限操作此上传', 403)
+        return upload_session
+
+    def _check_uploading(self, upload_session):
+        if upload_session.status == UploadSessionStatus.COMPLETED:
+            raise ChunkedUploadError('上传已完成', 409, upload_session.received_bytes)
+        if upload_session.status != UploadSessionStatus.UPLOADING or upload_session.expires_at < datetime.utcnow():
+            raise ChunkedUploadError('上传会话已取消或过期', 410)
+
+    @contextmanager
+    def _part_lock(self, upload_id):
+        """
+        临时文件的跨进程锁：分片暂存后写入临时文件和推进位置时加锁，同一上传的并发分片依次提交。
+        锁只覆盖本地文件复制和一次短事务，非阻塞加锁后轮询等待，不阻塞eventlet事件循环
+        """
+        try:
+            import fcntl
+        except ImportError:
+            yield
+            return
+
+        fd = os.open(self.part_path(upload_id) + '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            deadline = time.time() + self.lock_timeout
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.time() >= deadline:
+                        raise ChunkedUploadError('同一上传的其他分片正在写入，请稍后重试', 409)
+                    time.sleep(0.05)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def write_chunk(self, upload_id, user, offset, length, stream, chunk_hash=None):
+        """
+        追加写入一个分片
+
+        请求体先读入暂存文件（此时不持有数据库连接和行锁，慢速客户端不会占用连接池），
+        校验长度和分片哈希后，在临时文件锁内用 received_bytes = offset 的条件更新推进位置并写入临时文件；
+        偏移量必须等于已接收的字节数，重复发送已接收的分片时返回409和当前位置，客户端据此续传
+
+        Args:
+            upload_id: 上传ID
+            user: 当前用户
+            offset: 分片在文件中的起始位置
+            length: 分片字节数（请求的Content-Length）
+            stream: 请求体流
+            chunk_hash: 分片的SHA-256（可选，校验失败时丢弃该分片）
+
+        Returns:
+            UploadSession: 更新后的会话
+        """
+        upload_session = self.get_session(upload_id, user)
+        try:
+            self._check_uploading(upload_session)
+            if length is None:
+                raise ChunkedUploadError('分片请求缺少Content-Length', 411)
+            if length <= 0:
+                raise ChunkedUploadError('分片不能为空')
+            if length > upload_session.chunk_size:
+                raise ChunkedUploadError(f'分片大小超过上限（{upload_session.chunk_size}字节）', 413)
+            if offset != upload_session.received_bytes:
+                raise ChunkedUploadError('分片偏移量与已接收位置不一致', 409, upload_session.received_bytes)
+            if offset + length > upload_session.total_size:
+                raise ChunkedUploadError('分片超出声明的文件大小')
+        finally:
+            # 结束读取事务，读取请求体期间不占用数据库连接
+            db.session.rollback()
+
+        part_path = self.part_path(upload_id)
+        stage_path = f"{part_path}.{uuid.uuid4().hex}.chunk"
+        try:
+            chunk_hasher = hashlib.sha256() if chunk_hash else None
+            written = 0
+            with open(stage_path, 'wb') as f:
+                while written < length:
+                    data = stream.read(min(self.read_size, length - written))
+                    if not data:
+                        break
+                    f.write(data)
+                    if chunk_hasher:
+                        chunk_hasher.update(data)
+                    written += len(data)
+            if written != length:
+                raise ChunkedUploadError('分片数据不完整，请重新发送该分片', 400, offset)
+            if chunk_hasher and chunk_hasher.hexdigest() != chunk_hash.lower():
+                raise ChunkedUploadError('分片校验失败，请重新发送该分片', 400, offset)
+
+            with self._part_lock(upload_id):
+                # 条件更新占用该位置，行锁只持有到本地文件写入完成
+                updated = UploadSession.query.filter(
+                    UploadSession.id == upload_id,
+                    UploadSession.status == UploadSessionStatus.UPLOADING,
+                    UploadSession.expires_at >= datetime.utcnow(),
+                    UploadSession.received_bytes == offset
+                ).update({UploadSession.received_bytes: offset + length}, synchronize_session=False)
+                if not updated:
+                    db.session.rollback()
+                    upload_session = self.get_session(upload_id, user)
+                    self._check_uploading(upload_session)
+                    raise ChunkedUploadError('分片偏移量与已接收位置不一致', 409, upload_session.received_bytes)
+
+                try:
+                    with open(part_path, 'r+b') as dst, open(stage_path, 'rb') as src:
+                        # 丢弃上次失败写入残留的数据
+                        dst.seek(offset)
+                        dst.truncate()
+                        shutil.copyfileobj(src, dst, self.read_size)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    raise
+        finally:
+            if os.path.exists(stage_path):
+                os.remove(stage_path)
+
+        return self.get_session(upload_id, user)
+
+    def _compute_file_hash(self, path):
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(self.read_size), b''):
+                hasher.update(block)
+        return hasher.hexdigest()
+
+    def finish(self, upload_id, user):
+        """
+        校验已接收的文件并锁定会话（不提交事务，调用方创建文档后一起提交）
+
+        文件已全部接收后不会再被写入，哈希在加锁前计算，行锁只覆盖状态检查和更新
+
+        Returns:
+            tuple: (会话, 临时文件路径, sha256)
+        """
+        upload_session = self.get_session(upload_id, user)
+        self._check_uploading(upload_session)
+        if upload_session.received_bytes != upload_session.total_size:
+            raise ChunkedUploadError('文件尚未上传完整', 409, upload_session.received_bytes)
+        total_size = upload_session.total_size
+        db.session.rollback()
+
+        part_path = self.part_path(upload_id)
+        if not os.path.exists(part_path) or os.path.getsize(part_path) != total_size:
+            raise ChunkedUploadError('上传临时文件不完整，请重新上传', 410)
+        sha256 = self._compute_file_hash(part_path)
+
+        upload_session = self.get_session(upload_id, user, for_update=True)
+        self._check_uploading(upload_session)
+
+        if upload_session.expected_hash and sha256 != upload_session.expected_hash:
+            self._discard(upload_session)
+            db.session.commit()
+            raise ChunkedUploadError('文件校验失败，与声明的sha256不一致', 422)
+
+        upload_session.status = UploadSessionStatus.COMPLETED
+        return upload_session, part_path, sha256
+
+    def abort(self, upload_id, user):
+        """取消上传并删除临时文件"""
+        upload_session = self.get_session(upload_id, user, for_update=True)
+        if upload_session.status == UploadSessionStatus.COMPLETED:
+            raise ChunkedUploadError('上传已完成，无法取消', 409)
+        self._discard(upload_session)
+        db.session.commit()
+
+    def _discard(self, upload_session):
+        upload_session.status = UploadSessionStatus.ABORTED
+        self.remove_part_files(upload_session.id)
+
+    def remove_part_files(self, upload_id):
+        """删除会话的临时文件、锁文件和进程异常退出时残留的分片暂存文件"""
+        part_path = self.part_path(upload_id)
+        for path in [part_path, part_path + '.lock'] + glob.glob(part_path + '.*.chunk'):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def purge_expired(self, limit=50):
+        """清理过期未完成的会话和临时文件"""
+        try:
+            expired = UploadSession.query.filter(
+                UploadSession.status == UploadSessionStatus.UPLOADING,
+                UploadSession.expires_at < datetime.utcnow()
+            ).limit(limit).with_for_update(skip_locked=True).all()
+            for upload_session in expired:
+                self._discard(upload_session)
+            db.session.commit()
+            if expired:
+                self.logger.info(f"清理过期分片上传会话 {len(expired)} 个")
+        except Exception as e:
+            db.session.rollback()
+            self.logger.warning(f"清理过期分片上传会话失败: {e}")
+
+    def remove_project_part_files(self, project_id):
+        """删除项目所有上传会话的临时文件（删除项目前调用，会话记录随项目级联删除）"""
+        upload_ids = [upload_id for (upload_id,) in db.session.query(UploadSession.id).filter(
+            UploadSession.project_id == project_id
+        )]
+        for upload_id in upload_ids:
+            self.remove_part_files(upload_id)
+        return len(upload_ids)
+
+    def purge_orphaned_part_files(self, min_age=3600):
+        """
+        删除没有未完成会话的临时文件（如会话记录已随项目删除）
+
+        Args:
+            min_age: 只删除超过该秒数未修改的文件（创建会话时临时文件先于会话记录提交）
+        """
+        prefix = os.path.join(blob_store.tmp_dir(), 'upload_')
+        cutoff = time.time() - min_age
+        files = {}
+        for path in glob.glob(prefix + '*.part*'):
+            upload_id = path[len(prefix):].split('.', 1)[0]
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    files.setdefault(upload_id, []).append(path)
+            except OSError:
+                continue
+        if not files:
+            return 0
+        try:
+            open_ids = {upload_id for (upload_id,) in db.session.query(UploadSession.id).filter(
+                UploadSession.id.in_(list(files)),
+                UploadSession.status == UploadSessionStatus.UPLOADING
+            )}
+        finally:
+            db.session.rollback()
+        removed = 0
+        for upload_id, paths in files.items():
+            if upload_id in open_ids:
+                continue
+            for path in paths:
+                if os.path.exists(path):
+                    os.remove(path)
+                    removed += 1
+        if removed:
+            self.logger.info(f"清理没有未完成会话的分片上传临时文件 {removed} 个")
+        return removed
+
+    def start(self, app):
+        """
+        启动当前进程的定期清理线程（重复调用只启动一次）
+
+        Args:
+            app: Flask应用实例
+        """
+        with self._lock:
+            if self._thread_pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._app = app
+            self._thread = threading.Thread(target=self._run, name='upload-session-purger', daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+        self.logger.info("分片上传清理线程已启动")
+
+    def _run(self):
+        while not self._stop_event.wait(self.purge_interval):
+            try:
+                with self._app.app_context():
+                    self.purge_expired()
+                    self.purge_orphaned_part_files()
+            except Exception as e:
+                self.logger.error(f"分片上传定期清理异常: {e}")
+
+
+# 全局分片上传服务实例
+chunked_upload_service = ChunkedUploadService()
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+文档处理执行器
+所有文档处理任务共享固定数量的执行线程：优先级队列让交互式重试和小文件先处理，
+并限制单个项目同时处理的文档数，避免批量上传时为每个文件创建线程、同时压垮外部文档转换服务
+"""
+
+import os
+import time
+import heapq
+import itertools
+import logging
+import threading
+from collections import deque
+
+# 任务优先级：交互式操作（用户手动重试）优先于批量任务
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 1
+
+
+class DocumentProcessingExecutor:
+    """有界文档处理执行器：优先级队列、项目并发上限、排队指标和优雅退出"""
+
+    def __init__(self, max_workers=None, per_project_limit=None):
+        self.logger = logging.getLogger(__name__)
+        self.max_workers = max_workers or int(os.environ.get('DOCUMENT_PROCESS_WORKERS', 4))
+        self.per_project_limit = per_project_limit or int(os.environ.get('DOCUMENT_PROCESS_PER_PROJECT', 2))
+        self._cond = threading.Condition()
+        self._heap = []  # [(优先级, 文件大小, 序号, 任务)]
+        self._sequence = itertools.count()
+        self._keys = set()  # 排队或执行中的任务键，相同文档不重复排队
+        self._running = {}  # {任务键: 任务}
+        self._running_by_project = {}
+        self._threads = []
+        self._threads_pid = None
+        self._shutting_down = False
+        self._waits = deque(maxlen=200)
+        self._stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'deduplicated': 0,
+            'abandoned': 0
+        }
+
+    def _ensure_workers(self):
+        """按进程延迟启动执行线程（需持有锁）"""
+        if self._threads_pid == os.getpid():
+            return
+        self._threads = []
+        self._running = {}
+        self._running_by_project = {}
+        self._threads_pid = os.getpid()
+        for index in range(self.max_workers):
+            thread = threading.Thread(target=self._worker_loop, name=f'document-processor-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, key, func, project_id=None, size=0, priority=PRIORITY_NORMAL, on_abandon=None):
+        """
+        提交文档处理任务
+
+        Args:
+            key: 任务键（如文档ID），相同键的任务在排队或执行中时不重复提交
+            func: 处理函数（无参数，需要自行进入应用上下文）
+            project_id: 所属项目ID，用于项目并发上限
+            size: 文件大小，同一优先级内小文件先处理
+            priority: 任务优先级
+            on_abandon: 服务退出时任务仍在排队的回调（无参数）
+
+        Returns:
+            bool: 是否已加入队列（重复提交或执行器正在退出时返回False）
+        """
+        with self._cond:
+            if self._shutting_down:
+                self.logger.warning(f"文档处理执行器正在退出，拒绝任务: {key}")
+                return False
+            if key in self._keys:
+                self._stats['deduplicated'] += 1
+                return False
+
+            self._ensure_workers()
+            task = {
+                'key': key,
+                'func': func,
+                'project_id': project_id,
+                'size': size or 0,
+                'priority': priority,
+                'on_abandon': on_abandon,
+                'submitted_at': time.time()
+            }
+            heapq.heappush(self._heap, (priority, task['size'], next(self._sequence), task))
+            self._keys.add(key)
+            self._stats['submitted'] += 1
+            self._cond.notify()
+        return True
+
+    def _next_task(self):
+        """取出优先级最高且所属项目未达到并发上限的任务（需持有锁）"""
+        skipped = []
+        task = None
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            project_id = entry[3]['project_id']
+            if project_id is None or self._running_by_project.get(project_id, 0) < self.per_project_limit:
+                task = entry[3]
+                break
+            skipped.append(entry)
+        for entry in skipped:
+            heapq.heappush(self._heap, entry)
+        return task
+
+    def _worker_loop(self):
+        """执行线程：循环领取任务，没有可执行任务时等待"""
+        while True:
+            with self._cond:
+                task = self._next_task()
+                while task is None:
+                    if self._shutting_down:
+                        return
+                    self._cond.wait()
+                    task = self._next_task()
+
+                project_id = task['project_id']
+                self._running[task['key']] = task
+                if project_id is not None:
+                    self._running_by_project[project_id] = self._running_by_project.get(project_id, 0) + 1
+                task['started_at'] = time.time()
+                self._waits.append(task['started_at'] - task['submitted_at'])
+
+            succeeded = False
+            try:
+                task['func']()
+                succeeded = True
+            except Exception as e:
+                self.logger.error(f"文档处理任务失败 ({task['key']}): {e}")
+            finally:
+                with self._cond:
+                    self._running.pop(task['key'], None)
+                    self._keys.discard(task['key'])
+                    if project_id is not None:
+                        remaining = self._running_by_project.get(project_id, 1) - 1
+                        if remaining > 0:
+                            self._running_by_project[project_id] = remaining
+                        else:
+                            self._running_by_project.pop(project_id, None)
+                    self._stats['completed' if succeeded else 'failed'] += 1
+                    # 同项目被限流的任务可能可以执行了
+                    self._cond.notify_all()
+
+    def get_stats(self):
+        """获取执行器指标"""
+        now = time.time()
+        with self._cond:
+            waits = sorted(self._waits)
+            queued = [entry[3] for entry in self._heap]
+            stats = dict(self._stats)
+            stats.update({
+                'max_workers': self.max_workers,
+                'per_project_limit': self.per_project_limit,
+                'queue_depth': len(queued),
+                'running': len(self._running),
+                'running_by_project': dict(self._running_by_project),
+                'oldest_queued_seconds': round(now - min(task['submitted_at'] for task in queued), 3) if queued else None,
+                'avg_wait_seconds': round(sum(waits) / len(waits), 3) if waits else None,
+                'p95_wait_seconds': round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3) if waits else None,
+                'max_wait_seconds': round(waits[-1], 3) if waits else None,
+                'shutting_down': self._shutting_down
+            })
+        return stats
+
+    def shutdown(self, timeout=None):
+        """
+        优雅退出：不再接收新任务，等待执行中的任务完成，仍在排队的任务交给其on_abandon回调处理
+
+        Args:
+            timeout: 等待执行中任务的最长秒数
+        """
+        with self._cond:
+            if self._threads_pid != os.getpid():
+                return
+            self._shutting_down = True
+            abandoned = [entry[3] for entry in self._heap]
+            self._heap = []
+            for task in abandoned:
+                self._keys.discard(task['key'])
+            self._stats['abandoned'] += len(abandoned)
+            running = len(self._running)
+            self._cond.notify_all()
+
+        self.logger.info(f"文档处理执行器退出: 等待 {running} 个执行中的任务，放弃 {len(abandoned)} 个排队任务")
+        for task in abandoned:
+            if task['on_abandon']:
+                try:
+                    task['on_abandon']()
+                except Exception as e:
+                    self.logger.error(f"处理被放弃的文档任务失败 ({task['key']}): {e}")
+
+        deadline = time.time() + timeout if timeout is not None else None
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0, deadline - time.time()))
+
+
+# 全局执行器实例
+document_executor = DocumentProcessingExecutor()
@@ -5,8 +5,10 @@
 
 import os
 import sys
+import json
 import uuid
-import threading
+import codecs
+import shutil
 import subprocess
 import requests
 from datetime import datetime
@@ -20,23 +22,205 @@ DOCX_AVAILABLE = True
 from flask import current_app
 from database import db
 from db_models import Document, DocumentStatus
+from services.document_executor import document_executor, PRIORITY_INTERACTIVE, PRIORITY_NORMAL
+from services.http_client import http_client, MultipartFileStream
+from services.blob_store import blob_store
+from utils import compute_file_hash
+
+class _JSONContentStreamWriter:
+    """
+    流式解析文档转换接口返回的JSON对象
+
+    顶层 content 字符串边接收边解码写入输出文件，不在内存中保留完整内容；
+    其他顶层字段（success、metadata、processing_time等）体积很小，解析后保存在 fields 中
+    """
+
+    # 非content字段的最大长度，超过时丢弃该字段
+    MAX_FIELD_SIZE = 1024 * 1024
+
+    def __init__(self, output, field='content'):
+        self.output = output
+        self.field = field
+        self.fields = {}
+        self.content_chars = 0
+        self._state = 'start'
+        self._pending = ''
+        self._key = None
+        self._chars = []
+        self._raw_depth = 0
+        self._raw_in_string = False
+        self._raw_escape = False
+        self._raw_size = 0
+
+    @property
+    def finished(self):
+        return self._state == 'done'
+
+    def feed(self, text):
+        """解析下一段文本（可以在任意位置截断）"""
+        buf = self._pending + text
+        self._pending = ''
+        i, n = 0, len(buf)
+        while i < n and self._state != 'done':
+            state = self._state
+            if state in ('key', 'content'):
+                i = self._consume_string(buf, i)
+                if i is None:
+                    return
+                continue
+            if state == 'raw':
+                i = self._consume_raw(buf, i)
+                continue
+
+            ch = buf[i]
+            if ch in ' \t\r\n':
+                i += 1
+                continue
+            if state == 'start':
+                if ch != '{':
+                    raise ValueError('响应不是JSON对象')
+                self._state = 'key_or_end'
+            elif state == 'key_or_end':
+                if ch == '}':
+                    self._state = 'done'
+                elif ch == '"':
+                    self._state = 'key'
+                    self._chars = []
+                else:
+                    raise ValueError(f'JSON格式错误: 意外的字符 {ch!r}')
+            elif state == 'colon':
+                if ch != ':':
+                    raise ValueError('JSON格式错误: 缺少冒号')
+                self._state = 'value'
+            elif state == 'value':
+                if ch == '"' and self._key == self.field:
+                    self._state = 'content'
+                else:
+                    self._state = 'raw'
+                    self._chars = []
+                    self._raw_depth = 0
+                    self._raw_in_string = False
+                    self._raw_escape = False
+                    self._raw_size = 0
+                    continue  # 当前字符作为原始值的第一个字符
+            elif state == 'after_value':
+                if ch == ',':
+                    self._state = 'key_or_end'
+                elif ch == '}':
+                    self._state = 'done'
+                else:
+                    raise ValueError(f'JSON格式错误: 意外的字符 {ch!r}')
+            i += 1
+
+    def _consume_string(self, buf, i):
+        """
+        解码字符串内容直到结束引号
+
+        Returns:
+            int: 继续解析的位置；转义序列被截断时返回None（剩余部分留到下次）
+        """
+        n = len(buf)
+        while i < n:
+            quote = buf.find('"', i)
+            backslash = buf.find('\\', i)
+            if quote == -1 and backslash == -1:
+                self._emit(buf[i:])
+                return n
+            if backslash == -1 or (quote != -1 and quote < backslash):
+                self._emit(buf[i:quote])
+                self._end_string()
+                return quote + 1
+
+            self._emit(buf[i:backslash])
+            if backslash + 1 >= n:
+                self._pending = buf[backslash:]
+                return None
+            if buf[backslash + 1] == 'u':
+                length = 6
+                if backslash + 6 <= n and 0xD800 <= int(buf[backslash + 2:backslash + 6], 16) <= 0xDBFF:
+                    length = 12  # 高位代理，需要和低位代理一起解码
+                if backslash + length > n:
+                    self._pending = buf[backslash:]
+                    return None
+            else:
+                length = 2
+            self._emit(json.loads('"' + buf[backslash:backslash + length] + '"'))
+            i = backslash + length
+        return n
+
+    def _emit(self, text):
+        if not text:
+            return
+        if self._state == 'content':
+            self.output.write(text)
+            self.content_chars += len(text)
+        else:
+            self._chars.append(text)
+
+    def _end_string(self):
+        if self._state == 'key':
+            self._key = ''.join(self._chars)
+            self._state = 'colon'
+        else:
+            self._state = 'after_value'
+
+    def _consume_raw(self, buf, i):
+        """收集非content字段的原始文本，遇到顶层的逗号或右花括号时解析"""
+        start = i
+        n = len(buf)
+        while i < n:
+            ch = buf[i]
+            if self._raw_in_string:
+                if self._raw_escape:
+                    self._raw_escape = False
+                elif ch == '\\':
+                    self._raw_escape = True
+                elif ch == '"':
+                    self._raw_in_string = False
+            elif ch == '"':
+                self._raw_in_string = True
+            elif ch in '{[':
+                self._raw_depth += 1
+            elif ch in '}]' and self._raw_depth > 0:
+                self._raw_depth -= 1
+            elif ch in ',}' and self._raw_depth == 0:
+                self._store_raw(buf[start:i])
+                self._state = 'key_or_end' if ch == ',' else 'done'
+                return i + 1
+            i += 1
+        self._store_raw(buf[start:], final=False)
+        return n
+
+    def _store_raw(self, text, final=True):
+        self._raw_size += len(text)
+        if self._raw_size <= self.MAX_FIELD_SIZE:
+            self._chars.append(text)
+        if final:
+            if self._raw_size <= self.MAX_FIELD_SIZE:
+                self.fields[self._key] = json.loads(''.join(self._chars))
+            self._chars = []
+
 
 class DocumentProcessor:
     """文档处理器"""
     
     def __init__(self):
         self.processed_folder = 'processed'
+        self.stream_chunk_size = int(os.environ.get('DOCUMENT_STREAM_CHUNK_SIZE', 256 * 1024))  # 与转换接口收发数据的块大小
         
-    def process_document_async(self, document_id: int, app=None):
-        """异步处理文档"""
+    def process_document_async(self, document_id: int, app=None, interactive: bool = False):
+        """
+        异步处理文档（提交到共享的文档处理执行器）
+
+        Args:
+            document_id: 文档ID
+            app: Flask应用实例，不传时使用当前应用
+            interactive: 是否为用户手动触发的操作（优先处理）
+        """
+        application = app or current_app._get_current_object()
+
         def process_in_background():
             try:
-                # 如果没有传递app实例，尝试获取当前应用实例
-                if app is None:
-                    application = current_app._get_current_object()
-                else:
-                    application = app
-
                 with application.app_context():
                     self.process_document(document_id)
             except Exception as e:
@@ -48,11 +232,6 @@ class DocumentProcessor:
 
                 # 尝试更新文档状态为失败（如果可能的话）
                 try:
-                    if app is None:
-                        application = current_app._get_current_object()
-                    else:
-                        application = app
-
                     with application.app_context():
                         from db_models import Document, DocumentStatus
                         from database import db
@@ -66,9 +245,43 @@ class DocumentProcessor:
                 except Exception as update_error:
                     logger.error(f"更新文档状态失败: {update_error}")
 
-        thread = threading.Thread(target=process_in_background)
-        thread.daemon = True
-        thread.start()
+        self.submit_document_task(document_id, process_in_background, application, interactive=interactive)
+
+    def submit_document_task(self, document_id: int, func, app, interactive: bool = False) -> bool:
+        """
+        将文档处理函数提交到共享执行器，按文档大小和交互优先级排队，并受项目并发上限限制
+
+        Args:
+            document_id: 文档ID（同一文档排队或处理中时不重复提交）
+            func: 处理函数（无参数，需要自行进入应用上下文）
+            app: Flask应用实例
+            interactive: 是否为用户手动触发的操作
+
+        Returns:
+            bool: 是否已加入队列
+        """
+        with app.app_context():
+            document = Document.query.get(document_id)
+            project_id = document.project_id if document else None
+            file_size = document.file_size if document else 0
+
+        return document_executor.submit(
+            document_id,
+            func,
+            project_id=project_id,
+            size=file_size,
+            priority=PRIORITY_INTERACTIVE if interactive else PRIORITY_NORMAL,
+            on_abandon=lambda: self._mark_processing_abandoned(document_id, app)
+        )
+
+    def _mark_processing_abandoned(self, document_id: int, app):
+        """服务退出时仍在排队的文档标记为失败，用户可以手动重试"""
+        with app.app_context():
+            document = Document.query.get(document_id)
+            if document and document.status in (DocumentStatus.UPLOADING, DocumentStatus.PROCESSING):
+                document.status = DocumentStatus.FAILED
+                document.error_message = "服务重启，文档处理已中断，请重试"
+                db.session.commit()
     
     def process_document(self, document_id: int) -> bool:
         """处理单个文档"""
@@ -102,11 +315,18 @@ class DocumentProcessor:
             document.progress = 30
             db.session.commit()
             
-            success = self._call_document_processor(input_file, processed_file_path, document)
+            # 按源文件当前内容计算哈希（记录中的哈希可能是源文件变化前的），
+            # 其他文档已处理过相同内容时直接复用处理结果
+            source_hash = compute_file_hash(input_file)
+            success = self._reuse_processed_output(document, source_hash, processed_file_path)
+            if not success:
+                success = self._call_document_processor(input_file, processed_file_path, document)
             
             if success:
                 # 更新文档状态，进度为100%（完成文件处理，待手动上传知识库）
                 document.processed_file_path = processed_file_path
+                document.source_hash = source_hash
+                document.processed_hash = compute_file_hash(processed_file_path)
                 document.processed_at = datetime.utcnow()
                 document.status = DocumentStatus.PROCESSED  # 设置为已处理状态，待手动上传知识库
                 document.progress = 100
@@ -126,6 +346,48 @@ class DocumentProcessor:
                 self._mark_processing_failed(document, str(e))
             return False
     
+    def _reuse_processed_output(self, document: Document, source_hash: str, output_file: str) -> bool:
+        """
+        查找源文件内容相同且已处理完成的文档，复制其处理结果
+
+        处理结果之后可能被单独改写，因此复制而不是链接；复制后校验哈希，不一致时放弃复用
+
+        Args:
+            document: 当前文档
+            source_hash: 源文件当前内容的哈希（不能使用记录中可能已过期的 source_hash）
+            output_file: 处理结果路径
+
+        Returns:
+            bool: 是否已复用处理结果
+        """
+        try:
+            if not source_hash:
+                return False
+            candidates = Document.query.filter(
+                Document.source_hash == source_hash,
+                Document.id != document.id,
+                Document.processed_file_path.isnot(None),
+                Document.processed_hash.isnot(None),
+                Document.status.in_([
+                    DocumentStatus.PROCESSED, DocumentStatus.UPLOADING_TO_KB, DocumentStatus.PARSING_KB,
+                    DocumentStatus.COMPLETED, DocumentStatus.KB_PARSE_FAILED
+                ])
+            ).order_by(Document.processed_at.desc()).limit(5).all()
+
+            for candidate in candidates:
+                if not os.path.exists(candidate.processed_file_path):
+                    continue
+                os.makedirs(os.path.dirname(output_file), exist_ok=True)
+                shutil.copyfile(candidate.processed_file_path, output_file)
+                if compute_file_hash(output_file) == candidate.processed_hash:
+                    current_app.logger.info(f"文档 {document.id} 复用文档 {candidate.id} 的处理结果，跳过文档转换")
+                    return True
+                os.remove(output_file)
+            return False
+        except Exception as e:
+            current_app.logger.warning(f"复用处理结果失败，继续正常处理: {e}")
+            return False
+
     def _create_processed_file_path(self, document: Document) -> str:
         """创建处理后文件的路径"""
         # 获取项目的folder_uuid
@@ -214,7 +476,13 @@ class DocumentProcessor:
     
 
     def _process_with_external_api(self, input_file: str, output_file: str, document: Document) -> bool:
-        """使用外部接口处理文件"""
+        """
+        使用外部接口处理文件
+
+        请求体按块从磁盘读取发送，响应按块接收，转换结果边解析边写入输出文件，
+        内存占用与文档大小无关；写入临时文件，成功后再替换输出文件
+        """
+        tmp_output = f"{output_file}.part"
         try:
             # 进度为50%
             document.progress = 50
@@ -229,43 +497,54 @@ class DocumentProcessor:
             current_app.logger.info(f"调用外部接口处理文件: {input_file}")
             current_app.logger.info(f"接口URL: {api_url}")
 
-            # 准备文件上传
-            with open(input_file, 'rb') as f:
-                files = {'file': (os.path.basename(input_file), f, 'application/octet-stream')}
+            # 准备文件上传（流式multipart请求体）
+            body = MultipartFileStream('file', input_file, chunk_size=self.stream_chunk_size)
 
-                # 进度为60%
-                document.progress = 60
-                db.session.commit()
+            # 进度为60%
+            document.progress = 60
+            db.session.commit()
 
-                # 调用外部接口
-                response = requests.post(api_url, files=files, timeout=300)  # 5分钟超时
+            # 调用外部接口（5分钟读超时，按每次读取计算）
+            response = http_client.post(
+                api_url, data=body, headers={'Content-Type': body.content_type},
+                timeout=(10, 300), stream=True, endpoint='converter.process'
+            )
 
+            with response:
                 # 进度为80%
                 document.progress = 80
                 db.session.commit()
 
-            # 检查响应
-            if response.status_code != 200:
-                current_app.logger.error(f"外部接口调用失败，状态码: {response.status_code}")
-                current_app.logger.error(f"响应内容: {response.text}")
-                return False
+                # 检查响应
+                if response.status_code != 200:
+                    current_app.logger.error(f"外部接口调用失败，状态码: {response.status_code}")
+                    current_app.logger.error(f"响应内容: {self._response_preview(response)}")
+                    return False
 
-            # 解析响应
-            try:
-                result = response.json()
-            except Exception as e:
-                current_app.logger.error(f"解析响应JSON失败: {e}")
-                current_app.logger.error(f"响应内容: {response.text}")
-                return False
+                # 边接收边解析，content字段直接写入临时文件
+                decoder = codecs.getincrementaldecoder('utf-8')()
+                with open(tmp_output, 'w', encoding='utf-8') as f:
+                    writer = _JSONContentStreamWriter(f)
+                    try:
+                        for chunk in response.iter_content(chunk_size=self.stream_chunk_size):
+                            writer.feed(decoder.decode(chunk))
+                        writer.feed(decoder.decode(b'', final=True))
+                    except ValueError as e:
+                        current_app.logger.error(f"解析响应JSON失败: {e}")
+                        return False
+                    if not writer.finished:
+                        current_app.logger.error("解析响应JSON失败: 响应不完整")
+                        return False
+
+            result = writer.fields
 
             # 检查处理是否成功
             if not result.get('success', False):
                 current_app.logger.error(f"外部接口处理失败: {result}")
                 return False
 
-            # 获取处理后的内容
-            content = result.get('content', '')
-            if not content:
+            # 检查处理后的内容
+            if not writer.content_chars:
                 current_app.logger.error("外部接口返回的内容为空")
                 return False
 
@@ -273,14 +552,13 @@ class DocumentProcessor:
             document.progress = 90
             db.session.commit()
 
-            # 写入处理后的内容到输出文件
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(content)
+            # 替换输出文件
+            os.replace(tmp_output, output_file)
 
             # 记录处理信息
-            metadata = result.get('metadata', {})
+            metadata = result.get('metadata') or {}
             processing_time = result.get('processing_time', 0)
-            current_app.logger.info(f"外部接口处理完成: {output_file}")
+            current_app.logger.info(f"外部接口处理完成: {output_file}（{writer.content_chars}字符）")
             current_app.logger.info(f"文件类型: {metadata.get('file_type', 'unknown')}")
             current_app.logger.info(f"处理时间: {processing_time}秒")
 
@@ -297,6 +575,18 @@ class DocumentProcessor:
             import traceback
             current_app.logger.error(f"详细错误信息: {traceback.format_exc()}")
             return False
+        finally:
+            if os.path.exists(tmp_output):
+                os.remove(tmp_output)
+
+    @staticmethod
+    def _response_preview(response, limit=2000) -> str:
+        """读取流式响应的开头部分用于日志"""
+        try:
+            data = next(response.iter_content(chunk_size=limit), b'')
+            return data[:limit].decode('utf-8', errors='replace')
+        except Exception:
+            return ''
 
     def _get_file_type(self, extension: str) -> Optional[str]:
         """根据文件扩展名获取处理类型"""
@@ -376,7 +666,8 @@ class DocumentProcessor:
                 total_count += 1
                 doc_success = True
                 
-                # 删除原始文件
+                # 删除原始文件（文件内容的引用随调用方的事务一起释放）
+                blob_store.release(document.blob_hash)
                 try:
                     if document.file_path and os.path.exists(document.file_path):
                         os.remove(document.file_path)
@@ -480,6 +771,8 @@ class DocumentProcessor:
             # 更新文档状态为已处理，进度为100%（等待手动上传知识库）
             document.status = DocumentStatus.PROCESSED  # 设置为已处理状态，等待手动上传知识库
             document.processed_file_path = processed_file_path
+            document.source_hash = compute_file_hash(input_file)
+            document.processed_hash = compute_file_hash(processed_file_path)
             document.processed_at = datetime.utcnow()
             document.progress = 100
             db.session.commit()
@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""
+外部HTTP调用客户端
+RAGFlow、Dify和文档转换服务的请求共用按主机划分的连接池（保持长连接），
+幂等请求失败时按带随机抖动的指数退避重试，主机连续失败时熔断，并按接口记录耗时分布
+"""
+
+import os
+import time
+import uuid
+import random
+import logging
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """目标主机处于熔断状态，请求未发出"""
+
+    def __init__(self, host, retry_after):
+        super().__init__(f"外部服务 {host} 暂时不可用（熔断中），请在{retry_after}秒后重试")
+        self.host = host
+        self.retry_after = retry_after
+
+
+# 默认重试的请求方法（POST可能有副作用，需要调用方显式开启）
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'DELETE'])
+# 按服务端错误处理的状态码
+RETRY_STATUS_CODES = frozenset([429, 502, 503, 504])
+# 耗时分布的桶上限（毫秒）
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+
+class MultipartFileStream:
+    """
+    按块生成的 multipart/form-data 请求体
+
+    文件内容在发送时逐块读取，不整体载入内存；实现了 __len__，requests 会设置 Content-Length
+    而不是使用分块传输编码。请求体只能发送一次，不能用于自动重试的请求
+    """
+
+    def __init__(self, field_name, file_path, filename=None, content_type='application/octet-stream',
+                 fields=None, chunk_size=1024 * 1024):
+        """
+        Args:
+            field_name: 文件字段名
+            file_path: 本地文件路径
+            filename: 上传的文件名，默认使用本地文件名
+            content_type: 文件的Content-Type
+            fields: 其他普通表单字段
+            chunk_size: 每次读取的字节数
+        """
+        self.boundary = uuid.uuid4().hex
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+        filename = (filename or os.path.basename(file_path)).replace('"', '%22')
+
+        head = ''
+        for name, value in (fields or {}).items():
+            head += (f'--{self.boundary}\r\n'
+                     f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+                     f'{value}\r\n')
+        head += (f'--{self.boundary}\r\n'
+                 f'Content-Disposition: form-data; name="{field_name}"; filename="{filename}"\r\n'
+                 f'Content-Type: {content_type}\r\n\r\n')
+        self._head = head.encode('utf-8')
+        self._tail = f'\r\n--{self.boundary}--\r\n'.encode('utf-8')
+        self._file_size = os.path.getsize(file_path)
+
+    @property
+    def content_type(self):
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self):
+        return len(self._head) + self._file_size + len(self._tail)
+
+    def __iter__(self):
+        yield self._head
+        with open(self.file_path, 'rb') as f:
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        yield self._tail
+
+
+class CircuitBreaker:
+    """单个主机的熔断器：连续失败达到阈值后打开，冷却期后放行一个探测请求"""
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.trips = 0
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.time() - self.opened_at >= self.cooldown:
+            return 'half_open'
+        return 'open'
+
+    def before_request(self):
+        """
+        Returns:
+            int: 熔断中时返回建议的重试秒数，否则返回0
+        """
+        state = self.state
+        if state == 'closed':
+            return 0
+        if state == 'half_open' and not self.probing:
+            self.probing = True
+            return 0
+        return max(1, int(self.cooldown - (time.time() - self.opened_at)))
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.probing or self.failures >= self.threshold:
+            if self.opened_at is None or self.probing:
+                self.trips += 1
+            self.opened_at = time.time()
+            self.probing = False
+
+
+class LatencyHistogram:
+    """接口耗时分布"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, elapsed_ms, error=False):
+        index = len(LATENCY_BUCKETS_MS)
+        for i, upper in enumerate(LATENCY_BUCKETS_MS):
+            if elapsed_ms <= upper:
+                index = i
+                break
+        self.buckets[index] += 1
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        if error:
+            self.errors += 1
+
+    def percentile(self, ratio):
+        """按桶估算分位数（返回所在桶的上限）"""
+        if not self.count:
+            return None
+        target = self.count * ratio
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= target:
+                return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else round(self.max_ms, 1)
+        return round(self.max_ms, 1)
+
+    def to_dict(self):
+        labels = [f"le_{upper}ms" for upper in LATENCY_BUCKETS_MS] + ['le_inf']
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'avg_ms': round(self.total_ms / self.count, 1) if self.count else None,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'max_ms': round(self.max_ms, 1) if self.count else None,
+            'buckets': dict(zip(labels, self.buckets))
+        }
+
+
+class HTTPClient:
+    """共享的外部HTTP客户端"""
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.pool_maxsize = int(os.environ.get('HTTP_POOL_MAXSIZE', 20))
+        self.max_retries = int(os.environ.get('HTTP_MAX_RETRIES', 2))
+        self.backoff_base = float(os.environ.get('HTTP_RETRY_BACKOFF_SECONDS', 0.5))
+        self.backoff_max = float(os.environ.get('HTTP_RETRY_BACKOFF_MAX_SECONDS', 8))
+        self.breaker_threshold = int(os.environ.get('HTTP_BREAKER_THRESHOLD', 5))
+        self.breaker_cooldown = int(os.environ.get('HTTP_BREAKER_COOLDOWN_SECONDS', 30))
+        self._lock = threading.Lock()
+        self._sessions = {}  # {主机: Session}
+        self._sessions_pid = None
+        self._breakers = {}  # {主机: CircuitBreaker}
+        self._histograms = {}  # {接口名: LatencyHistogram}
+
+    @staticmethod
+    def _host_key(url):
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def _get_session(self, host):
+        """按进程、按主机创建Session，fork后的子进程不复用父进程的连接"""
+        with self._lock:
+            if self._sessions_pid != os.getpid():
+                self._sessions = {}
+                self._sessions_pid = os.getpid()
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize)
+                session.mount(host, adapter)
+                self._sessions[host] = session
+            return session
+
+    def _get_breaker(self, host):
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers.setdefault(host, CircuitBreaker(self.breaker_threshold, self.breaker_cooldown))
+        return breaker
+
+    def _observe(self, endpoint, elapsed_ms, error):
+        with self._lock:
+            histogram = self._histograms.get(endpoint)
+            if histogram is None:
+                histogram = self._histograms[endpoint] = LatencyHistogram()
+            histogram.observe(elapsed_ms, error)
+
+    def _backoff(self, attempt):
+        """第attempt次重试前的等待时间（指数退避加全抖动）"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def request(self, method, url, endpoint=None, retries=None, **kwargs):
+        """
+        发送请求
+
+        Args:
+            method: 请求方法
+            url: 请求地址
+            endpoint: 耗时统计使用的接口名，默认为 方法 + 主机
+            retries: 最大重试次数，默认幂等方法使用 HTTP_MAX_RETRIES，其他方法不重试
+            **kwargs: 透传给 requests 的参数（timeout、json、files、stream等）
+
+        Returns:
+            requests.Response
+
+        Raises:
+            CircuitOpenError: 目标主机处于熔断状态
+            requests.exceptions.RequestException: 重试后仍然失败
+        """
+        method = method.upper()
+        host = self._host_key(url)
+        endpoint = endpoint or f"{method} {host}"
+        if retries is None:
+            retries = self.max_retries if method in IDEMPOTENT_METHODS else 0
+
+        session = self._get_session(host)
+        attempt = 0
+        while True:
+            with self._lock:
+                retry_after = self._get_breaker(host).before_request()
+            if retry_after:
+                self._observe(endpoint, 0, True)
+                raise CircuitOpenError(host, retry_after)
+
+            start = time.time()
+            try:
+                response = session.request(method, url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                self._record(host, endpoint, start, failed=True)
+                if attempt < retries:
+                    delay = self._backoff(attempt)
+                    self.logger.warning(f"请求 {endpoint} 失败，{delay:.2f}秒后重试（第{attempt + 1}次）: {e}")
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+                raise
+            except Exception:
+                # 非网络错误（如参数错误）不计入熔断，但需要释放探测名额
+                with self._lock:
+                    self._get_breaker(host).probing = False
+                raise
+
+            failed = response.status_code >= 500 or response.status_code == 429
+            self._record(host, endpoint, start, failed=failed)
+            if failed and response.status_code in RETRY_STATUS_CODES and attempt < retries:
+                delay = self._backoff(attempt)
+                self.logger.warning(f"请求 {endpoint} 返回 {response.status_code}，{delay:.2f}秒后重试（第{attempt + 1}次）")
+                response.close()
+                time.sleep(delay)
+                attempt += 1
+                continue
+            return response
+
+    def _record(self, host, endpoint, start, failed):
+        """记录耗时并更新熔断器（流式响应记录的是收到响应头的时间）"""
+        self._observe(endpoint, (time.time() - start) * 1000, failed)
+        with self._lock:
+            breaker = self._get_breaker(host)
+            if failed:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def get_stats(self):
+        """获取各主机熔断状态和各接口耗时分布"""
+        with self._lock:
+            return {
+                'hosts': {
+                    host: {
+                        'state': breaker.state,
+                        'consecutive_failures': breaker.failures,
+                        'trips': breaker.trips
+                    } for host, breaker in self._breakers.items()
+                },
+                'endpoints': {endpoint: histogram.to_dict() for endpoint, histogram in self._histograms.items()},
+                'pool_maxsize': self.pool_maxsize
+            }
+
+
+# 全局客户端实例
+http_client = HTTPClient()
@@ -6,15 +6,26 @@
 import requests
 import logging
 import os
+import time
 import uuid
-from typing import Optional, Dict, Any
+import threading
+from typing import Optional, Dict, Any, List
 from flask import current_app
 
 from database import db
 from db_models import Project, User, Document, DocumentStatus
+from services.http_client import http_client
+from utils import compute_file_hash
 
 logger = logging.getLogger(__name__)
 
+# 数据集文档列表缓存 {dataset_id: (过期时间, 文档列表)}
+LISTING_CACHE_TTL = float(os.environ.get('RAG_LISTING_CACHE_TTL', 5))
+_listing_cache = {}
+_listing_cache_lock = threading.Lock()
+# 批量删除时每次请求的文档数
+DELETE_BATCH_SIZE = int(os.environ.get('RAG_DELETE_BATCH_SIZE', 50))
+
 class KnowledgeBaseService:
     """知识库服务类"""
     
@@ -98,7 +109,7 @@ class KnowledgeBaseService:
             }
             
             logger.info(f"调用RAG API创建数据集: {name}")
-            response = requests.post(url, headers=headers, json=data, timeout=30)
+            response = http_client.post(url, headers=headers, json=data, timeout=30, endpoint='ragflow.create_dataset')
             response.raise_for_status()
             
             result = response.json()
@@ -188,8 +199,9 @@ class KnowledgeBaseService:
                 db.session.commit()
                 return False
             
-            # 保存RAG文档ID
+            # 保存RAG文档ID，记录上传的内容哈希
             document.rag_document_id = rag_document_id
+            document.kb_synced_hash = document.processed_hash
             
             # 更新状态为知识库解析中
             document.status = DocumentStatus.PARSING_KB
@@ -259,12 +271,13 @@ class KnowledgeBaseService:
                 }
                 
                 logger.info(f"上传文件到数据集: {file_name}")
-                response = requests.post(url, headers=headers, files=files, timeout=60)
+                response = http_client.post(url, headers=headers, files=files, timeout=60, endpoint='ragflow.upload_document')
                 response.raise_for_status()
                 
                 result = response.json()
                 if result.get("code") == 0:
                     document_id = result["data"][0]["id"]
+                    self.invalidate_dataset_listing(dataset_id)
                     logger.info(f"成功上传文件: {file_name}, ID: {document_id}")
                     return document_id
                 else:
@@ -280,96 +293,66 @@ class KnowledgeBaseService:
     
     def _start_parsing_status_check(self, dataset_id: str, document_id: str, doc_db_id: int):
         """
-        启动后台任务检查解析状态
-        
+        通知解析状态轮询器有新文档进入解析状态
+        轮询器从数据库读取所有解析中的文档，按数据集合并查询，不再为每个文档启动线程
+
         Args:
             dataset_id: 数据集ID
             document_id: RAG文档ID
             doc_db_id: 数据库中的文档ID
         """
-        import threading
-        from flask import current_app
-        
-        # 保存当前应用上下文
-        app = current_app._get_current_object()
-        
-        def check_parsing_status():
-            """后台检查解析状态"""
-            with app.app_context():
-                while True:
-                    try:
-                        import time
-                        time.sleep(5)
-
-                        parsing_status = self._check_document_parsing_status(dataset_id, document_id)
-
-                        if parsing_status is None:
-                            continue
-                        elif parsing_status is True:
-                            self._update_document_parsing_complete(doc_db_id)
-                            break
-                        elif parsing_status == "failed":
-                            self._update_document_parsing_failed(doc_db_id, "知识库解析失败")
-                            break
-                        # 未完成则继续等待
-                    except Exception as e:
-                        logger.error(f"检查解析状态异常: {e}")
-                        continue
-        
-        # 启动后台线程
-        thread = threading.Thread(target=check_parsing_status)
-        thread.daemon = True
-        thread.start()
-    
-    def _check_document_parsing_status(self, dataset_id: str, document_id: str) -> Optional[bool]:
+        from services.parse_status_poller import parse_status_poller
+
+        parse_status_poller.start(current_app._get_current_object())
+        parse_status_poller.wake()
+        logger.info(f"文档 {doc_db_id} ({document_id}) 已加入数据集 {dataset_id} 的解析状态轮询")
+
+    @staticmethod
+    def _classify_parsing_status(doc: Dict[str, Any]):
         """
-        检查文档解析状态
-        
-        Args:
-            dataset_id: 数据集ID
-            document_id: 文档ID
-            
+        根据RAGFlow文档信息判断解析状态
+
         Returns:
             True: 解析完成
+            "failed": 解析失败
             False: 解析未完成
-            None: 查询失败
         """
-        try:
-            list_url = f"{self.rag_api_base_url}/api/v1/datasets/{dataset_id}/documents"
-            headers = {"Authorization": f"Bearer {self.rag_api_key}"}
-            params = {"page_size": 100}
-
-            response = requests.get(list_url, headers=headers, params=params, timeout=30)
-            response.raise_for_status()
-
-            result = response.json()
-            if result.get("code") != 0:
-                logger.error(f"查询文档列表失败: {result.get('message')}")
-                return None
-
-            docs = result.get("data", {}).get("docs", [])
-            target_doc = None
-            for doc in docs:
-                if doc.get("id") == document_id:
-                    target_doc = doc
-                    break
+        progress = doc.get("progress", 0.0)
+        run_status = doc.get("run", "0")
+        # 解析完成
+        if progress >= 1.0 and run_status == 'DONE':
+            return True
+        # 解析失败（RAGFlow后端定义的失败状态）
+        if run_status in ['FAILED', 'ERROR', 'CANCEL']:
+            return "failed"
+        # 解析未完成
+        return False
 
-            if not target_doc:
-                logger.error(f"未找到文档: {document_id}")
-                return None
+    def get_documents_parsing_status(self, dataset_id: str, document_ids) -> Optional[Dict[str, Any]]:
+        """
+        一次查询数据集中多个文档的解析状态（按创建时间倒序分页，找齐目标文档即停止）
 
-            progress = target_doc.get("progress", 0.0)
-            run_status = target_doc.get("run", "0")
-            logger.info(f"文档 {document_id} 解析进度: {progress}, 运行状态: {run_status}")
+        Args:
+            dataset_id: 数据集ID
+            document_ids: RAG文档ID集合
 
-            # 解析完成
-            if progress >= 1.0 and run_status == 'DONE':
-                return True
-            # 解析失败（RAGFlow后端定义的失败状态）
-            if run_status in ['FAILED', 'ERROR', 'CANCEL']:
-                return "failed"
-            # 解析未完成
-            return False
+        Returns:
+            {文档ID: (解析状态, 进度)}，未找到的文档不包含在结果中；查询失败返回None
+        """
+        try:
+            remaining = set(document_ids)
+            statuses = {}
+            for doc in self.iter_dataset_documents(dataset_id, newest_first=True):
+                doc_id = doc.get("id")
+                if doc_id in remaining:
+                    remaining.discard(doc_id)
+                    statuses[doc_id] = (self._classify_parsing_status(doc), doc.get("progress", 0.0))
+                    if not remaining:
+                        break
+
+            if remaining:
+                logger.warning(f"数据集 {dataset_id} 中未找到文档: {sorted(remaining)}")
+            return statuses
 
         except requests.exceptions.RequestException as e:
             logger.error(f"查询解析状态请求失败: {e}")
@@ -377,83 +360,126 @@ class KnowledgeBaseService:
         except Exception as e:
             logger.error(f"查询解析状态异常: {e}")
             return None
-    
-    def _update_document_parsing_complete(self, doc_db_id: int):
+
+    def iter_dataset_documents(self, dataset_id: str, page_size: int = 100, newest_first: bool = False):
         """
-        更新文档解析完成状态
-        
+        分页遍历数据集中的全部文档
+
         Args:
-            doc_db_id: 数据库中的文档ID
+            dataset_id: 数据集ID
+            page_size: 每页文档数
+            newest_first: 是否按创建时间倒序（查找最近上传的文档时可以提前结束）
+
+        Yields:
+            dict: RAGFlow文档信息
+
+        Raises:
+            requests.exceptions.RequestException: 请求失败
+            Exception: 接口返回错误
         """
-        try:
-            from db_models import Document, DocumentStatus
-            from flask import current_app
-            
-            # 在后台线程中需要创建新的应用上下文
-            with current_app.app_context():
-                # 创建新的数据库会话
-                from sqlalchemy import create_engine
-                from sqlalchemy.orm import sessionmaker
-                
-                engine = create_engine(current_app.config['SQLALCHEMY_DATABASE_URI'])
-                Session = sessionmaker(bind=engine)
-                session = Session()
-                
-                try:
-                    document = session.query(Document).get(doc_db_id)
-                    if document:
-                        document.status = DocumentStatus.COMPLETED
-                        document.progress = 100
-                        document.error_message = None
-                        session.commit()
-                        logger.info(f"文档 {doc_db_id} 解析完成")
-                    else:
-                        logger.error(f"未找到文档: {doc_db_id}")
-                        
-                finally:
-                    session.close()
-                
-        except Exception as e:
-            logger.error(f"更新文档解析完成状态失败: {e}")
-    
-    def _update_document_parsing_failed(self, doc_db_id: int, error_message: str):
+        self._get_config()
+        list_url = f"{self.rag_api_base_url}/api/v1/datasets/{dataset_id}/documents"
+        headers = {"Authorization": f"Bearer {self.rag_api_key}"}
+
+        page = 1
+        while True:
+            params = {"page": page, "page_size": page_size}
+            if newest_first:
+                params.update({"orderby": "create_time", "desc": "true"})
+            response = http_client.get(list_url, headers=headers, params=params, timeout=30, endpoint='ragflow.list_documents')
+            response.raise_for_status()
+
+            result = response.json()
+            if result.get("code") != 0:
+                raise Exception(f"查询文档列表失败: {result.get('message')}")
+
+            data = result.get("data", {})
+            docs = data.get("docs", [])
+            for doc in docs:
+                yield doc
+
+            total = data.get("total")
+            if len(docs) < page_size or (total is not None and page * page_size >= total):
+                break
+            page += 1
+
+    def list_dataset_documents(self, dataset_id: str, use_cache: bool = True) -> List[Dict[str, Any]]:
         """
-        更新文档解析失败状态
-        
+        获取数据集中的全部文档，短时间内的重复查询（如同一请求中的清理和解析状态检查）复用缓存
+
         Args:
-            doc_db_id: 数据库中的文档ID
-            error_message: 错误消息
+            dataset_id: 数据集ID
+            use_cache: 是否使用缓存
+
+        Returns:
+            文档信息列表
         """
-        try:
-            from db_models import Document, DocumentStatus
-            from flask import current_app
+        now = time.time()
+        if use_cache:
+            with _listing_cache_lock:
+                cached = _listing_cache.get(dataset_id)
+                if cached and cached[0] > now:
+                    return list(cached[1])
+
+        docs = list(self.iter_dataset_documents(dataset_id))
+        with _listing_cache_lock:
+            _listing_cache[dataset_id] = (now + LISTING_CACHE_TTL, docs)
+        return list(docs)
+
+    @staticmethod
+    def invalidate_dataset_listing(dataset_id: str, removed_ids=None):
+        """
+        更新数据集文档列表缓存
 
-            # 在后台线程中需要创建新的应用上下文
-            with current_app.app_context():
-                # 创建新的数据库会话
-                from sqlalchemy import create_engine
-                from sqlalchemy.orm import sessionmaker
+        Args:
+            dataset_id: 数据集ID
+            removed_ids: 已删除的文档ID，提供时只从缓存中移除这些文档，否则丢弃整个缓存
+        """
+        with _listing_cache_lock:
+            cached = _listing_cache.get(dataset_id)
+            if not cached:
+                return
+            if removed_ids is None:
+                del _listing_cache[dataset_id]
+            else:
+                removed = set(removed_ids)
+                _listing_cache[dataset_id] = (cached[0], [doc for doc in cached[1] if doc.get("id") not in removed])
 
-                engine = create_engine(current_app.config['SQLALCHEMY_DATABASE_URI'])
-                Session = sessionmaker(bind=engine)
-                session = Session()
+    def delete_dataset_documents(self, dataset_id: str, document_ids) -> int:
+        """
+        批量删除数据集中的文档（每批一次DELETE请求）
 
-                try:
-                    document = session.query(Document).get(doc_db_id)
-                    if document:
-                        document.status = DocumentStatus.KB_PARSE_FAILED
-                        document.progress = 80
-                        document.error_message = error_message
-                        session.commit()
-                        logger.warning(f"文档 {doc_db_id} 知识库解析失败: {error_message}")
-                    else:
-                        logger.error(f"未找到文档: {doc_db_id}")
-
-                finally:
-                    session.close()
+        Args:
+            dataset_id: 数据集ID
+            document_ids: RAG文档ID列表
 
-        except Exception as e:
-            logger.error(f"更新文档解析失败状态失败: {e}")
+        Returns:
+            成功删除的文档数
+        """
+        self._get_config()
+        url = f"{self.rag_api_base_url}/api/v1/datasets/{dataset_id}/documents"
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.rag_api_key}"
+        }
+
+        document_ids = list(document_ids)
+        deleted = 0
+        for start in range(0, len(document_ids), DELETE_BATCH_SIZE):
+            batch = document_ids[start:start + DELETE_BATCH_SIZE]
+            try:
+                response = http_client.delete(url, headers=headers, json={"ids": batch}, timeout=30, endpoint='ragflow.delete_documents')
+                response.raise_for_status()
+                result = response.json()
+                if result.get("code") == 0:
+                    deleted += len(batch)
+                    self.invalidate_dataset_listing(dataset_id, batch)
+                    logger.info(f"成功批量删除 {len(batch)} 个文档")
+                else:
+                    logger.error(f"批量删除文档失败: {result.get('message')}, 文档: {batch}")
+            except requests.exceptions.RequestException as e:
+                logger.error(f"批量删除文档请求失败: {e}, 文档: {batch}")
+        return deleted
 
     def _parse_document_in_dataset(self, dataset_id: str, document_id: str) -> bool:
         """
@@ -477,7 +503,7 @@ class KnowledgeBaseService:
             }
             
             logger.info(f"触发文档解析: {document_id}")
-            response = requests.post(url, headers=headers, json=data, timeout=30)
+            response = http_client.post(url, headers=headers, json=data, timeout=30, endpoint='ragflow.parse_documents')
             response.raise_for_status()
             
             result = response.json()
@@ -568,12 +594,13 @@ class KnowledgeBaseService:
             }
             
             logger.info(f"调用RAG API删除数据集: {dataset_id}")
-            response = requests.delete(url, headers=headers, json=data, timeout=30)
+            response = http_client.delete(url, headers=headers, json=data, timeout=30, endpoint='ragflow.delete_dataset')
             response.raise_for_status()
             
             result = response.json()
             if result.get("code") == 0:
                 logger.info(f"成功删除数据集: {dataset_id}")
+                self.invalidate_dataset_listing(dataset_id)
                 return True
             else:
                 logger.error(f"删除数据集失败: {result.get('message')}")
@@ -648,38 +675,14 @@ class KnowledgeBaseService:
         Returns:
             是否删除成功
         """
-        try:
-            url = f"{self.rag_api_base_url}/api/v1/datasets/{dataset_id}/documents"
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {self.rag_api_key}"
-            }
-            data = {
-                "ids": [document_id]
-            }
-            
-            logger.info(f"调用RAG API删除文档: {document_id}")
-            response = requests.delete(url, headers=headers, json=data, timeout=30)
-            response.raise_for_status()
-            
-            result = response.json()
-            if result.get("code") == 0:
-                logger.info(f"成功删除文档: {document_id}")
-                return True
-            else:
-                logger.error(f"删除文档失败: {result.get('message')}")
-                return False
-                
-        except requests.exceptions.RequestException as e:
-            logger.error(f"删除文档请求失败: {e}")
-            return False
-        except Exception as e:
-            logger.error(f"删除文档异常: {e}")
-            return False
+        logger.info(f"调用RAG API删除文档: {document_id}")
+        return self.delete_dataset_documents(dataset_id, [document_id]) == 1
 
     def rebuild_knowledge_base_for_project(self, project_id: int, user_id: int) -> bool:
         """
-        重建项目的知识库
+        重建项目的知识库（按内容哈希增量重建）
+        只重新转换源文件有变化的文档，只重新上传处理后内容有变化或不在知识库中的文档，
+        只删除知识库中不再对应任何文档的孤立文件
 
         Args:
             project_id: 项目ID
@@ -710,57 +713,83 @@ class KnowledgeBaseService:
 
             logger.info(f"开始重建项目 {project.name} 的知识库")
 
-            # 1. 删除现有知识库（如果存在）
-            if project.id:
-                logger.info(f"删除现有知识库: {project.dataset_id}")
-                self.delete_knowledge_base(project.id)
+            # 1. 获取知识库中现有的文档，知识库不存在时创建新知识库
+            rag_document_ids = set()
+            if project.dataset_id:
+                try:
+                    rag_document_ids = {doc.get("id") for doc in self.list_dataset_documents(project.dataset_id, use_cache=False)}
+                except requests.exceptions.RequestException:
+                    raise
+                except Exception as e:
+                    logger.warning(f"读取知识库 {project.dataset_id} 失败，将创建新知识库: {e}")
+                    project.dataset_id = None
+                    project.knowledge_base_name = None
+                    db.session.commit()
 
-            # 2. 重置项目的知识库信息
-            project.dataset_id = None
-            project.knowledge_base_name = None
+            if not project.dataset_id:
+                if not self.create_knowledge_base_for_project(project.id, user_id):
+                    logger.error("创建新知识库失败")
+                    return False
+            dataset_id = project.dataset_id
 
-            # 3. 获取项目的所有文档
+            # 2. 按内容哈希比对每个文档需要的操作
             documents = Document.query.filter_by(project_id=project.id).all()
-
-            # 4. 重置所有文档状态为处理中，并删除processed文件
+            kept_rag_ids = set()
+            tasks = []  # [(文档ID, 是否重新转换, 知识库中的旧文档是否可复用)]
             for doc in documents:
-                # 重置文档状态
-                doc.status = DocumentStatus.PROCESSING
-                doc.processed_file_path = None
-                doc.processing_progress = 0
-                doc.error_message = None
-
-                # 删除processed文件夹中的对应文件
-                if doc.processed_file_path and os.path.exists(doc.processed_file_path):
-                    try:
-                        os.remove(doc.processed_file_path)
-                        logger.info(f"删除processed文件: {doc.processed_file_path}")
-                    except Exception as e:
-                        logger.warning(f"删除processed文件失败: {e}")
-
-            # 5. 提交数据库更改
+                source_hash = compute_file_hash(doc.file_path)
+                if not source_hash:
+                    # 无法重新处理，但记录仍指向知识库中的文档，保留该文档不作为孤立文件删除
+                    if doc.rag_document_id in rag_document_ids:
+                        kept_rag_ids.add(doc.rag_document_id)
+                    logger.warning(f"源文件不存在，跳过文档: {doc.name} (ID: {doc.id})")
+                    continue
+
+                processed_hash = compute_file_hash(doc.processed_file_path)
+                reconvert = (source_hash != doc.source_hash or not processed_hash or
+                             processed_hash != doc.processed_hash)
+                in_kb = bool(doc.rag_document_id) and doc.rag_document_id in rag_document_ids
+                synced = in_kb and doc.kb_synced_hash is not None and doc.kb_synced_hash == doc.processed_hash
+
+                if in_kb:
+                    # 重新转换后内容可能不变，旧文档先保留，由重建任务决定是否替换
+                    kept_rag_ids.add(doc.rag_document_id)
+                if not reconvert and synced:
+                    if doc.status in (DocumentStatus.FAILED, DocumentStatus.KB_PARSE_FAILED):
+                        # 内容未变但上次解析失败，重新上传
+                        tasks.append((doc.id, False, False))
+                    continue
+                tasks.append((doc.id, reconvert, synced))
+
+            # 3. 删除知识库中的孤立文件
+            orphan_ids = rag_document_ids - kept_rag_ids
+            if orphan_ids:
+                deleted = self.delete_dataset_documents(dataset_id, orphan_ids)
+                logger.info(f"删除知识库中的孤立文件 {deleted}/{len(orphan_ids)} 个")
+
+            # 4. 变化的文档提交到文档处理执行器
+            from services.document_processor import document_processor
+
+            reconvert_ids = [doc_id for doc_id, reconvert, _ in tasks if reconvert]
+            # 文档已在内存中，通过ORM修改（各文档原状态不同，统计计数器按ORM事件增量维护）
+            reconvert_set = set(reconvert_ids)
+            for doc in documents:
+                if doc.id in reconvert_set:
+                    doc.status = DocumentStatus.PROCESSING
+                    doc.progress = 0
+                    doc.error_message = None
             db.session.commit()
 
-            # 6. 创建新的知识库
-            dataset_id = self.create_knowledge_base_for_project(project.id, user_id)
-            if not dataset_id:
-                logger.error("创建新知识库失败")
-                return False
-
-            # 7. 启动文档重新处理（异步）
-            from services.document_processor import DocumentProcessor
-
-            processor = DocumentProcessor()
-
-            # 获取当前应用实例，用于传递给异步线程
             app = current_app._get_current_object()
-
-            for doc in documents:
-                logger.info(f"启动文档重新处理: {doc.name} (ID: {doc.id})")
-                # 使用改进的异步处理方法，传递应用实例
-                processor.process_document_async(doc.id, app)
-
-            logger.info(f"知识库重建任务启动成功，项目: {project.name}")
+            for doc_id, reconvert, synced in tasks:
+                document_processor.submit_document_task(
+                    doc_id,
+                    lambda doc_id=doc_id, reconvert=reconvert, synced=synced: self._rebuild_document(app, dataset_id, doc_id, reconvert, synced),
+                    app
+                )
+
+            logger.info(f"知识库重建任务启动成功，项目: {project.name}，"
+                        f"需要处理 {len(tasks)}/{len(documents)} 个文档（其中重新转换 {len(reconvert_ids)} 个）")
             return True
 
         except Exception as e:
@@ -768,5 +797,43 @@ class KnowledgeBaseService:
             db.session.rollback()
             return False
 
+    def _rebuild_document(self, app, dataset_id: str, doc_id: int, reconvert: bool, synced: bool):
+        """
+        重建单个文档：按需重新转换，处理后内容与知识库中一致时直接复用，否则替换知识库中的旧文档
+
+        Args:
+            app: Flask应用实例
+            dataset_id: 数据集ID
+            doc_id: 文档ID
+            reconvert: 是否需要重新转换源文件
+            synced: 知识库中的旧文档是否与之前的处理结果一致
+        """
+        from services.document_processor import document_processor
+
+        with app.app_context():
+            if reconvert and not document_processor.process_document(doc_id):
+                return
+
+            document = Document.query.get(doc_id)
+            if not document:
+                return
+
+            if synced and document.kb_synced_hash == document.processed_hash:
+                # 重新转换后内容未变，知识库中的文档仍然有效
+                document.status = DocumentStatus.COMPLETED
+                document.progress = 100
+                document.error_message = None
+                db.session.commit()
+                logger.info(f"文档 {document.name} 内容未变化，复用知识库中的文档")
+                return
+
+            if document.rag_document_id:
+                self.delete_dataset_documents(dataset_id, [document.rag_document_id])
+                document.rag_document_id = None
+                document.kb_synced_hash = None
+                db.session.commit()
+
+            self.upload_document_to_knowledge_base(document.project_id, doc_id)
+
 # 全局服务实例
 knowledge_base_service = KnowledgeBaseService()
@@ -0,0 +1,514 @@
+# -*- coding: utf-8 -*-
+"""
+Markdown后处理引擎
+预编译全部正则，按行切分一次后将各个修复步骤串联为流式处理，
+输出与原 MarkdownPostProcessor 和 MarkdownToPDFConverter 中逐步处理的结果逐字节一致（金样见 tests/fixtures/markdown）
+"""
+
+import re
+import logging
+from collections import deque
+
+try:
+    from services.stream_buffer import ChunkBuffer
+except ImportError:
+    # 作为独立脚本运行时
+    from stream_buffer import ChunkBuffer
+
+logger = logging.getLogger(__name__)
+
+
+# ---------- 报告内容后处理（MarkdownPostProcessor.process）使用的模式 ----------
+
+# 字面量 \n、\r\n 统一为换行符，同时移除代码块标记（标记后的换行按统一后的换行处理）
+_PRELUDE_RE = re.compile(r'\r?\\n|\r?\n|```[a-zA-Z]*(?:\r?\\n|\r?\n)?')
+# 标题行前后添加换行符
+_HEADING_ISOLATE_RE = re.compile(r'^(\s*#{1,6}\s.*)$', re.MULTILINE)
+_NEWLINES_3_RE = re.compile(r'\n{3,}')
+_EXTRA_BLANK_LINES_RE = re.compile(r'\n\s*\n\s*\n+')
+_CODE_BLOCK_BEFORE_RE = re.compile(r'([^\n])\n```')
+_CODE_BLOCK_AFTER_RE = re.compile(r'```\n([^\n])')
+_HEADING_SPLIT_RE = re.compile(r'^(#+)(.*)$')
+_LIST_MARKERS = ('- ', '* ', '+ ')
+_TABLE_SEPARATOR_CHARS = frozenset('-|: ')
+
+# ---------- HTML转换前预处理（MarkdownToPDFConverter）使用的模式 ----------
+
+_FENCE_MARKDOWN_RE = re.compile(r'```markdown\s*\n', re.IGNORECASE)
+_FENCE_LINE_END_RE = re.compile(r'```\s*$', re.MULTILINE)
+_FENCE_LANG_RE = re.compile(r'```[\w]*\s*\n', re.IGNORECASE)
+_FENCE_PLAIN_RE = re.compile(r'```\s*\n', re.IGNORECASE)
+_CONCLUSION_RE = re.compile(r'^\s+\*\*结论：\*\*\s*$')
+_CONCLUSION_ITEM_RE = re.compile(r'^\s+(\d+\.\s.*)')
+_NUMBERED_HEADING_RE = re.compile(r'^(\s*)(\d+)\.\s*\*\*(.*?)\*\*\s*$')
+_NUMBERED_HEADING_COLON_RE = re.compile(r'^(\s*)(\d+)\.\s*\*\*(.*?)\*\*：\s*$')
+_LEADING_NEWLINES_RE = re.compile(r'^\n+')
+_TRAILING_NEWLINES_RE = re.compile(r'\n+$')
+_BOLD_NUMBERED_ITEM_RE = re.compile(r'^\d+\.\s+\*\*[^*]+\*\*\s*$')
+_BOLD_NUMBERED_ITEM_SPLIT_RE = re.compile(r'^(\d+)\.\s+\*\*([^*]+)\*\*\s*$')
+_CONVERTED_HEADING_RE = re.compile(r'#####\s+\d+\.')
+_MERMAID_NODE_PREFIXES = ('A[', 'B[', 'C[', 'D[', 'E[', 'F[')
+
+# 数字加粗标题中表明是章节标题的关键词
+SECTION_KEYWORDS = (
+    # 分析类
+    '分析', '评估', '建议', '策略', '方案', '计划', '措施',
+    '优化', '管理', '风险', '融资', '诊断', '结论', '总结',
+    '现状', '问题', '对策', '路径', '升级', '重组', '处置',
+    # 业务类
+    '资本', '治理', '产品', '创新', '能力', '储备', '体系',
+    '资质', '背书', '竞争', '对标', '监测', '供应链', '集中度',
+    '验证', '适配', '结构', '市场', '矩阵', '壁垒', '压力',
+    '波动', '瓶颈', '短期', '中期', '长期', '合规', '稳定',
+    # 财务类
+    '流动性', '盈利', '运营', '效率', '成本', '收入', '负债',
+    '资产', '现金流', '偿债', '投资', '回报',
+    # 其他重要词汇
+    '查询', '显示', '网络', '舆情', '客户', '技术', '专利',
+    '认证', '荣誉', '引入', '延伸', '研发'
+)
+
+
+def _prelude_replace(match):
+    """代码块标记替换为空，换行符统一为\\n"""
+    return '' if match.group(0)[0] == '`' else '\n'
+
+
+def _ends_with_colon(line):
+    """判断行是否以中文或英文冒号结尾"""
+    stripped = line.strip()
+    return stripped.endswith('：') or stripped.endswith(':')
+
+
+class MarkdownEngine:
+    """Markdown后处理引擎"""
+
+    # ---------- 报告内容后处理 ----------
+
+    def postprocess(self, content):
+        """
+        报告内容后处理，结果与原 MarkdownPostProcessor 的分步处理一致
+
+        Args:
+            content: 原始Markdown内容
+
+        Returns:
+            处理后的Markdown内容
+        """
+        if not content:
+            return content
+
+        # 换行统一、代码块标记移除、标题隔离、连续空行合并
+        content = _PRELUDE_RE.sub(_prelude_replace, content)
+        if '```' in content:
+            content = content.replace('```', '')
+        content = _HEADING_ISOLATE_RE.sub(r'\n\1\n', content)
+        content = _NEWLINES_3_RE.sub('\n\n', content)
+
+        # 表格、列表、标题在同一次逐行扫描中完成
+        lines = content.split('\n')
+        content = '\n'.join(self._iter_postprocessed_lines(lines))
+
+        # 清理多余空行，修复代码块前后的空行
+        content = _EXTRA_BLANK_LINES_RE.sub('\n\n', content).strip()
+        if '```' in content:
+            content = _CODE_BLOCK_BEFORE_RE.sub(r'\1\n\n```', content)
+            content = _CODE_BLOCK_AFTER_RE.sub(r'```\n\n\1', content)
+        return content
+
+    def _iter_postprocessed_lines(self, lines):
+        """逐行处理表格块，并对每个输出行应用列表和标题修复"""
+        fix_line = self._fix_list_and_heading
+        line_count = len(lines)
+        i = 0
+        while i < line_count:
+            line = lines[i].strip()
+
+            # 检测可能的表格行（包含 | 符号）
+            if '|' in line and self._is_potential_table_row(line):
+                table_lines = self._extract_table_block(lines, i)
+                if table_lines:
+                    for table_line in self._process_table_block(table_lines):
+                        yield fix_line(table_line)
+                    i += len(table_lines)
+                    continue
+
+            yield fix_line(lines[i])
+            i += 1
+
+    @staticmethod
+    def _fix_list_and_heading(line):
+        """列表项缩进统一为空格，标题#号后补空格"""
+        stripped = line.lstrip()
+        if stripped.startswith(_LIST_MARKERS):
+            line = ' ' * (len(line) - len(stripped)) + stripped
+
+        stripped = line.strip()
+        if stripped.startswith('#'):
+            match = _HEADING_SPLIT_RE.match(stripped)
+            if match:
+                hashes, title = match.groups()
+                title = title.strip()
+                if title and not title.startswith(' '):
+                    return f"{hashes} {title}"
+                return f"{hashes}{title}"
+        return line
+
+    @staticmethod
+    def _is_potential_table_row(line):
+        """判断是否可能是表格行"""
+        stripped = line.strip()
+        if not stripped:
+            return False
+        if line.count('|') < 2:
+            return False
+        if stripped.startswith('`'):
+            return False
+        return True
+
+    @staticmethod
+    def _is_table_separator(line):
+        """判断是否是表格分隔符行"""
+        line = line.strip()
+        if not line:
+            return False
+        return '|' in line and _TABLE_SEPARATOR_CHARS.issuperset(line)
+
+    def _extract_table_block(self, lines, start_index):
+        """提取完整的表格块（至少2行）"""
+        is_row = self._is_potential_table_row
+        is_separator = self._is_table_separator
+        i = start_index
+
+        # 向前查找表格开始
+        while i > 0 and is_row(lines[i - 1]):
+            i -= 1
+
+        table_lines = []
+        line_count = len(lines)
+        while i < line_count:
+            line = lines[i].strip()
+            if is_row(line) or is_separator(line):
+                table_lines.append(lines[i])
+                i += 1
+            else:
+                break
+
+        if len(table_lines) >= 2:
+            return table_lines
+        return []
+
+    def _process_table_block(self, table_lines):
+        """处理表格块，输出标准格式的表格"""
+        rows = []
+        for line in table_lines:
+            line = line.strip()
+            if self._is_table_separator(line):
+                continue
+            if not line:
+                continue
+            if line.startswith('|'):
+                line = line[1:]
+            if line.endswith('|'):
+                line = line[:-1]
+            rows.append([cell.strip() for cell in line.split('|')])
+
+        if not rows:
+            return table_lines
+
+        max_cols = max(len(row) for row in rows)
+        for row in rows:
+            if len(row) < max_cols:
+                row.extend([''] * (max_cols - len(row)))
+
+        result = ['| ' + ' | '.join(rows[0]) + ' |',
+                  '| ' + ' | '.join(['---'] * max_cols) + ' |']
+        for row in rows[1:]:
+            result.append('| ' + ' | '.join(row) + ' |')
+        return result
+
+    # ---------- HTML转换前预处理 ----------
+
+    def preprocess_for_html(self, content):
+        """
+        HTML转换前的预处理，结果与原 MarkdownToPDFConverter 的分步处理一致
+
+        Args:
+            content: Markdown内容
+
+        Returns:
+            预处理后的Markdown内容
+        """
+        if not content:
+            return content
+
+        # 清理Markdown代码块标记
+        content = _FENCE_MARKDOWN_RE.sub('', content)
+        content = _FENCE_LINE_END_RE.sub('', content)
+        content = _FENCE_LANG_RE.sub('', content)
+        content = _FENCE_PLAIN_RE.sub('', content)
+
+        # 冒号后缩进、结论格式、数字标题与空行补充串联为一次逐行处理
+        lines = content.split('\n')
+        stages = self._iter_line_breaks(self._iter_conclusion_fix(self._iter_colon_fix(lines)))
+        content = '\n'.join(stages)
+
+        # 清理多余的空行
+        content = _NEWLINES_3_RE.sub('\n\n', content)
+        content = _LEADING_NEWLINES_RE.sub('', content)
+        content = _TRAILING_NEWLINES_RE.sub('\n', content)
+        content = _NEWLINES_3_RE.sub('\n\n', content)
+
+        # 通用修复：意外缩进、孤立标签、Mermaid图表、数字列表标题
+        return '\n'.join(self._iter_common_fixes(content.split('\n')))
+
+    @staticmethod
+    def _iter_colon_fix(lines):
+        """冒号结尾的行之后（跳过空行）的第一行如有缩进则去掉缩进"""
+        after_colon = False
+        for line in lines:
+            if after_colon:
+                if line.strip() == '':
+                    yield line
+                    continue
+                after_colon = False
+                if line.startswith('    ') or line.startswith('\t'):
+                    yield line.lstrip()
+                    continue
+
+            if _ends_with_colon(line):
+                after_colon = True
+            yield line
+
+    @staticmethod
+    def _iter_conclusion_fix(lines):
+        """缩进的结论标题及其后续内容去掉缩进，结论块后补空行"""
+        in_conclusion = False
+        for line in lines:
+            if in_conclusion:
+                if line.strip():
+                    match = _CONCLUSION_ITEM_RE.match(line)
+                    yield match.group(1) if match else line.lstrip()
+                    continue
+                in_conclusion = False
+                yield ''
+
+            if _CONCLUSION_RE.match(line):
+                in_conclusion = True
+                yield '**结论：**'
+                continue
+            yield line
+
+        if in_conclusion:
+            yield ''
+
+    def _iter_line_breaks(self, lines):
+        """转换数字标题，并在标题后、表格前后补充空行"""
+        lines = iter(lines)
+        current = next(lines, None)
+        while current is not None:
+            following = next(lines, None)
+            line = self._convert_numbered_heading(current)
+            yield line
+
+            if following is not None:
+                if line.startswith('#') and following.strip() and not following.startswith('#'):
+                    yield ''
+                elif following.startswith('|') and line.strip() and not line.startswith('|'):
+                    yield ''
+                elif line.startswith('|') and following.strip() and not following.startswith('|'):
+                    yield ''
+            current = following
+
+    @staticmethod
+    def _convert_numbered_heading(line):
+        """将无缩进、包含章节关键词的数字加粗文本转换为五级标题"""
+        if '**' not in line:
+            return line
+        match = _NUMBERED_HEADING_RE.match(line) or _NUMBERED_HEADING_COLON_RE.match(line)
+        if match:
+            indent, number, title = match.groups()
+            if len(indent) == 0:
+                title_text = title.strip().lower()
+                if any(keyword in title_text for keyword in SECTION_KEYWORDS):
+                    return f"##### {number}. {title.strip()}"
+        return line
+
+    def _iter_common_fixes(self, lines):
+        """移除意外缩进、孤立的<think>标签，修复Mermaid图表，转换数字列表标题"""
+        recent = deque(maxlen=15)  # 最近输出的行，用于查找上下文标题
+        after_colon = False
+        in_mermaid = False
+
+        for line in lines:
+            if in_mermaid:
+                if (line.strip() == '' or line.startswith('   ') or
+                        line.strip().startswith(_MERMAID_NODE_PREFIXES) or '-->' in line):
+                    if line.strip():
+                        recent.append(line.strip())
+                        yield line.strip()
+                    continue
+                in_mermaid = False
+                recent.append('```')
+                yield '```'
+
+            if after_colon:
+                if line.strip() == '':
+                    recent.append(line)
+                    yield line
+                    continue
+                after_colon = False
+                if line.startswith('    ') and not line.strip().startswith('-') and not line.strip().startswith('*'):
+                    line = line.lstrip()
+                    recent.append(line)
+                    yield line
+                    continue
+
+            stripped = line.strip()
+
+            # 以冒号结尾的行，检查后续是否有意外缩进
+            if stripped.endswith('：') or stripped.endswith(':'):
+                after_colon = True
+
+            # 跳过孤立的<think>标签
+            elif stripped.startswith('<think>'):
+                continue
+
+            # 缩进的Mermaid图表转换为代码块
+            elif stripped.startswith('graph ') and (line.startswith('    ') or line.startswith('\t')):
+                in_mermaid = True
+                recent.append('```mermaid')
+                yield '```mermaid'
+                recent.append(stripped)
+                yield stripped
+                continue
+
+            # 四级标题下的 "1. **标题**" 转换为五级标题
+            elif recent and _BOLD_NUMBERED_ITEM_RE.match(stripped):
+                if self._has_base_heading(recent):
+                    match = _BOLD_NUMBERED_ITEM_SPLIT_RE.match(stripped)
+                    if match:
+                        number, title = match.groups()
+                        line = f"##### {number}. {title.strip()}"
+
+            recent.append(line)
+            yield line
+
+        if in_mermaid:
+            yield '```'
+
+    @staticmethod
+    def _has_base_heading(recent):
+        """最近的标题是四级标题或已转换的五级数字标题"""
+        for prev_line in reversed(recent):
+            prev_stripped = prev_line.strip()
+            if prev_stripped.startswith('#'):
+                heading_level = len(prev_stripped.split()[0])
+                if heading_level == 4:
+                    return True
+                if heading_level == 5 and _CONVERTED_HEADING_RE.match(prev_stripped):
+                    return True
+                if heading_level < 4:
+                    return False
+        return False
+
+
+# 全局引擎实例
+markdown_engine = MarkdownEngine()
+
+
+# 可以切分流式内容的位置：非空白字符结尾的行（字面量\\n会转换为换行，不算）之后的空行，且新块以非空白字符开始
+_BLOCK_BOUNDARY_RE = re.compile(r'(?<=[^\s`])(?<!\\n)\n\n(?=[^\s`\\])')
+# 以代码块标记结尾的行，标记会吞掉其后的一个换行符，不能在此处切分
+_TRAILING_FENCE_RE = re.compile(r'```[a-zA-Z]*$')
+
+
+class IncrementalMarkdownProcessor:
+    """
+    流式Markdown后处理器
+    按到达顺序接收内容块，只对已经完整的块（空行分隔的表格、标题、列表、段落）做后处理，
+    各块处理结果以空行拼接后与对全文调用 MarkdownEngine.postprocess 的结果一致
+    """
+
+    def __init__(self, engine=None):
+        self.engine = engine or markdown_engine
+        self._pending = ChunkBuffer()  # 尚未完整的原始内容
+        self._content = ChunkBuffer()  # 已完成后处理的内容（块之间以空行分隔）
+        self.raw_length = 0
+
+    @staticmethod
+    def _find_boundary(pending, start):
+        """查找待处理内容中最后一个可以安全切分的位置（只需从新内容附近开始查找）"""
+        boundary = -1
+        for match in _BLOCK_BOUNDARY_RE.finditer(pending, start):
+            line_start = pending.rfind('\n', 0, match.start()) + 1
+            if not _TRAILING_FENCE_RE.search(pending, line_start, match.start()):
+                boundary = match.end()
+        return boundary
+
+    def _emit(self, segment):
+        """后处理一段完整内容，返回新增的块"""
+        try:
+            processed = self.engine.postprocess(segment)
+        except Exception as e:
+            logger.error(f"流式Markdown后处理失败，使用原内容: {e}")
+            processed = segment
+        if not processed:
+            return []
+        if self._content:
+            self._content.append('\n\n')
+        self._content.append(processed)
+        return [processed]
+
+    def feed(self, chunk):
+        """
+        接收一个内容块
+
+        Args:
+            chunk: 原始内容块
+
+        Returns:
+            List[str]: 本次新完成并已后处理的块（可能为空）
+        """
+        if not chunk:
+            return []
+        self.raw_length += len(chunk)
+        self._pending.append(chunk)
+
+        # 切分点需要前后各一个字符确认，只在新内容及其前3个字符中出现空行时才拼接待处理内容查找
+        if '\n\n' not in self._pending.tail(len(chunk) + 3):
+            return []
+        pending = self._pending.getvalue()
+        boundary = self._find_boundary(pending, max(0, len(pending) - len(chunk) - 3))
+        if boundary < 0:
+            return []
+
+        self._pending.replace(pending[boundary:])
+        return self._emit(pending[:boundary])
+
+    def flush(self):
+        """
+        流结束时处理剩余内容
+
+        Returns:
+            List[str]: 剩余内容后处理得到的块（可能为空）
+        """
+        segment = self._pending.getvalue()
+        self._pending.clear()
+        if not segment:
+            return []
+        return self._emit(segment)
+
+    def get_content(self):
+        """获取已完成后处理的全部内容"""
+        return self._content.getvalue()
+
+    def finish(self):
+        """
+        结束流式处理
+
+        Returns:
+            str: 完整的后处理内容
+        """
+        self.flush()
+        return self.get_content()
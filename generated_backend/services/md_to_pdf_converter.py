@@ -11,11 +11,16 @@ import argparse
 import markdown
 from weasyprint import HTML, CSS
 from weasyprint.text.fonts import FontConfiguration
-import tempfile
 from pathlib import Path
 import base64
 import datetime
 import re
+import threading
+try:
+    from .markdown_engine import markdown_engine
+except ImportError:
+    # 作为独立脚本运行时
+    from markdown_engine import markdown_engine
 try:
     from .pdf_config import (
         PAGE_CONFIG, FONT_CONFIG, COLOR_THEME, HEADING_STYLES,
@@ -53,47 +58,23 @@ except ImportError:
 
 class MarkdownToPDFConverter:
     def __init__(self):
-        self.font_config = FontConfiguration()
-        
-        # 初始化时尝试加载系统字体
-        self._ensure_fonts_available()
-        
+        # 字体配置和CSS为进程级共享资源，只在进程内首次使用时初始化
+        resources = bootstrap_pdf_renderer()
+        self.font_config = resources['font_config']
+        self.css_styles = resources['css_styles']
+        self.css = resources['css']
+
     def _ensure_fonts_available(self):
         """确保中文字体可用"""
-        try:
-            import subprocess
-            import sys
-            
-            # 更新字体缓存
-            try:
-                subprocess.run(['fc-cache', '-f'], check=False, capture_output=True)
-                print("字体缓存已更新")
-            except Exception as e:
-                print(f"更新字体缓存失败: {e}")
-                
-            # 检查可用字体
-            try:
-                result = subprocess.run(['fc-list', ':lang=zh'], 
-                                      capture_output=True, text=True, check=False)
-                available_fonts = result.stdout
-                print(f"检测到中文字体: {len(available_fonts.splitlines())} 个")
-                
-                # 检查关键字体是否可用
-                key_fonts = ['Noto Sans CJK', 'WenQuanYi', 'Microsoft YaHei']
-                for font in key_fonts:
-                    if font in available_fonts:
-                        print(f"✓ 找到字体: {font}")
-                    else:
-                        print(f"✗ 缺少字体: {font}")
-                        
-            except Exception as e:
-                print(f"检查字体失败: {e}")
-                
-        except ImportError:
-            pass
-        
+        refresh_system_fonts()
+
     def get_css_styles(self):
         """获取CSS样式，包含中文字体支持"""
+        return self.css_styles
+
+    @staticmethod
+    def build_css_styles():
+        """构建CSS样式，包含中文字体支持"""
         primary_fonts = ', '.join(f'"{font}"' for font in FONT_CONFIG['primary_fonts'])
         code_fonts = ', '.join(f'"{font}"' for font in FONT_CONFIG['code_fonts'])
 
@@ -318,195 +299,13 @@ class MarkdownToPDFConverter:
             return markdown_content
 
         try:
-            # 应用通用的Markdown后处理逻辑
-            processed_content = self._apply_universal_postprocessing(markdown_content)
-
-            # 应用新的通用修复逻辑
-            processed_content = self._apply_common_markdown_fixes(processed_content)
-
-            return processed_content
+            # 通用后处理（代码块标记、冒号缩进、结论格式、数字标题、空行）与通用修复
+            # （意外缩进、孤立标签、Mermaid图表、数字列表标题）由预编译的后处理引擎一次完成
+            return markdown_engine.preprocess_for_html(markdown_content)
         except Exception as e:
             print(f"⚠️ Markdown预处理失败: {e}")
             return markdown_content  # 出错时返回原内容
 
-    def _apply_universal_postprocessing(self, content):
-        """
-        应用通用的Markdown后处理逻辑，与前端保持一致
-
-        简化版本：只做最基本的清理，避免破坏原有格式
-        """
-        if not content:
-            return content
-
-        processed_content = content
-
-        # 1. 清理Markdown代码块标记
-        processed_content = re.sub(r'```markdown\s*\n', '', processed_content, flags=re.IGNORECASE)
-        processed_content = re.sub(r'```\s*$', '', processed_content, flags=re.MULTILINE)
-        processed_content = re.sub(r'```[\w]*\s*\n', '', processed_content, flags=re.IGNORECASE)
-        processed_content = re.sub(r'```\s*\n', '', processed_content, flags=re.IGNORECASE)
-
-        # 2. 修复冒号后换行问题
-        processed_content = self._fix_colon_line_breaks(processed_content)
-
-        # 3. 修复结论格式问题
-        processed_content = self._fix_conclusion_format(processed_content)
-
-        # 4. 基本的换行符修复 - 保守处理
-        processed_content = self._fix_line_breaks_conservative(processed_content)
-
-        # 4. 清理多余的空行
-        processed_content = self._clean_extra_newlines(processed_content)
-
-        return processed_content
-
-    def _fix_colon_line_breaks(self, content):
-        """
-        修复冒号后的换行问题 - 特别处理文档开头的称呼格式
-        支持冒号行和缩进内容之间有空行的情况
-        """
-        lines = content.split('\n')
-        result_lines = []
-
-        i = 0
-        while i < len(lines):
-            line = lines[i]
-            # 检查是否是以冒号结尾的行（通常是称呼或标题）
-            if line.strip().endswith('：') or line.strip().endswith(':'):
-                result_lines.append(line)
-                i += 1
-
-                # 跳过空行，寻找下一个有内容的行
-                while i < len(lines) and lines[i].strip() == '':
-                    result_lines.append(lines[i])  # 保持空行
-                    i += 1
-
-                # 检查是否有缩进内容
-                if i < len(lines) and (lines[i].startswith('    ') or lines[i].startswith('\t')):
-                    # 去掉缩进并添加到结果中
-                    result_lines.append(lines[i].lstrip())
-                    print(f"🔧 _fix_colon_line_breaks: 修复了缩进问题")
-                    i += 1
-                continue
-            else:
-                result_lines.append(line)
-                i += 1
-
-        return '\n'.join(result_lines)
-
-    def _apply_common_markdown_fixes(self, content):
-        """
-        应用通用的Markdown修复逻辑，解决常见的格式问题
-
-        修复的问题包括：
-        1. 移除导致代码块的意外缩进
-        2. 清理孤立的HTML标签（如<think>）
-        3. 修复Mermaid图表格式
-        4. 转换数字列表为标题格式
-        """
-        if not content:
-            return content
-
-        lines = content.split('\n')
-        result_lines = []
-        i = 0
-
-        while i < len(lines):
-            line = lines[i]
-
-            # 1. 修复意外的缩进导致的代码块问题
-            # 检测以冒号结尾的行后面跟着缩进的内容
-            if line.strip().endswith('：') or line.strip().endswith(':'):
-                result_lines.append(line)
-                i += 1
-
-                # 跳过空行，寻找下一个有内容的行
-                while i < len(lines) and lines[i].strip() == '':
-                    result_lines.append(lines[i])  # 保持空行
-                    i += 1
-
-                # 检查是否有意外缩进的内容
-                if i < len(lines) and lines[i].startswith('    ') and not lines[i].strip().startswith('-') and not lines[i].strip().startswith('*'):
-                    # 移除缩进，避免被解释为代码块
-                    next_line = lines[i].lstrip()
-                    if next_line:  # 只有非空行才处理
-                        result_lines.append(next_line)
-                        print(f"🔧 修复缩进问题: 移除了4个空格的缩进")
-                    else:
-                        result_lines.append(lines[i])  # 保持空行
-                    i += 1
-                continue  # 重要：跳过默认处理，避免重复添加
-
-            # 2. 清理孤立的HTML标签
-            elif line.strip() == '<think>' or line.strip().startswith('<think>'):
-                # 跳过孤立的<think>标签
-                print(f"🧹 清理孤立的HTML标签: {line.strip()}")
-                i += 1
-                continue
-
-            # 3. 修复Mermaid图表格式
-            elif line.strip().startswith('graph ') and (line.startswith('    ') or line.startswith('\t')):
-                # 检测缩进的Mermaid图表，转换为正确的代码块格式
-                print(f"🔧 修复Mermaid图表格式: {line.strip()}")
-                result_lines.append('```mermaid')
-                result_lines.append(line.strip())
-                i += 1
-
-                # 继续处理图表的其他行
-                while i < len(lines) and (lines[i].strip() == '' or
-                                        lines[i].startswith('   ') or
-                                        lines[i].strip().startswith(('A[', 'B[', 'C[', 'D[', 'E[', 'F[')) or
-                                        '-->' in lines[i]):
-                    if lines[i].strip():
-                        result_lines.append(lines[i].strip())
-                    i += 1
-
-                result_lines.append('```')
-                continue
-
-            # 4. 转换特定模式的数字列表为标题格式
-            # 检测类似 "1. **战略定位**" 的模式，在特定上下文中转换为标题
-            elif re.match(r'^\d+\.\s+\*\*[^*]+\*\*\s*$', line.strip()):
-                # 检查上下文，如果前面是四级标题或者已经转换的五级标题，则转换为五级标题
-                if len(result_lines) > 0:
-                    # 查找最近的标题
-                    recent_heading_level = 0
-                    found_base_heading = False
-
-                    for prev_line in reversed(result_lines[-15:]):  # 检查最近15行
-                        if prev_line.strip().startswith('#'):
-                            heading_level = len(prev_line.strip().split()[0])
-
-                            # 如果找到四级标题，这是我们的基准
-                            if heading_level == 4:
-                                found_base_heading = True
-                                break
-                            # 如果找到五级标题且是数字开头，说明是我们转换的标题
-                            elif heading_level == 5 and re.match(r'#####\s+\d+\.', prev_line.strip()):
-                                found_base_heading = True
-                                break
-                            # 如果找到更高级别的标题（1-3级），停止搜索
-                            elif heading_level < 4:
-                                break
-
-                    # 如果找到了基准标题，转换当前行为五级标题
-                    if found_base_heading:
-                        # 提取数字和标题文本
-                        match = re.match(r'^(\d+)\.\s+\*\*([^*]+)\*\*\s*$', line.strip())
-                        if match:
-                            number, title = match.groups()
-                            new_heading = f"##### {number}. {title.strip()}"
-                            result_lines.append(new_heading)
-                            print(f"🔄 转换列表为标题: {line.strip()} -> {new_heading}")
-                            i += 1
-                            continue
-
-            # 默认情况：保持原行不变
-            result_lines.append(line)
-            i += 1
-
-        return '\n'.join(result_lines)
-
     def _post_process_html(self, html_content):
         """
         后处理HTML内容，为特定段落添加CSS类
@@ -528,263 +327,6 @@ class MarkdownToPDFConverter:
 
         return processed_html
 
-    def _fix_conclusion_format(self, content):
-        """
-        修复结论格式问题 - 将缩进的结论内容转换为正常格式
-        """
-        lines = content.split('\n')
-        result_lines = []
-
-        i = 0
-        while i < len(lines):
-            line = lines[i]
-
-            # 检查是否是缩进的结论行
-            if re.match(r'^\s+\*\*结论：\*\*\s*$', line):
-                # 添加无缩进的结论标题
-                result_lines.append('**结论：**')
-                i += 1
-
-                # 处理后续的缩进数字列表
-                while i < len(lines):
-                    if i >= len(lines):
-                        break
-                    next_line = lines[i]
-
-                    # 如果是空行，跳出循环
-                    if not next_line.strip():
-                        break
-
-                    # 如果是缩进的数字列表项，去掉缩进
-                    if re.match(r'^\s+(\d+\.\s.*)', next_line):
-                        # 提取数字列表内容，去掉前面的空格
-                        match = re.match(r'^\s+(\d+\.\s.*)', next_line)
-                        if match:
-                            result_lines.append(match.group(1))
-                    else:
-                        # 其他缩进内容也去掉缩进
-                        result_lines.append(next_line.lstrip())
-                    i += 1
-
-                # 添加空行分隔
-                result_lines.append('')
-            else:
-                result_lines.append(line)
-                i += 1
-
-        return '\n'.join(result_lines)
-
-    def _fix_line_breaks_conservative(self, content):
-        """
-        保守的换行符修复 - 只处理明显需要修复的情况
-        """
-        lines = content.split('\n')
-        result_lines = []
-
-        for i, line in enumerate(lines):
-            # 转换数字标题为Markdown标题
-            line = self._convert_numbered_headings(line)
-            result_lines.append(line)
-
-            # 确保标题后有空行
-            if line.startswith('#') and i + 1 < len(lines) and lines[i + 1].strip() and not lines[i + 1].startswith('#'):
-                result_lines.append('')
-
-            # 确保表格前有空行
-            elif (i + 1 < len(lines) and
-                  lines[i + 1].startswith('|') and
-                  line.strip() and
-                  not line.startswith('|')):
-                result_lines.append('')
-
-            # 确保表格后有空行
-            elif (line.startswith('|') and
-                  i + 1 < len(lines) and
-                  lines[i + 1].strip() and
-                  not lines[i + 1].startswith('|')):
-                result_lines.append('')
-
-        content = '\n'.join(result_lines)
-
-        # 清理多余的空行
-        content = re.sub(r'\n{3,}', '\n\n', content)
-
-        return content
-
-    def _convert_numbered_headings(self, line):
-        """
-        将数字开头的加粗文本转换为Markdown标题
-        但只转换那些看起来像独立标题的，不转换列表项
-        """
-        # 匹配模式1: 数字. **文本**
-        pattern1 = r'^(\s*)(\d+)\.\s*\*\*(.*?)\*\*\s*$'
-        # 匹配模式2: 数字. **文本**：（带中文冒号）
-        pattern2 = r'^(\s*)(\d+)\.\s*\*\*(.*?)\*\*：\s*$'
-
-        match = re.match(pattern1, line) or re.match(pattern2, line)
-
-        if match:
-            indent, number, title = match.groups()
-
-            # 只转换没有缩进的数字标题，有缩进的保持为列表项
-            if len(indent) == 0:
-                # 检查标题内容，如果是明显的章节标题才转换
-                title_text = title.strip().lower()
-
-                # 这些关键词表明是章节标题
-                section_keywords = [
-                    # 分析类
-                    '分析', '评估', '建议', '策略', '方案', '计划', '措施',
-                    '优化', '管理', '风险', '融资', '诊断', '结论', '总结',
-                    '现状', '问题', '对策', '路径', '升级', '重组', '处置',
-                    # 业务类
-                    '资本', '治理', '产品', '创新', '能力', '储备', '体系',
-                    '资质', '背书', '竞争', '对标', '监测', '供应链', '集中度',
-                    '验证', '适配', '结构', '市场', '矩阵', '壁垒', '压力',
-                    '波动', '瓶颈', '短期', '中期', '长期', '合规', '稳定',
-                    # 财务类
-                    '流动性', '盈利', '运营', '效率', '成本', '收入', '负债',
-                    '资产', '现金流', '偿债', '融资', '投资', '回报',
-                    # 其他重要词汇
-                    '查询', '显示', '网络', '舆情', '客户', '技术', '专利',
-                    '认证', '荣誉', '引入', '延伸', '研发'
-                ]
-
-                # 如果标题包含章节关键词，转换为h5标题
-                if any(keyword in title_text for keyword in section_keywords):
-                    return f"##### {number}. {title.strip()}"
-
-        return line
-
-    def _fix_line_breaks(self, content):
-        """
-        修复换行符问题 - 核心修复
-        将单个换行符转换为Markdown双换行符，但保护表格和标题
-        """
-        # 先保护表格行（包含|的行）
-        content = re.sub(r'(\|[^|\n]*\|)\n(?!\|)', r'\1\n\n', content)
-
-        # 保护标题行 - 修复：确保标题后有空行
-        content = re.sub(r'(#{1,6}[^\n]*)\n(?!#{1,6}|\n)', r'\1\n\n', content)
-
-        # 保护列表项
-        content = re.sub(r'(\s*[-*+]\s[^\n]*)\n(?!\s*[-*+]|\n)', r'\1\n\n', content)
-        content = re.sub(r'(\s*\d+\.\s[^\n]*)\n(?!\s*\d+\.|\n)', r'\1\n\n', content)
-
-        # 处理普通文本的单换行符：如果不是已经是双换行，就转换为双换行
-        # 但要避免在表格、标题、列表中进行此操作
-        lines = content.split('\n')
-        result_lines = []
-
-        for i, line in enumerate(lines):
-            result_lines.append(line)
-
-            # 如果当前行不为空，下一行也不为空，且都不是特殊格式
-            if (i < len(lines) - 1 and
-                line.strip() and
-                lines[i + 1].strip() and
-                not line.startswith('#') and  # 不是标题
-                not lines[i + 1].startswith('#') and  # 下一行不是标题
-                '|' not in line and  # 不是表格
-                '|' not in lines[i + 1] and  # 下一行不是表格
-                not re.match(r'^\s*[-*+]\s', line) and  # 不是列表
-                not re.match(r'^\s*\d+\.\s', line)):  # 不是数字列表
-
-                # 检查下一行是否为空，如果不是则添加空行
-                if i + 1 < len(lines) and lines[i + 1].strip():
-                    result_lines.append('')
-
-        content = '\n'.join(result_lines)
-
-        # 清理可能产生的三个或更多连续换行符
-        content = re.sub(r'\n{3,}', '\n\n', content)
-
-        return content
-
-    def _fix_table_format(self, content):
-        """修复表格格式"""
-        # 确保表格前后有空行
-        content = re.sub(r'([^\n])\n(\|)', r'\1\n\n\2', content)
-        content = re.sub(r'(\|[^\n]*)\n([^\|\n])', r'\1\n\n\2', content)
-
-        # 修复表格分隔符
-        lines = content.split('\n')
-        in_table = False
-        result_lines = []
-
-        for i, line in enumerate(lines):
-            if '|' in line and line.strip():
-                if not in_table:
-                    # 表格开始，检查是否需要添加分隔符
-                    in_table = True
-                    result_lines.append(line)
-                    # 如果下一行不是分隔符，添加一个
-                    if i + 1 < len(lines) and not re.match(r'^\s*\|[\s\-\|:]+\|\s*$', lines[i + 1]):
-                        # 生成分隔符行
-                        cols = line.count('|') - 1
-                        separator = '|' + '---|' * cols
-                        result_lines.append(separator)
-                else:
-                    result_lines.append(line)
-            else:
-                if in_table:
-                    in_table = False
-                result_lines.append(line)
-
-        return '\n'.join(result_lines)
-
-    def _fix_heading_format(self, content):
-        """修复标题格式"""
-        # 确保#号后面有空格
-        content = re.sub(r'^(#{1,6})([^#\s])', r'\1 \2', content, flags=re.MULTILINE)
-
-        # 确保标题前有换行符（除了文档开头）
-        content = re.sub(r'([^\n])\n(#{1,6}\s)', r'\1\n\n\2', content)
-
-        # 不要自动转换"第X节"为标题，保持原有格式
-        # 这样可以避免破坏原有的 Markdown 结构
-
-        return content
-
-    def _fix_list_format(self, content):
-        """修复列表格式"""
-        # 确保列表前有空行
-        content = re.sub(r'([^\n])\n(\s*[-*+]\s)', r'\1\n\n\2', content)
-        content = re.sub(r'([^\n])\n(\s*\d+\.\s)', r'\1\n\n\2', content)
-
-        # 修复列表项之间的间距
-        lines = content.split('\n')
-        result_lines = []
-
-        for i, line in enumerate(lines):
-            result_lines.append(line)
-
-            # 如果当前行是列表项，且下一行也是列表项，确保有适当的间距
-            if re.match(r'^\s*[-*+]\s', line) or re.match(r'^\s*\d+\.\s', line):
-                if i + 1 < len(lines):
-                    next_line = lines[i + 1]
-                    if (re.match(r'^\s*[-*+]\s', next_line) or re.match(r'^\s*\d+\.\s', next_line)) and next_line.strip():
-                        # 如果下一行也是列表项，不需要额外空行
-                        pass
-                    elif next_line.strip() and not next_line.startswith(' '):
-                        # 如果下一行不是空行且不是缩进内容，添加空行
-                        result_lines.append('')
-
-        return '\n'.join(result_lines)
-
-    def _clean_extra_newlines(self, content):
-        """清理多余的空行"""
-        # 清理文档开头的空行
-        content = re.sub(r'^\n+', '', content)
-
-        # 清理文档结尾的空行
-        content = re.sub(r'\n+$', '\n', content)
-
-        # 将三个或更多连续换行符替换为两个
-        content = re.sub(r'\n{3,}', '\n\n', content)
-
-        return content
-
     def get_logo_base64(self):
         """获取logo的base64编码"""
         try:
@@ -894,6 +436,25 @@ class MarkdownToPDFConverter:
 
 
     
+    def convert_markdown_to_pdf(self, markdown_content, file_path=None, target=None):
+        """
+        在内存中将Markdown内容渲染为PDF，不经过临时文件
+
+        Args:
+            markdown_content: Markdown内容
+            file_path: 原始报告文件路径，用于获取报告生成时间
+            target: 输出目标（文件路径或可写的文件对象），为None时返回PDF字节
+
+        Returns:
+            bytes或None: target为None时返回PDF内容
+        """
+        html_content = self.convert_markdown_to_html(markdown_content, file_path)
+        base_url = os.path.dirname(os.path.abspath(file_path)) if file_path else None
+
+        html_doc = HTML(string=html_content, base_url=base_url)
+        return html_doc.write_pdf(target, stylesheets=[self.css],
+                                  font_config=self.font_config)
+
     def convert_to_pdf(self, input_file, output_file=None):
         """将Markdown文件转换为PDF"""
         try:
@@ -901,39 +462,131 @@ class MarkdownToPDFConverter:
             with open(input_file, 'r', encoding='utf-8') as f:
                 markdown_content = f.read()
             
-            # 转换为HTML
-            html_content = self.convert_markdown_to_html(markdown_content, input_file)
-            
             # 设置输出文件名
             if output_file is None:
                 input_path = Path(input_file)
                 output_file = input_path.with_suffix('.pdf')
             
-            # 创建临时HTML文件
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.html', 
-                                           encoding='utf-8', delete=False) as temp_html:
-                temp_html.write(html_content)
-                temp_html_path = temp_html.name
+            # 转换为PDF
+            self.convert_markdown_to_pdf(markdown_content, input_file, target=str(output_file))
             
-            try:
-                # 转换为PDF
-                css = CSS(string=self.get_css_styles(), font_config=self.font_config)
-                html_doc = HTML(filename=temp_html_path)
-                html_doc.write_pdf(output_file, stylesheets=[css], 
-                                 font_config=self.font_config)
-                
-                print(f"✅ 转换成功: {input_file} -> {output_file}")
-                return True
-                
-            finally:
-                # 清理临时文件
-                os.unlink(temp_html_path)
+            print(f"✅ 转换成功: {input_file} -> {output_file}")
+            return True
                 
         except Exception as e:
             print(f"❌ 转换失败: {str(e)}")
             return False
 
 
+# 进程级渲染资源：字体缓存只刷新一次，FontConfiguration/CSS在进程内共享
+_renderer_lock = threading.RLock()
+_renderer_resources = None
+_shared_converter = None
+_fonts_refreshed = False
+
+# 主进程刷新字体缓存后设置该环境变量，fork出的worker继承后不再重复执行fc-cache
+FONTS_READY_ENV = 'PDF_RENDERER_FONTS_READY'
+
+
+def refresh_system_fonts(force=False):
+    """
+    刷新系统字体缓存并检查中文字体，每个进程最多执行一次
+
+    Args:
+        force: 是否强制重新执行fc-cache
+    """
+    global _fonts_refreshed
+
+    if not force and (_fonts_refreshed or os.environ.get(FONTS_READY_ENV) == '1'):
+        _fonts_refreshed = True
+        return
+
+    import subprocess
+
+    # 更新字体缓存
+    try:
+        subprocess.run(['fc-cache', '-f'], check=False, capture_output=True)
+        print("字体缓存已更新")
+    except Exception as e:
+        print(f"更新字体缓存失败: {e}")
+
+    # 检查可用字体
+    try:
+        result = subprocess.run(['fc-list', ':lang=zh'],
+                                capture_output=True, text=True, check=False)
+        available_fonts = result.stdout
+        print(f"检测到中文字体: {len(available_fonts.splitlines())} 个")
+
+        # 检查关键字体是否可用
+        key_fonts = ['Noto Sans CJK', 'WenQuanYi', 'Microsoft YaHei']
+        for font in key_fonts:
+            if font in available_fonts:
+                print(f"✓ 找到字体: {font}")
+            else:
+                print(f"✗ 缺少字体: {font}")
+
+    except Exception as e:
+        print(f"检查字体失败: {e}")
+
+    _fonts_refreshed = True
+    os.environ[FONTS_READY_ENV] = '1'
+
+
+def bootstrap_pdf_renderer():
+    """
+    初始化当前进程的PDF渲染资源（字体、FontConfiguration、CSS），重复调用直接返回缓存
+
+    资源按进程ID缓存，在主进程初始化后fork的worker会自动重新构建，
+    避免在进程间共享fontconfig句柄。
+
+    Returns:
+        dict: 包含 font_config、css_styles、css 的渲染资源
+    """
+    global _renderer_resources
+
+    resources = _renderer_resources
+    if resources is not None and resources['pid'] == os.getpid():
+        return resources
+
+    with _renderer_lock:
+        resources = _renderer_resources
+        if resources is not None and resources['pid'] == os.getpid():
+            return resources
+
+        refresh_system_fonts()
+
+        font_config = FontConfiguration()
+        css_styles = MarkdownToPDFConverter.build_css_styles()
+        resources = {
+            'pid': os.getpid(),
+            'font_config': font_config,
+            'css_styles': css_styles,
+            'css': CSS(string=css_styles, font_config=font_config)
+        }
+        _renderer_resources = resources
+        print(f"PDF渲染资源初始化完成 (pid={resources['pid']})")
+
+    return resources
+
+
+def get_shared_converter():
+    """获取当前进程共享的MarkdownToPDFConverter实例"""
+    global _shared_converter
+
+    resources = bootstrap_pdf_renderer()
+    converter = _shared_converter
+    if converter is not None and converter.font_config is resources['font_config']:
+        return converter
+
+    with _renderer_lock:
+        converter = _shared_converter
+        if converter is None or converter.font_config is not resources['font_config']:
+            converter = MarkdownToPDFConverter()
+            _shared_converter = converter
+
+    return converter
+
+
 def main():
     parser = argparse.ArgumentParser(
         description='将Markdown文件转换为PDF (支持中文)',
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+知识库解析状态轮询器
+每个进程一个调度线程，集群内通过MySQL命名锁只让一个进程实际轮询：
+从数据库读取所有解析中的文档，按数据集分组，每个数据集每轮只查询一次文档列表，
+无进展时按退避间隔放慢轮询，状态变化在一个事务中批量写回，超过最长等待时间的文档标记为解析失败
+"""
+
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from database import db
+from db_models import Project, Document, DocumentStatus
+from services.stat_counters import counted_bulk_changes, add_transition_deltas
+
+
+class ParseStatusPoller:
+    """知识库解析状态轮询器"""
+
+    LOCK_NAME = 'credit_rag_parse_status_poller'
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.base_interval = float(os.environ.get('RAG_PARSE_POLL_INTERVAL', 5))
+        self.max_interval = float(os.environ.get('RAG_PARSE_POLL_MAX_INTERVAL', 60))
+        self.idle_interval = float(os.environ.get('RAG_PARSE_POLL_IDLE_INTERVAL', 10))
+        self.max_wait = int(os.environ.get('RAG_PARSE_MAX_WAIT_SECONDS', 3600))
+        self._app = None
+        self._thread = None
+        self._thread_pid = None
+        self._lock = threading.Lock()
+        self._wake_event = threading.Event()
+        self._lock_connection = None  # 持有集群轮询锁的数据库连接
+        self._datasets = {}  # {dataset_id: {'interval', 'next_poll_at', 'progress'}}
+        self._stats = {
+            'ticks': 0,
+            'dataset_polls': 0,
+            'poll_errors': 0,
+            'completed': 0,
+            'failed': 0,
+            'timed_out': 0
+        }
+
+    def start(self, app):
+        """
+        启动当前进程的轮询线程（重复调用只启动一次）
+
+        Args:
+            app: Flask应用实例
+        """
+        with self._lock:
+            if self._thread_pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._app = app
+            self._lock_connection = None
+            self._datasets = {}
+            self._thread = threading.Thread(target=self._run, name='rag-parse-status-poller', daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+        self.logger.info("知识库解析状态轮询器已启动")
+
+    def wake(self):
+        """有新文档进入解析状态时立即开始下一轮"""
+        self._wake_event.set()
+
+    def _run(self):
+        while True:
+            wait_seconds = self.idle_interval
+            try:
+                with self._app.app_context():
+                    if self._acquire_cluster_lock():
+                        wait_seconds = self._tick()
+            except Exception as e:
+                self.logger.error(f"解析状态轮询异常: {e}")
+                self._release_cluster_lock()
+            self._wake_event.wait(wait_seconds)
+            self._wake_event.clear()
+
+    def _acquire_cluster_lock(self):
+        """获取集群轮询锁（非MySQL数据库时每个进程各自轮询）"""
+        if db.engine.dialect.name != 'mysql':
+            return True
+        if self._lock_connection is not None:
+            # 确认锁仍由当前连接持有（连接断开时锁会被MySQL释放）
+            try:
+                held = self._lock_connection.execute(
+                    text("SELECT IS_USED_LOCK(:name) = CONNECTION_ID()"), {'name': self.LOCK_NAME}
+                ).scalar()
+                if held == 1:
+                    return True
+            except Exception as e:
+                self.logger.warning(f"检查集群解析状态轮询锁失败: {e}")
+            self._release_cluster_lock()
+        connection = db.engine.connect()
+        acquired = connection.execute(text("SELECT GET_LOCK(:name, 0)"), {'name': self.LOCK_NAME}).scalar()
+        if acquired == 1:
+            self._lock_connection = connection
+            self.logger.info("已获得集群解析状态轮询锁")
+            return True
+        connection.close()
+        return False
+
+    def _release_cluster_lock(self):
+        """连接异常时放弃锁，下一轮重新竞争"""
+        connection = self._lock_connection
+        self._lock_connection = None
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def _load_pending(self):
+        """读取所有解析中的文档，按数据集分组"""
+        rows = db.session.query(
+            Document.id, Document.rag_document_id, Document.updated_at, Project.dataset_id
+        ).join(Project, Document.project_id == Project.id).filter(
+            Document.status == DocumentStatus.PARSING_KB,
+            Document.rag_document_id.isnot(None),
+            Project.dataset_id.isnot(None)
+        ).all()
+        db.session.rollback()
+
+        groups = {}
+        for doc_id, rag_document_id, updated_at, dataset_id in rows:
+            groups.setdefault(dataset_id, []).append((doc_id, rag_document_id, updated_at))
+        return groups
+
+    def _tick(self):
+        """
+        执行一轮轮询
+
+        Returns:
+            float: 距离下一轮的等待秒数
+        """
+        from services.knowledge_base_service import knowledge_base_service
+
+        self._stats['ticks'] += 1
+        groups = self._load_pending()
+
+        # 已没有解析中文档的数据集不再跟踪
+        for dataset_id in list(self._datasets):
+            if dataset_id not in groups:
+                del self._datasets[dataset_id]
+        if not groups:
+            return self.idle_interval
+
+        now = time.time()
+        deadline = datetime.utcnow() - timedelta(seconds=self.max_wait)
+        completed, failed, timed_out = [], [], []
+
+        for dataset_id, documents in groups.items():
+            state = self._datasets.setdefault(dataset_id, {
+                'interval': self.base_interval,
+                'next_poll_at': 0,
+                'progress': {}
+            })
+            rag_document_ids = {rag_document_id for _, rag_document_id, _ in documents}
+            if not rag_document_ids.issubset(state['progress']):
+                # 有新进入解析的文档，不等待退避间隔
+                state['next_poll_at'] = 0
+            state['progress'] = {rid: p for rid, p in state['progress'].items() if rid in rag_document_ids}
+            if state['next_poll_at'] > now:
+                continue
+
+            self._stats['dataset_polls'] += 1
+            statuses = knowledge_base_service.get_documents_parsing_status(dataset_id, rag_document_ids)
+            changed = False
+            if statuses is None:
+                self._stats['poll_errors'] += 1
+                statuses = {}
+
+            for doc_id, rag_document_id, updated_at in documents:
+                status = statuses.get(rag_document_id)
+                if status is None:
+                    # 查询失败或未找到文档，仍然检查超时
+                    state['progress'].setdefault(rag_document_id, None)
+                    if updated_at and updated_at < deadline:
+                        timed_out.append(doc_id)
+                    continue
+
+                parsing_status, progress = status
+                if parsing_status is True:
+                    completed.append(doc_id)
+                    changed = True
+                elif parsing_status == 'failed':
+                    failed.append(doc_id)
+                    changed = True
+                elif updated_at and updated_at < deadline:
+                    timed_out.append(doc_id)
+                elif state['progress'].get(rag_document_id) != progress:
+                    state['progress'][rag_document_id] = progress
+                    changed = True
+
+            # 有进展时恢复基础间隔，否则逐步放慢
+            if changed:
+                state['interval'] = self.base_interval
+            else:
+                state['interval'] = min(self.max_interval, state['interval'] * 1.5)
+            state['next_poll_at'] = now + state['interval']
+
+        self._apply_updates(completed, failed, timed_out)
+
+        next_due = min(state['next_poll_at'] for state in self._datasets.values())
+        return max(1.0, min(self.idle_interval, next_due - time.time()))
+
+    def _apply_updates(self, completed, failed, timed_out):
+        """在一个事务中批量写回解析结果（只更新仍处于解析中的文档）"""
+        if not (completed or failed or timed_out):
+            return
+        try:
+            parsing = Document.status == DocumentStatus.PARSING_KB
+            # 只更新解析中的文档，状态转换已知，直接写入计数器增量，不触发全表校对
+            with counted_bulk_changes(db.session):
+                if completed:
+                    count = Document.query.filter(Document.id.in_(completed), parsing).update({
+                        Document.status: DocumentStatus.COMPLETED,
+                        Document.progress: 100,
+                        Document.error_message: None
+                    }, synchronize_session=False)
+                    add_transition_deltas('{}_documents', DocumentStatus.PARSING_KB, DocumentStatus.COMPLETED, count)
+                if failed:
+                    count = Document.query.filter(Document.id.in_(failed), parsing).update({
+                        Document.status: DocumentStatus.KB_PARSE_FAILED,
+                        Document.progress: 80,
+                        Document.error_message: "知识库解析失败"
+                    }, synchronize_session=False)
+                    add_transition_deltas('{}_documents', DocumentStatus.PARSING_KB, DocumentStatus.KB_PARSE_FAILED, count)
+                if timed_out:
+                    count = Document.query.filter(Document.id.in_(timed_out), parsing).update({
+                        Document.status: DocumentStatus.KB_PARSE_FAILED,
+                        Document.progress: 80,
+                        Document.error_message: f"知识库解析超时（超过{self.max_wait}秒）"
+                    }, synchronize_session=False)
+                    add_transition_deltas('{}_documents', DocumentStatus.PARSING_KB, DocumentStatus.KB_PARSE_FAILED, count)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            self.logger.error(f"批量更新文档解析状态失败: {e}")
+            return
+
+        self._stats['completed'] += len(completed)
+        self._stats['failed'] += len(failed)
+        self._stats['timed_out'] += len(timed_out)
+        self.logger.info(f"文档解析状态更新: 完成 {len(completed)}，失败 {len(failed)}，超时 {len(timed_out)}")
+
+    def get_stats(self):
+        """获取轮询器指标"""
+        stats = dict(self._stats)
+        stats.update({
+            'is_leader': self._lock_connection is not None,
+            'tracked_datasets': len(self._datasets),
+            'dataset_intervals': {dataset_id: round(state['interval'], 1) for dataset_id, state in self._datasets.items()}
+        })
+        return stats
+
+
+# 全局轮询器实例
+parse_status_poller = ParseStatusPoller()
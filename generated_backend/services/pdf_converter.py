@@ -12,10 +12,11 @@ from pathlib import Path
 from typing import Optional, Tuple
 
 try:
-    from .md_to_pdf_converter import MarkdownToPDFConverter
+    from .md_to_pdf_converter import MarkdownToPDFConverter, get_shared_converter
 except ImportError as e:
     logging.error(f"无法导入md_to_pdf_converter模块: {e}")
     MarkdownToPDFConverter = None
+    get_shared_converter = None
 
 
 class PDFConverterService:
@@ -27,7 +28,7 @@ class PDFConverterService:
         
         if MarkdownToPDFConverter:
             try:
-                self.converter = MarkdownToPDFConverter()
+                self.converter = get_shared_converter()
                 self.logger.info("PDF转换器初始化成功")
             except Exception as e:
                 self.logger.error(f"PDF转换器初始化失败: {e}")
@@ -81,6 +82,36 @@ class PDFConverterService:
             self.logger.error(f"PDF转换异常: {e}")
             return False, f"转换异常: {str(e)}", None
     
+    def render_md_content_to_pdf_bytes(self, md_content: str, original_file_path: Optional[str] = None) -> Tuple[bool, str, Optional[bytes]]:
+        """
+        在内存中将Markdown内容渲染为PDF字节
+
+        Args:
+            md_content: Markdown内容字符串
+            original_file_path: 原始文件路径，存在时以该文件内容为准，并用于获取正确的修改时间
+
+        Returns:
+            Tuple[bool, str, Optional[bytes]]: (成功标志, 消息, PDF内容)
+        """
+        if not self.converter:
+            return False, "PDF转换器未初始化", None
+
+        try:
+            # 如果有原始文件路径，直接使用原始文件内容进行转换
+            if original_file_path and os.path.exists(original_file_path):
+                with open(original_file_path, 'r', encoding='utf-8') as f:
+                    md_content = f.read()
+            else:
+                original_file_path = None
+
+            pdf_data = self.converter.convert_markdown_to_pdf(md_content, original_file_path)
+            self.logger.info(f"PDF内容转换成功: {len(md_content)} chars -> {len(pdf_data)} bytes")
+            return True, "转换成功", pdf_data
+
+        except Exception as e:
+            self.logger.error(f"PDF内容转换异常: {e}")
+            return False, f"转换异常: {str(e)}", None
+
     def convert_md_content_to_pdf(self, md_content: str, company_name: str = "报告", original_file_path: Optional[str] = None) -> Tuple[bool, str, Optional[str]]:
         """
         将Markdown内容转换为PDF
@@ -93,47 +124,19 @@ class PDFConverterService:
         Returns:
             Tuple[bool, str, Optional[str]]: (成功标志, 消息, PDF文件路径)
         """
-        if not self.converter:
-            return False, "PDF转换器未初始化", None
-            
+        success, message, pdf_data = self.render_md_content_to_pdf_bytes(md_content, original_file_path)
+        if not success:
+            return False, message, None
+
         try:
-            # 创建临时Markdown文件
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.md', 
-                                           encoding='utf-8', delete=False) as temp_md:
-                temp_md.write(md_content)
-                temp_md_path = temp_md.name
-            
-            try:
-                # 生成PDF文件路径
-                safe_company_name = "".join(c for c in company_name if c.isalnum() or c in (' ', '-', '_')).strip()
-                if not safe_company_name:
-                    safe_company_name = "报告"
-                
-                # 创建临时PDF文件
-                with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_pdf:
-                    temp_pdf_path = temp_pdf.name
-                
-                # 执行转换，如果有原始文件路径，直接使用原始文件进行转换
-                if original_file_path and os.path.exists(original_file_path):
-                    success = self.converter.convert_to_pdf(original_file_path, temp_pdf_path)
-                else:
-                    success = self.converter.convert_to_pdf(temp_md_path, temp_pdf_path)
-                
-                if success and os.path.exists(temp_pdf_path):
-                    file_size = os.path.getsize(temp_pdf_path)
-                    self.logger.info(f"PDF内容转换成功: {len(md_content)} chars -> {temp_pdf_path} ({file_size} bytes)")
-                    return True, "转换成功", temp_pdf_path
-                else:
-                    # 清理临时PDF文件
-                    if os.path.exists(temp_pdf_path):
-                        os.unlink(temp_pdf_path)
-                    return False, "转换失败，未生成PDF文件", None
-                    
-            finally:
-                # 清理临时Markdown文件
-                if os.path.exists(temp_md_path):
-                    os.unlink(temp_md_path)
-                    
+            # 渲染结果直接写入临时PDF文件，不再经过临时Markdown和HTML文件
+            with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_pdf:
+                temp_pdf.write(pdf_data)
+                temp_pdf_path = temp_pdf.name
+
+            self.logger.info(f"PDF内容转换成功: {len(md_content)} chars -> {temp_pdf_path} ({len(pdf_data)} bytes)")
+            return True, "转换成功", temp_pdf_path
+
         except Exception as e:
             self.logger.error(f"PDF内容转换异常: {e}")
             return False, f"转换异常: {str(e)}", None
@@ -167,6 +170,20 @@ def convert_report_to_pdf(md_content: str, company_name: str = "报告", origina
     return pdf_converter_service.convert_md_content_to_pdf(md_content, company_name, original_file_path)
 
 
+def render_report_pdf_bytes(md_content: str, original_file_path: Optional[str] = None) -> Tuple[bool, str, Optional[bytes]]:
+    """
+    便捷函数：在内存中将报告内容渲染为PDF字节
+
+    Args:
+        md_content: Markdown报告内容
+        original_file_path: 原始文件路径，用于获取正确的修改时间
+
+    Returns:
+        Tuple[bool, str, Optional[bytes]]: (成功标志, 消息, PDF内容)
+    """
+    return pdf_converter_service.render_md_content_to_pdf_bytes(md_content, original_file_path)
+
+
 def is_pdf_conversion_available() -> bool:
     """检查PDF转换功能是否可用"""
     return pdf_converter_service.is_available()
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+PDF渲染进程池
+WeasyPrint渲染属于CPU密集型任务，放到独立进程中执行，避免阻塞eventlet worker的事件循环
+"""
+
+import os
+import math
+import time
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import current_app, has_app_context
+
+
+class PDFRenderBusyError(Exception):
+    """PDF渲染队列已满"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"PDF渲染队列已满，请在{retry_after}秒后重试")
+        self.retry_after = retry_after
+
+
+def _render_pdf_in_worker(report_path):
+    """
+    在渲染子进程中将Markdown报告文件渲染为PDF
+
+    Args:
+        report_path: 报告Markdown文件路径
+
+    Returns:
+        Tuple[bytes, float]: (PDF内容, 渲染耗时秒数)
+    """
+    start_time = time.time()
+    from services.md_to_pdf_converter import get_shared_converter
+
+    with open(report_path, 'r', encoding='utf-8') as f:
+        markdown_content = f.read()
+
+    # 在内存中完成渲染，结果通过进程间管道直接返回
+    pdf_data = get_shared_converter().convert_markdown_to_pdf(markdown_content, report_path)
+
+    return pdf_data, time.time() - start_time
+
+
+class PDFRenderPool:
+    """
+    PDF渲染进程池：并发上限、有界队列、相同任务合并和渲染指标
+
+    并发上限、队列和任务合并都是每个gunicorn worker各自独立的，整机渲染进程数最多为
+    worker数 × PDF_RENDER_WORKERS；跨worker的重复渲染由报告渲染缓存的文件锁合并
+    """
+
+    def __init__(self, max_workers=None, max_queue=None, timeout=None):
+        self.logger = logging.getLogger(__name__)
+        self._max_workers = max_workers
+        self._max_queue = max_queue
+        self._timeout = timeout
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self._inflight = {}  # {任务键: Future}，相同任务共享同一次渲染
+        self._durations = deque(maxlen=100)
+        self._stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'rejected': 0,
+            'deduplicated': 0,
+            'timeouts': 0
+        }
+
+    def _get_config(self, name, default):
+        """获取配置：优先使用应用配置，没有应用上下文时使用环境变量"""
+        value = None
+        if has_app_context():
+            value = current_app.config.get(name)
+        if value is None:
+            value = os.environ.get(name, default)
+        return int(value)
+
+    @property
+    def max_workers(self):
+        """每个进程的渲染子进程数"""
+        return self._max_workers or self._get_config('PDF_RENDER_WORKERS', 1)
+
+    @property
+    def max_queue(self):
+        """渲染子进程都在忙时最多排队的任务数"""
+        return self._max_queue if self._max_queue is not None else self._get_config('PDF_RENDER_MAX_QUEUE', 8)
+
+    @property
+    def timeout(self):
+        """等待单次渲染结果的秒数"""
+        return self._timeout or self._get_config('PDF_RENDER_TIMEOUT', 180)
+
+    def _get_executor(self):
+        """按进程延迟创建进程池，使用spawn避免复制worker中的连接和线程状态"""
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    def _reset_executor(self):
+        """渲染子进程异常退出后重建进程池"""
+        with self._lock:
+            executor = self._executor
+            self._executor = None
+        if executor is not None:
+            try:
+                executor.shutdown(wait=False)
+            except Exception:
+                pass
+
+    def _estimate_retry_after(self, queue_depth):
+        """根据平均渲染耗时估算客户端重试等待秒数"""
+        average = sum(self._durations) / len(self._durations) if self._durations else 10.0
+        return max(1, int(math.ceil(average * queue_depth / self.max_workers)))
+
+    def _record_result(self, key, future):
+        """渲染任务结束后记录指标并移除进行中的任务"""
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+            if future.cancelled() or future.exception() is not None:
+                self._stats['failed'] += 1
+            else:
+                self._stats['completed'] += 1
+                self._durations.append(future.result()[1])
+
+    def submit(self, key, report_path):
+        """
+        提交渲染任务，相同key的任务复用正在进行的渲染
+
+        Args:
+            key: 任务键（如报告缓存键）
+            report_path: 报告Markdown文件路径
+
+        Returns:
+            Future: 结果为 (PDF内容, 渲染耗时)
+
+        Raises:
+            PDFRenderBusyError: 队列已满
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self._stats['deduplicated'] += 1
+                return future
+
+            queue_depth = len(self._inflight)
+            if queue_depth >= self.max_workers + self.max_queue:
+                self._stats['rejected'] += 1
+                raise PDFRenderBusyError(self._estimate_retry_after(queue_depth))
+
+            future = self._get_executor().submit(_render_pdf_in_worker, report_path)
+            self._inflight[key] = future
+            self._stats['submitted'] += 1
+
+        future.add_done_callback(lambda f: self._record_result(key, f))
+        return future
+
+    def render(self, key, report_path):
+        """
+        渲染PDF并等待结果
+
+        Args:
+            key: 任务键
+            report_path: 报告Markdown文件路径
+
+        Returns:
+            bytes: PDF内容
+        """
+        future = self.submit(key, report_path)
+        try:
+            pdf_data, duration = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise RuntimeError(f"PDF渲染超时({self.timeout}秒)")
+        except BrokenProcessPool:
+            self.logger.error("PDF渲染进程异常退出，重建进程池")
+            self._reset_executor()
+            raise RuntimeError("PDF渲染进程异常退出")
+
+        self.logger.info(f"PDF渲染完成: {report_path} ({len(pdf_data)} bytes, {duration:.2f}s)")
+        return pdf_data
+
+    def get_stats(self):
+        """获取渲染池指标"""
+        with self._lock:
+            durations = sorted(self._durations)
+            running = sum(1 for future in self._inflight.values() if future.running())
+            stats = dict(self._stats)
+            stats.update({
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'inflight': len(self._inflight),
+                'running': running,
+                'queue_depth': len(self._inflight) - running,
+                'avg_render_seconds': round(sum(durations) / len(durations), 3) if durations else None,
+                'p95_render_seconds': round(durations[min(len(durations) - 1, int(len(durations) * 0.95))], 3) if durations else None,
+                'max_render_seconds': round(durations[-1], 3) if durations else None
+            })
+        return stats
+
+    def shutdown(self):
+        """关闭进程池"""
+        self._reset_executor()
+
+
+# 全局渲染池实例
+pdf_render_pool = PDFRenderPool()
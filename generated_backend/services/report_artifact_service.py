@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+报告产物预渲染服务
+报告生成完成后在后台线程池中预先渲染HTML和PDF，下载时直接发送静态文件
+"""
+
+import os
+import shutil
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from database import db
+from db_models import Project
+from services.report_render_cache import report_render_cache
+
+
+class ReportArtifactService:
+    """报告产物预渲染服务"""
+
+    def __init__(self, max_workers=None, max_pending=None):
+        self.logger = logging.getLogger(__name__)
+        self.max_workers = max_workers or int(os.environ.get('REPORT_PRERENDER_WORKERS', 2))
+        self.max_pending = max_pending or int(os.environ.get('REPORT_PRERENDER_MAX_PENDING', 20))
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = set()  # 正在排队或渲染中的报告路径
+
+    def _get_executor(self):
+        """延迟创建线程池，避免在gunicorn主进程中创建线程"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix='report-prerender'
+                )
+            return self._executor
+
+    @staticmethod
+    def get_artifact_path(report_path, kind):
+        """
+        获取报告产物的存放路径（与Markdown报告在同一目录）
+
+        Args:
+            report_path: 报告Markdown文件路径
+            kind: 产物类型（html/pdf）
+
+        Returns:
+            str: 产物文件路径
+        """
+        return f"{os.path.splitext(report_path)[0]}.{kind}"
+
+    @staticmethod
+    def is_artifact_fresh(report_path, artifact_path):
+        """检查产物是否存在且不早于报告文件"""
+        if not report_path or not artifact_path:
+            return False
+        try:
+            return os.path.getmtime(artifact_path) >= os.path.getmtime(report_path)
+        except OSError:
+            return False
+
+    def schedule_prerender(self, app, project_id, report_path):
+        """
+        提交报告预渲染任务，队列已满或同一报告已在处理时直接跳过
+
+        Args:
+            app: Flask应用实例
+            project_id: 项目ID
+            report_path: 报告Markdown文件路径
+
+        Returns:
+            bool: 是否成功提交任务
+        """
+        with self._lock:
+            if report_path in self._pending:
+                self.logger.info(f"报告预渲染任务已存在，跳过: {report_path}")
+                return False
+            if len(self._pending) >= self.max_pending:
+                self.logger.warning(f"报告预渲染队列已满({self.max_pending})，跳过: {report_path}")
+                return False
+            self._pending.add(report_path)
+
+        try:
+            self._get_executor().submit(self._prerender, app, project_id, report_path)
+        except Exception as e:
+            with self._lock:
+                self._pending.discard(report_path)
+            self.logger.error(f"提交报告预渲染任务失败: {e}")
+            return False
+
+        self.logger.info(f"报告预渲染任务已提交: 项目 {project_id}, {report_path}")
+        return True
+
+    def _prerender(self, app, project_id, report_path):
+        """渲染后处理Markdown、HTML和PDF，并将产物路径记录到项目"""
+        try:
+            with app.app_context():
+                try:
+                    # 后处理Markdown只写入渲染缓存，HTML和PDF同时复制到报告目录
+                    report_render_cache.get_processed_markdown(report_path)
+
+                    artifact_paths = {}
+                    for kind, render in (('html', report_render_cache.get_html_path),
+                                         ('pdf', report_render_cache.get_pdf_path)):
+                        try:
+                            cached_path, _ = render(report_path)
+                            artifact_path = self.get_artifact_path(report_path, kind)
+                            temp_path = f"{artifact_path}.tmp"
+                            shutil.copyfile(cached_path, temp_path)
+                            os.replace(temp_path, artifact_path)
+                            artifact_paths[kind] = artifact_path
+                        except Exception as e:
+                            self.logger.error(f"报告{kind.upper()}预渲染失败: {report_path}, {e}")
+
+                    project = db.session.get(Project, project_id)
+                    # 报告已被删除或重新生成时不再记录
+                    if not project or project.report_path != report_path:
+                        self.logger.info(f"报告已变更，丢弃预渲染结果: 项目 {project_id}")
+                        return
+
+                    project.report_html_path = artifact_paths.get('html')
+                    project.report_pdf_path = artifact_paths.get('pdf')
+                    db.session.commit()
+                    self.logger.info(f"报告预渲染完成: 项目 {project_id}, 产物 {artifact_paths}")
+                except Exception as e:
+                    self.logger.error(f"报告预渲染失败: 项目 {project_id}, {e}")
+                    db.session.rollback()
+        finally:
+            with self._lock:
+                self._pending.discard(report_path)
+
+    def delete_artifacts(self, project):
+        """删除项目报告的预渲染产物并清空记录"""
+        for artifact_path in (project.report_html_path, project.report_pdf_path):
+            if artifact_path and os.path.exists(artifact_path):
+                try:
+                    os.remove(artifact_path)
+                except Exception as e:
+                    self.logger.warning(f"删除报告产物失败: {artifact_path}, {e}")
+        project.report_html_path = None
+        project.report_pdf_path = None
+
+
+# 全局服务实例
+report_artifact_service = ReportArtifactService()
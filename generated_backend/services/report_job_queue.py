@@ -0,0 +1,430 @@
+# -*- coding: utf-8 -*-
+"""
+报告生成任务队列
+Web请求只写入任务表并返回任务ID，由报告worker（独立进程或嵌入Web进程）按并发上限领取执行；
+领取时按租户当前执行数做公平调度，失败按指数退避重试，入队时做准入控制
+"""
+
+import os
+import time
+import random
+import socket
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from database import db
+from db_models import Project, ReportJob, ReportJobStatus
+
+
+class ReportJobAdmissionError(Exception):
+    """任务队列已满或租户排队任务过多，拒绝入队"""
+
+    def __init__(self, message, retry_after=30):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ReportJobOwnershipLostError(Exception):
+    """任务已不属于当前worker（心跳超时后被重新排队或被其他worker领取），不能再更新其状态"""
+
+
+# 排队中和执行中的任务状态
+ACTIVE_JOB_STATUSES = (ReportJobStatus.QUEUED, ReportJobStatus.RUNNING)
+
+
+class ReportJobQueue:
+    """报告生成任务队列（MySQL任务表）"""
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.max_queued = int(os.environ.get('REPORT_JOB_MAX_QUEUED', 100))
+        self.max_per_tenant = int(os.environ.get('REPORT_JOB_MAX_PER_TENANT', 5))
+        self.max_attempts = int(os.environ.get('REPORT_JOB_MAX_ATTEMPTS', 3))
+        self.backoff_base = int(os.environ.get('REPORT_JOB_BACKOFF_SECONDS', 30))
+        self.backoff_max = int(os.environ.get('REPORT_JOB_BACKOFF_MAX_SECONDS', 600))
+        self.stale_seconds = int(os.environ.get('REPORT_JOB_STALE_SECONDS', 300))
+
+    def enqueue(self, project, dataset_id, company_name, knowledge_name):
+        """
+        创建报告生成任务（调用方负责更新项目状态并提交事务）
+
+        Args:
+            project: 项目
+            dataset_id: 知识库数据集ID
+            company_name: 公司名称
+            knowledge_name: 知识库名称
+
+        Returns:
+            ReportJob: 新任务；项目已有排队或执行中的任务时返回该任务
+            （项目行锁持有到调用方提交，并发请求不会重复创建任务）
+
+        Raises:
+            ReportJobAdmissionError: 队列已满或租户排队任务过多
+        """
+        # 锁定项目行，同一项目的并发入队请求在此排队，直到调用方提交事务；
+        # 之后用加锁读取（读取最新已提交数据，不受事务快照影响）检查已有任务
+        Project.query.filter_by(id=project.id).with_for_update().populate_existing().one()
+        existing = self.get_active_job(project.id, for_update=True)
+        if existing:
+            return existing
+
+        tenant_id = project.created_by
+        queued_total = ReportJob.query.filter(ReportJob.status == ReportJobStatus.QUEUED).count()
+        if queued_total >= self.max_queued:
+            raise ReportJobAdmissionError(f"报告生成队列已满（{queued_total}个任务排队），请稍后重试", 60)
+
+        tenant_active = ReportJob.query.filter(
+            ReportJob.tenant_id == tenant_id,
+            ReportJob.status.in_(ACTIVE_JOB_STATUSES)
+        ).count()
+        if tenant_active >= self.max_per_tenant:
+            raise ReportJobAdmissionError(f"您已有{tenant_active}个报告正在生成或排队，请等待完成后再提交", 30)
+
+        job = ReportJob(
+            project_id=project.id,
+            tenant_id=tenant_id,
+            dataset_id=dataset_id,
+            company_name=company_name,
+            knowledge_name=knowledge_name,
+            status=ReportJobStatus.QUEUED,
+            max_attempts=self.max_attempts,
+            next_run_at=datetime.utcnow()
+        )
+        db.session.add(job)
+        db.session.flush()
+        return job
+
+    def get_job(self, job_id):
+        """获取任务"""
+        return db.session.get(ReportJob, job_id)
+
+    def get_active_job(self, project_id, for_update=False):
+        """获取项目排队中或执行中的任务"""
+        query = ReportJob.query.filter(
+            ReportJob.project_id == project_id,
+            ReportJob.status.in_(ACTIVE_JOB_STATUSES)
+        ).order_by(ReportJob.id.desc())
+        if for_update:
+            query = query.with_for_update()
+        return query.first()
+
+    def get_queue_position(self, job):
+        """任务在队列中的位置（之前还有多少排队任务），非排队状态返回None"""
+        if job.status != ReportJobStatus.QUEUED:
+            return None
+        return ReportJob.query.filter(
+            ReportJob.status == ReportJobStatus.QUEUED,
+            ReportJob.id < job.id
+        ).count()
+
+    def claim_next(self, worker_id):
+        """
+        领取下一个可执行的任务：在到期的排队任务中，优先选择当前执行数最少的租户，同一租户内先进先出
+
+        Args:
+            worker_id: worker标识
+
+        Returns:
+            ReportJob: 已标记为执行中的任务，没有可执行任务时返回None
+        """
+        now = datetime.utcnow()
+        try:
+            candidates = ReportJob.query.filter(
+                ReportJob.status == ReportJobStatus.QUEUED,
+                ReportJob.next_run_at <= now
+            ).order_by(ReportJob.id).limit(50).with_for_update(skip_locked=True).all()
+            if not candidates:
+                db.session.rollback()
+                return None
+
+            running_by_tenant = dict(
+                db.session.query(ReportJob.tenant_id, func.count(ReportJob.id))
+                .filter(ReportJob.status == ReportJobStatus.RUNNING)
+                .group_by(ReportJob.tenant_id)
+                .all()
+            )
+            job = min(candidates, key=lambda j: (running_by_tenant.get(j.tenant_id, 0), j.id))
+
+            job.status = ReportJobStatus.RUNNING
+            job.attempts = (job.attempts or 0) + 1
+            job.locked_by = worker_id
+            job.started_at = now
+            job.heartbeat_at = now
+            db.session.commit()
+            return job
+        except Exception as e:
+            db.session.rollback()
+            self.logger.error(f"领取报告生成任务失败: {e}")
+            return None
+
+    def _owned_by(self, job_id, worker_id):
+        """当前worker执行中的任务（按此条件更新，任务被重新调度后不会覆盖新owner的状态）"""
+        return ReportJob.query.filter(
+            ReportJob.id == job_id,
+            ReportJob.status == ReportJobStatus.RUNNING,
+            ReportJob.locked_by == worker_id
+        )
+
+    def _update_owned(self, job, worker_id, values):
+        """更新当前worker执行中的任务并提交，更新不到时抛出 ReportJobOwnershipLostError"""
+        updated = self._owned_by(job.id, worker_id).update(values, synchronize_session=False)
+        if not updated:
+            db.session.rollback()
+            raise ReportJobOwnershipLostError(f"报告生成任务 {job.id} 已不属于 {worker_id}")
+        db.session.commit()
+
+    def _lock_owned(self, job_id, worker_id):
+        """锁定并重新读取当前worker执行中的任务，任务已不属于该worker时抛出 ReportJobOwnershipLostError"""
+        job = self._owned_by(job_id, worker_id).with_for_update().populate_existing().first()
+        if job is None:
+            db.session.rollback()
+            raise ReportJobOwnershipLostError(f"报告生成任务 {job_id} 已不属于 {worker_id}")
+        return job
+
+    def heartbeat(self, job_id, worker_id):
+        """刷新当前worker执行中任务的心跳"""
+        try:
+            self._owned_by(job_id, worker_id).update({ReportJob.heartbeat_at: datetime.utcnow()}, synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            self.logger.warning(f"报告生成任务心跳失败: {job_id}, {e}")
+
+    def complete(self, job, worker_id):
+        """
+        标记任务完成
+
+        Raises:
+            ReportJobOwnershipLostError: 任务已不属于该worker
+        """
+        self._update_owned(job, worker_id, {
+            ReportJob.status: ReportJobStatus.SUCCEEDED,
+            ReportJob.finished_at: datetime.utcnow(),
+            ReportJob.last_error: None
+        })
+
+    def get_backoff_seconds(self, attempts):
+        """第attempts次失败后的重试等待时间（指数退避加随机抖动）"""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** max(0, attempts - 1)))
+        return delay * random.uniform(0.8, 1.2)
+
+    def fail(self, job, error, worker_id):
+        """
+        记录任务失败，未超过最大次数时按退避时间重新排队；用户已停止生成的任务直接取消，不再重试
+
+        Args:
+            job: 任务
+            error: 失败原因
+            worker_id: 执行该任务的worker标识（任务须仍由其执行中）
+
+        Returns:
+            bool: 是否会重试
+
+        Raises:
+            ReportJobOwnershipLostError: 任务已不属于该worker
+        """
+        # 锁定任务行后再读取取消标志，与 cancel_project_jobs 的标记互斥
+        job = self._lock_owned(job.id, worker_id)
+        will_retry = self._apply_failure(job, error)
+        db.session.commit()
+        return will_retry
+
+    def _apply_failure(self, job, error):
+        """在已锁定的任务上记录失败（不提交事务），返回是否会重试"""
+        now = datetime.utcnow()
+        job.last_error = str(error)[:2000]
+        job.locked_by = None
+        if job.cancel_requested:
+            job.status = ReportJobStatus.CANCELLED
+            job.finished_at = now
+            return False
+        if job.attempts < job.max_attempts:
+            job.status = ReportJobStatus.QUEUED
+            job.next_run_at = now + timedelta(seconds=self.get_backoff_seconds(job.attempts))
+            return True
+        job.status = ReportJobStatus.FAILED
+        job.finished_at = now
+        return False
+
+    def cancel_project_jobs(self, project_id):
+        """
+        取消项目排队中的任务；执行中的任务通过工作流停止标志终止，并标记为已请求取消，
+        停止导致本次执行失败时直接取消，不再按退避重新排队
+
+        Returns:
+            int: 取消的排队任务数
+        """
+        count = ReportJob.query.filter(
+            ReportJob.project_id == project_id,
+            ReportJob.status == ReportJobStatus.QUEUED
+        ).update({
+            ReportJob.status: ReportJobStatus.CANCELLED,
+            ReportJob.finished_at: datetime.utcnow()
+        }, synchronize_session=False)
+        ReportJob.query.filter(
+            ReportJob.project_id == project_id,
+            ReportJob.status == ReportJobStatus.RUNNING
+        ).update({ReportJob.cancel_requested: True}, synchronize_session=False)
+        return count
+
+    def requeue_stale_jobs(self):
+        """
+        执行中但心跳超时的任务（worker异常退出）重新排队或标记失败
+
+        Returns:
+            int: 处理的任务数
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_seconds)
+        try:
+            stale_jobs = ReportJob.query.filter(
+                ReportJob.status == ReportJobStatus.RUNNING,
+                ReportJob.heartbeat_at < cutoff
+            ).with_for_update(skip_locked=True).all()
+            # 所有任务在持有行锁的同一事务中处理，最后统一提交，其他worker的检查线程会跳过这些行
+            for job in stale_jobs:
+                self.logger.warning(f"报告生成任务心跳超时，重新调度: {job.id} (worker {job.locked_by})")
+                self._apply_failure(job, f"worker {job.locked_by} 心跳超时")
+            db.session.commit()
+            return len(stale_jobs)
+        except Exception as e:
+            db.session.rollback()
+            self.logger.error(f"处理心跳超时的报告生成任务失败: {e}")
+            return 0
+
+    def get_stats(self):
+        """获取队列统计"""
+        counts = dict(
+            db.session.query(ReportJob.status, func.count(ReportJob.id))
+            .filter(ReportJob.status.in_(ACTIVE_JOB_STATUSES))
+            .group_by(ReportJob.status)
+            .all()
+        )
+        return {
+            'queued': counts.get(ReportJobStatus.QUEUED, 0),
+            'running': counts.get(ReportJobStatus.RUNNING, 0),
+            'max_queued': self.max_queued,
+            'max_per_tenant': self.max_per_tenant
+        }
+
+
+class ReportJobWorker:
+    """报告生成worker：固定数量的执行线程循环领取并执行任务"""
+
+    def __init__(self, app, concurrency=None, poll_interval=None):
+        self.app = app
+        self.logger = logging.getLogger(__name__)
+        self.concurrency = concurrency or int(os.environ.get('REPORT_WORKER_CONCURRENCY', 2))
+        self.poll_interval = poll_interval or float(os.environ.get('REPORT_WORKER_POLL_INTERVAL', 2))
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._stop_event = threading.Event()
+        self._threads = []
+
+    def start(self):
+        """启动执行线程和心跳超时检查线程"""
+        for index in range(self.concurrency):
+            thread = threading.Thread(target=self._run_slot, args=(index,), name=f'report-worker-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        reaper = threading.Thread(target=self._run_reaper, name='report-worker-reaper', daemon=True)
+        reaper.start()
+        self._threads.append(reaper)
+        self.logger.info(f"报告生成worker已启动: {self.worker_id}, 并发 {self.concurrency}")
+
+    def stop(self, timeout=None):
+        """停止领取新任务，等待执行中的任务完成"""
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _run_slot(self, index):
+        """执行线程：领取任务并执行，队列为空时等待"""
+        while not self._stop_event.is_set():
+            executed = False
+            try:
+                with self.app.app_context():
+                    job = report_job_queue.claim_next(f"{self.worker_id}#{index}")
+                    if job:
+                        executed = True
+                        self._execute(job)
+            except Exception as e:
+                self.logger.error(f"报告生成worker执行异常: {e}")
+            if not executed:
+                self._stop_event.wait(self.poll_interval)
+
+    def _run_reaper(self):
+        """定期把心跳超时的任务重新排队"""
+        while not self._stop_event.wait(60):
+            try:
+                with self.app.app_context():
+                    report_job_queue.requeue_stale_jobs()
+            except Exception as e:
+                self.logger.error(f"检查心跳超时任务失败: {e}")
+
+    def _execute(self, job):
+        """执行单个任务：失败时按退避重试，最后一次失败时才将项目置为未生成"""
+        from api.reports import execute_report_job
+
+        job_id = job.id
+        owner = job.locked_by
+        final_attempt = job.attempts >= job.max_attempts
+        self.logger.info(f"开始执行报告生成任务 {job_id}: 项目 {job.project_id}, 第{job.attempts}次")
+
+        stop_heartbeat = threading.Event()
+
+        def heartbeat():
+            while not stop_heartbeat.wait(30):
+                with self.app.app_context():
+                    report_job_queue.heartbeat(job_id, owner)
+
+        heartbeat_thread = threading.Thread(target=heartbeat, name=f'report-job-heartbeat-{job_id}', daemon=True)
+        heartbeat_thread.start()
+        started = time.time()
+        try:
+            try:
+                execute_report_job(job, final_attempt=final_attempt)
+            except Exception as e:
+                db.session.rollback()
+                job = report_job_queue.get_job(job_id)
+                will_retry = report_job_queue.fail(job, e, owner)
+                if will_retry:
+                    self.logger.warning(f"报告生成任务 {job_id} 失败，将于 {job.next_run_at} 重试: {e}")
+                elif job.status == ReportJobStatus.CANCELLED:
+                    self.logger.info(f"报告生成任务 {job_id} 已被用户停止，不再重试: {e}")
+                else:
+                    self.logger.error(f"报告生成任务 {job_id} 失败，不再重试: {e}")
+            else:
+                job = report_job_queue.get_job(job_id)
+                report_job_queue.complete(job, owner)
+                self.logger.info(f"报告生成任务 {job_id} 完成，耗时 {time.time() - started:.1f}s")
+        except ReportJobOwnershipLostError as e:
+            self.logger.warning(f"报告生成任务 {job_id} 已被重新调度，不再更新其状态: {e}")
+        finally:
+            stop_heartbeat.set()
+
+
+# 全局任务队列实例
+report_job_queue = ReportJobQueue()
+
+_embedded_worker = None
+_embedded_worker_lock = threading.Lock()
+
+
+def start_embedded_report_worker(app):
+    """
+    在当前Web进程中启动报告生成worker（REPORT_JOB_EXECUTION=embedded时使用，
+    单机部署无需单独运行 report_worker.py）
+    """
+    global _embedded_worker
+    if os.environ.get('REPORT_JOB_EXECUTION', 'embedded').lower() != 'embedded':
+        return None
+    with _embedded_worker_lock:
+        if _embedded_worker is None:
+            _embedded_worker = ReportJobWorker(
+                app,
+                concurrency=int(os.environ.get('REPORT_EMBEDDED_WORKER_CONCURRENCY', 1))
+            )
+            _embedded_worker.start()
+    return _embedded_worker
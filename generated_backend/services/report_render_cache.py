@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+报告渲染缓存服务
+按内容寻址缓存报告的后处理Markdown、HTML和PDF，避免重复渲染
+"""
+
+import os
+import time
+import hashlib
+import logging
+import threading
+import tempfile
+from contextlib import contextmanager
+from typing import Tuple
+
+from flask import current_app, has_app_context
+
+from services.markdown_postprocessor import process_markdown_content
+
+
+# 渲染器版本号：后处理逻辑、HTML模板或CSS样式变化时需要递增，使旧缓存失效
+RENDERER_VERSION = '1'
+
+# 缓存产物类型及对应的文件扩展名
+ARTIFACT_EXTENSIONS = {
+    'markdown': '.md',
+    'html': '.html',
+    'pdf': '.pdf',
+}
+
+
+class ReportRenderCache:
+    """报告渲染产物缓存（磁盘存储，按总大小做LRU淘汰）"""
+
+    DEFAULT_CACHE_DIR = os.path.join('output', '.render_cache')
+    DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+    LOCK_DIR_NAME = '.locks'
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.lock_timeout = int(os.environ.get('REPORT_RENDER_LOCK_TIMEOUT', 300))
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        # {(abs_path, mtime_ns, size): content_hash}，避免文件未变化时重复计算哈希
+        self._hash_memo = {}
+
+    def _get_config(self):
+        """获取缓存目录和容量上限"""
+        cache_dir = None
+        max_bytes = None
+        if has_app_context():
+            cache_dir = current_app.config.get('REPORT_RENDER_CACHE_DIR')
+            max_bytes = current_app.config.get('REPORT_RENDER_CACHE_MAX_BYTES')
+        cache_dir = cache_dir or os.environ.get('REPORT_RENDER_CACHE_DIR') or self.DEFAULT_CACHE_DIR
+        max_bytes = int(max_bytes or os.environ.get('REPORT_RENDER_CACHE_MAX_BYTES') or self.DEFAULT_MAX_BYTES)
+        return cache_dir, max_bytes
+
+    def _get_key_lock(self, key):
+        """获取单个缓存键的锁，防止同一报告被并发重复渲染"""
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = threading.Lock()
+                self._key_locks[key] = lock
+            return lock
+
+    def _release_key_lock(self, key):
+        """渲染完成后移除缓存键锁"""
+        with self._lock:
+            self._key_locks.pop(key, None)
+
+    @contextmanager
+    def _file_lock(self, cache_dir, lock_key):
+        """
+        跨worker进程的渲染锁，同一产物在所有worker中只渲染一次
+
+        锁文件按键的前3位和产物类型分片（数量有上限，无需清理）；非阻塞加锁后轮询等待，
+        不阻塞eventlet事件循环。超时后不再等待，直接渲染
+        """
+        try:
+            import fcntl
+        except ImportError:
+            yield
+            return
+
+        lock_dir = os.path.join(cache_dir, self.LOCK_DIR_NAME)
+        os.makedirs(lock_dir, exist_ok=True)
+        kind = lock_key.rsplit('-', 1)[-1]
+        fd = os.open(os.path.join(lock_dir, f"{lock_key[:3]}-{kind}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            deadline = time.time() + self.lock_timeout
+            locked = False
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    locked = True
+                    break
+                except BlockingIOError:
+                    if time.time() >= deadline:
+                        self.logger.warning(f"等待其他worker渲染超时，直接渲染: {lock_key}")
+                        break
+                    time.sleep(0.2)
+            try:
+                yield
+            finally:
+                if locked:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def _content_hash(self, report_path, stat_result):
+        """计算报告文件内容的SHA-256"""
+        memo_key = (os.path.abspath(report_path), stat_result.st_mtime_ns, stat_result.st_size)
+        content_hash = self._hash_memo.get(memo_key)
+        if content_hash:
+            return content_hash
+
+        sha256 = hashlib.sha256()
+        with open(report_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(block)
+        content_hash = sha256.hexdigest()
+
+        with self._lock:
+            if len(self._hash_memo) > 1024:
+                self._hash_memo.clear()
+            self._hash_memo[memo_key] = content_hash
+        return content_hash
+
+    def get_cache_key(self, report_path):
+        """
+        计算报告的缓存键：报告路径 + 修改时间 + 内容哈希 + 渲染器版本
+
+        Args:
+            report_path: 报告Markdown文件路径
+
+        Returns:
+            str: 缓存键（同时作为ETag使用）
+        """
+        stat_result = os.stat(report_path)
+        content_hash = self._content_hash(report_path, stat_result)
+        raw_key = f"{os.path.abspath(report_path)}|{stat_result.st_mtime_ns}|{content_hash}|{RENDERER_VERSION}"
+        return hashlib.sha256(raw_key.encode('utf-8')).hexdigest()
+
+    def get_etag(self, report_path, kind):
+        """
+        获取报告某类渲染产物的ETag
+
+        Args:
+            report_path: 报告Markdown文件路径
+            kind: 产物类型（markdown/html/pdf）
+
+        Returns:
+            str: ETag（不含引号）
+        """
+        return f"{self.get_cache_key(report_path)[:32]}-{kind}"
+
+    def _artifact_path(self, cache_dir, key, kind):
+        """缓存产物在磁盘上的路径"""
+        return os.path.join(cache_dir, key[:2], f"{key}{ARTIFACT_EXTENSIONS[kind]}")
+
+    def _touch(self, path):
+        """更新访问时间，用于LRU淘汰"""
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+    def _write_atomic(self, path, data):
+        """先写临时文件再重命名，避免其他worker读到写了一半的文件"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+    def _evict(self, cache_dir, max_bytes):
+        """缓存总大小超过上限时，按最近访问时间淘汰最旧的产物"""
+        entries = []
+        total_size = 0
+        for root, dirs, files in os.walk(cache_dir):
+            if self.LOCK_DIR_NAME in dirs:
+                dirs.remove(self.LOCK_DIR_NAME)
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat_result = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat_result.st_mtime, stat_result.st_size, path))
+                total_size += stat_result.st_size
+
+        if total_size <= max_bytes:
+            return
+
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= max_bytes:
+                break
+            try:
+                os.unlink(path)
+                total_size -= size
+                self.logger.info(f"报告渲染缓存淘汰: {path}")
+            except OSError:
+                pass
+
+    def _get_or_render(self, report_path, kind, render_func):
+        """
+        获取缓存产物，未命中时调用render_func生成并写入缓存
+
+        Args:
+            report_path: 报告Markdown文件路径
+            kind: 产物类型（markdown/html/pdf）
+            render_func: 渲染函数，返回bytes
+
+        Returns:
+            Tuple[str, str]: (缓存文件路径, ETag)
+        """
+        cache_dir, max_bytes = self._get_config()
+        key = self.get_cache_key(report_path)
+        artifact_path = self._artifact_path(cache_dir, key, kind)
+        etag = f"{key[:32]}-{kind}"
+        lock_key = f"{key}-{kind}"
+
+        if os.path.exists(artifact_path):
+            self._touch(artifact_path)
+            return artifact_path, etag
+
+        key_lock = self._get_key_lock(lock_key)
+        try:
+            # 进程内按键加线程锁，再加跨进程文件锁；拿到锁后重新检查，其他worker可能已经写入
+            with key_lock, self._file_lock(cache_dir, lock_key):
+                if not os.path.exists(artifact_path):
+                    data = render_func()
+                    self._write_atomic(artifact_path, data)
+                    self.logger.info(f"报告渲染缓存写入: {kind} {report_path} -> {artifact_path} ({len(data)} bytes)")
+                    try:
+                        self._evict(cache_dir, max_bytes)
+                    except Exception as e:
+                        self.logger.warning(f"报告渲染缓存淘汰失败: {e}")
+        finally:
+            self._release_key_lock(lock_key)
+
+        return artifact_path, etag
+
+    def get_processed_markdown(self, report_path) -> Tuple[str, str]:
+        """
+        获取后处理后的Markdown内容
+
+        Returns:
+            Tuple[str, str]: (后处理后的Markdown内容, ETag)
+        """
+        def render():
+            with open(report_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            try:
+                processed_content = process_markdown_content(content)
+            except Exception as e:
+                self.logger.warning(f"报告内容后处理失败，使用原内容: {e}")
+                processed_content = content
+            return processed_content.encode('utf-8')
+
+        artifact_path, etag = self._get_or_render(report_path, 'markdown', render)
+        with open(artifact_path, 'r', encoding='utf-8') as f:
+            return f.read(), etag
+
+    def get_html_path(self, report_path) -> Tuple[str, str]:
+        """
+        获取HTML渲染产物路径
+
+        Returns:
+            Tuple[str, str]: (HTML文件路径, ETag)
+        """
+        def render():
+            from services.md_to_pdf_converter import get_shared_converter
+
+            processed_content, _ = self.get_processed_markdown(report_path)
+            html_content = get_shared_converter().convert_markdown_to_html(processed_content, report_path)
+            return html_content.encode('utf-8')
+
+        return self._get_or_render(report_path, 'html', render)
+
+    def get_html(self, report_path) -> Tuple[str, str]:
+        """
+        获取HTML渲染内容
+
+        Returns:
+            Tuple[str, str]: (HTML内容, ETag)
+        """
+        html_path, etag = self.get_html_path(report_path)
+        with open(html_path, 'r', encoding='utf-8') as f:
+            return f.read(), etag
+
+    def get_pdf_path(self, report_path) -> Tuple[str, str]:
+        """
+        获取PDF渲染产物路径
+
+        Returns:
+            Tuple[str, str]: (PDF文件路径, ETag)
+
+        Raises:
+            PDFRenderBusyError: PDF渲染队列已满
+        """
+        def render():
+            # 在独立的渲染进程中执行，队列已满时抛出PDFRenderBusyError
+            from services.pdf_render_pool import pdf_render_pool
+
+            return pdf_render_pool.render(self.get_etag(report_path, 'pdf'), report_path)
+
+        return self._get_or_render(report_path, 'pdf', render)
+
+    def invalidate(self, report_path) -> None:
+        """删除报告对应的全部缓存产物（报告文件仍存在时）"""
+        if not report_path or not os.path.exists(report_path):
+            return
+        try:
+            cache_dir, _ = self._get_config()
+            key = self.get_cache_key(report_path)
+            for kind in ARTIFACT_EXTENSIONS:
+                artifact_path = self._artifact_path(cache_dir, key, kind)
+                if os.path.exists(artifact_path):
+                    os.unlink(artifact_path)
+        except Exception as e:
+            self.logger.warning(f"清理报告渲染缓存失败: {e}")
+
+
+# 创建全局缓存实例
+report_render_cache = ReportRenderCache()
@@ -0,0 +1,423 @@
+# -*- coding: utf-8 -*-
+"""
+实时统计计数器
+stat_counters 表保存仪表板所需的各项数量（名称与统计聚合的字段名一致）：
+项目、文档、用户的插入/修改/删除在flush时汇总为增量，与数据变更在同一事务中写入计数器表，
+仪表板直接按主键读取计数器。批量 update/delete 绕过了ORM事件，已知状态转换的批量修改
+（如解析状态轮询）在 counted_bulk_changes 中由调用方用 add_transition_deltas 写入增量；
+后台线程定期用统计聚合的结果校对并修复计数器偏差（包括其他批量修改造成的偏差）
+"""
+
+import os
+import enum
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session, object_session
+
+from database import db
+from db_models import (
+    Project, Document, User, StatCounter,
+    ProjectStatus, ProjectType, DocumentStatus, RiskLevel
+)
+from services.stats_aggregator import StatsAggregator, average_score
+
+
+def _enum_value(value):
+    """枚举取值（也兼容直接赋值的字符串）"""
+    if value is None:
+        return None
+    if isinstance(value, enum.Enum):
+        return value.value
+    return str(value).lower()
+
+
+def _count_as(template):
+    """属性值对应的计数器（值为空时不计数）"""
+    def contributions(value):
+        value = _enum_value(value)
+        return {template.format(value): 1} if value else {}
+    return contributions
+
+
+def _score_contributions(score):
+    if score is None:
+        return {}
+    return {'project_score_sum': score, 'scored_projects': 1}
+
+
+def _active_contributions(is_active):
+    return {'active_users': 1} if is_active else {}
+
+
+# 各模型的总数计数器和 {属性: 属性值 -> {计数器: 数量}}
+TRACKED_MODELS = {
+    Project: ('total_projects', {
+        'status': _count_as('{}_projects'),
+        'type': _count_as('{}_projects'),
+        'risk_level': _count_as('{}_risk_projects'),
+        'score': _score_contributions
+    }),
+    Document: ('total_documents', {
+        'status': _count_as('{}_documents')
+    }),
+    User: ('total_users', {
+        'is_active': _active_contributions
+    })
+}
+
+# 所有计数器名称（recently_active_users 与时间有关，读取时按 last_login 索引实时统计，计数器只在校对时更新）
+COUNTER_NAMES = sorted(
+    ['total_projects', 'total_documents', 'total_users', 'active_users', 'recently_active_users',
+     'project_score_sum', 'scored_projects']
+    + [f'{status.value}_projects' for status in ProjectStatus]
+    + [f'{project_type.value}_projects' for project_type in ProjectType]
+    + [f'{risk_level.value}_risk_projects' for risk_level in RiskLevel]
+    + [f'{status.value}_documents' for status in DocumentStatus]
+)
+
+# 项目类型、状态、风险等级或评分每次变化时加1，用于跨进程判断项目分布缓存是否过期（不参与校对）
+PROJECT_VERSION_COUNTER = 'project_distribution_version'
+
+_DELTAS_KEY = 'stat_counter_deltas'
+_COUNTED_BULK_KEY = 'stat_counter_counted_bulk'
+_hooks_registered = False
+
+logger = logging.getLogger(__name__)
+
+
+def _add_deltas(target, values, sign):
+    """将对象的计数贡献累加到所在会话的增量中"""
+    session = object_session(target)
+    if session is None:
+        return
+    deltas = session.info.setdefault(_DELTAS_KEY, {})
+    for name, amount in values.items():
+        deltas[name] = deltas.get(name, 0) + sign * amount
+
+
+def _bump_version(target):
+    if isinstance(target, Project):
+        _add_deltas(target, {PROJECT_VERSION_COUNTER: 1}, 1)
+
+
+def _contributions(target, value_of):
+    total_name, attributes = TRACKED_MODELS[type(target)]
+    values = {total_name: 1}
+    for attribute, contribution in attributes.items():
+        for name, amount in contribution(value_of(attribute)).items():
+            values[name] = values.get(name, 0) + amount
+    return values
+
+
+def _after_insert(mapper, connection, target):
+    _add_deltas(target, _contributions(target, lambda attribute: getattr(target, attribute)), 1)
+    _bump_version(target)
+
+
+def _before_delete(mapper, connection, target):
+    # 在DELETE执行前读取属性（已过期的属性此时还能从数据库加载）
+    _add_deltas(target, _contributions(target, lambda attribute: getattr(target, attribute)), -1)
+    _bump_version(target)
+
+
+def _before_update(mapper, connection, target):
+    _, attributes = TRACKED_MODELS[type(target)]
+    state = inspect(target)
+    changed = False
+    for attribute, contribution in attributes.items():
+        history = state.attrs[attribute].history
+        if not history.has_changes():
+            continue
+        old_value = history.deleted[0] if history.deleted else None
+        new_value = history.added[0] if history.added else None
+        _add_deltas(target, contribution(old_value), -1)
+        _add_deltas(target, contribution(new_value), 1)
+        changed = True
+    if changed:
+        _bump_version(target)
+
+
+def _before_flush(session, flush_context, instances):
+    session.info.pop(_DELTAS_KEY, None)
+
+
+def _after_flush(session, flush_context):
+    """将本次flush的增量写入计数器表（与数据变更在同一事务中）"""
+    deltas = session.info.pop(_DELTAS_KEY, None)
+    if not deltas:
+        return
+    _apply_deltas(session.connection(), deltas)
+
+
+def _apply_deltas(connection, deltas):
+    params = [{'name': name, 'delta': delta} for name, delta in sorted(deltas.items()) if delta]
+    if not params:
+        return
+    if connection.dialect.name == 'mysql':
+        connection.execute(text(
+            "INSERT INTO stat_counters (name, value, updated_at) VALUES (:name, :delta, UTC_TIMESTAMP()) "
+            "ON DUPLICATE KEY UPDATE value = value + VALUES(value), updated_at = UTC_TIMESTAMP()"
+        ), params)
+    else:
+        connection.execute(text(
+            "INSERT INTO stat_counters (name, value, updated_at) VALUES (:name, :delta, CURRENT_TIMESTAMP) "
+            "ON CONFLICT (name) DO UPDATE SET value = stat_counters.value + excluded.value, "
+            "updated_at = CURRENT_TIMESTAMP"
+        ), params)
+
+
+def _after_bulk_change(context):
+    """
+    批量 update/delete 不触发ORM事件：在 counted_bulk_changes 中执行的由调用方写入增量，
+    其他的由定期校对修复（不立即校对，校对需要扫描全表）
+    """
+    mapper = getattr(context, 'mapper', None)
+    if (mapper is None or mapper.class_ in TRACKED_MODELS) and not context.session.info.get(_COUNTED_BULK_KEY):
+        logger.debug("批量修改未写入计数器增量，将由定期校对修复")
+    if mapper is None or mapper.class_ is Project:
+        _apply_deltas(context.session.connection(), {PROJECT_VERSION_COUNTER: 1})
+
+
+def _after_soft_rollback(session, previous_transaction):
+    session.info.pop(_DELTAS_KEY, None)
+
+
+@contextmanager
+def counted_bulk_changes(session=None):
+    """
+    在其中执行的批量修改由调用方通过 add_transition_deltas 写入计数器增量
+
+    Args:
+        session: 执行批量修改的会话，默认使用 db.session
+    """
+    session = session or db.session
+    session.info[_COUNTED_BULK_KEY] = True
+    try:
+        yield session
+    finally:
+        session.info.pop(_COUNTED_BULK_KEY, None)
+
+
+def add_transition_deltas(template, old_value, new_value, count, session=None):
+    """
+    写入批量状态转换的计数器增量（与批量修改在同一事务中）
+
+    Args:
+        template: 计数器名称模板，如 '{}_documents'
+        old_value: 转换前的值（批量修改的筛选条件中必须限定该值）
+        new_value: 转换后的值
+        count: 实际修改的行数（批量 update 的返回值）
+        session: 执行批量修改的会话，默认使用 db.session
+    """
+    if not count or _enum_value(old_value) == _enum_value(new_value):
+        return
+    _apply_deltas((session or db.session).connection(), {
+        template.format(_enum_value(old_value)): -count,
+        template.format(_enum_value(new_value)): count
+    })
+
+
+def _load_old_value(target, value, oldvalue, initiator):
+    """占位监听器：active_history 使属性在修改前加载旧值，保证更新时能算出增量"""
+
+
+def register_stat_counter_hooks():
+    """注册计数器维护事件（重复调用只注册一次）"""
+    global _hooks_registered
+    if _hooks_registered:
+        return
+    for model, (_, attributes) in TRACKED_MODELS.items():
+        event.listen(model, 'after_insert', _after_insert)
+        event.listen(model, 'before_update', _before_update)
+        event.listen(model, 'before_delete', _before_delete)
+        for attribute in attributes:
+            event.listen(getattr(model, attribute), 'set', _load_old_value, active_history=True)
+    event.listen(Session, 'before_flush', _before_flush)
+    event.listen(Session, 'after_flush', _after_flush)
+    event.listen(Session, 'after_bulk_update', _after_bulk_change)
+    event.listen(Session, 'after_bulk_delete', _after_bulk_change)
+    event.listen(Session, 'after_soft_rollback', _after_soft_rollback)
+    _hooks_registered = True
+
+
+class StatCounterService:
+    """计数器读取和校对"""
+
+    LOCK_NAME = 'credit_stat_counters_reconcile'
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.interval = int(os.environ.get('STAT_COUNTERS_RECONCILE_INTERVAL', 600))
+        self.recent_days = int(os.environ.get('STAT_RECENTLY_ACTIVE_DAYS', 30))
+        self._app = None
+        self._thread = None
+        self._thread_pid = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._stats = {
+            'reconciles': 0,
+            'skipped': 0,
+            'errors': 0,
+            'repaired_counters': 0,
+            'last_reconciled_at': None,
+            'last_drift': {}
+        }
+
+    def start(self, app):
+        """
+        启动当前进程的定期校对线程（重复调用只启动一次）
+
+        Args:
+            app: Flask应用实例
+        """
+        with self._lock:
+            if self._thread_pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._app = app
+            self._thread = threading.Thread(target=self._run, name='stat-counters-reconciler', daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+        self.logger.info("统计计数器校对线程已启动")
+
+    def _run(self):
+        # 启动时先校对一次（计数器可能在停机期间或首次部署前的批量修改中产生偏差）
+        while True:
+            try:
+                with self._app.app_context():
+                    self.reconcile()
+            except Exception as e:
+                self.logger.error(f"统计计数器校对异常: {e}")
+            if self._stop_event.wait(self.interval):
+                return
+
+    def reconcile(self):
+        """
+        用统计聚合的结果校对计数器
+
+        不锁定计数器行：在同一个一致性快照中读取计数器值和聚合结果，两者之差即为偏差，
+        再以 value = value + 偏差 的方式写回，快照之后提交的增量不会被覆盖，增量写入也不会被阻塞。
+        集群内通过MySQL命名锁只让一个进程执行
+
+        Returns:
+            dict: 校对后的计数器值，其他进程正在校对时返回None
+        """
+        is_mysql = db.engine.dialect.name == 'mysql'
+        lock_connection = None
+        if is_mysql:
+            lock_connection = db.engine.connect()
+            acquired = lock_connection.execute(text("SELECT GET_LOCK(:name, 0)"), {'name': self.LOCK_NAME}).scalar()
+            if acquired != 1:
+                lock_connection.close()
+                self._stats['skipped'] += 1
+                return None
+
+        connection = None
+        session = None
+        try:
+            self._ensure_rows()
+            # 使用独立连接和会话，避免沿用调用方事务中已建立的快照
+            connection = db.engine.connect()
+            if is_mysql:
+                connection = connection.execution_options(isolation_level='REPEATABLE READ')
+            session = Session(bind=connection)
+            if is_mysql:
+                session.execute(text("START TRANSACTION WITH CONSISTENT SNAPSHOT"))
+            snapshot = dict(session.query(StatCounter.name, StatCounter.value).filter(
+                StatCounter.name.in_(COUNTER_NAMES)
+            ).all())
+            actual = StatsAggregator.all_stats(session=session)
+
+            expected = {name: int(actual.get(name) or 0) for name in COUNTER_NAMES}
+            drift = {}
+            for name in COUNTER_NAMES:
+                difference = expected[name] - int(snapshot.get(name) or 0)
+                if difference:
+                    drift[name] = difference
+            _apply_deltas(session.connection(), drift)
+            session.commit()
+        except Exception as e:
+            if session is not None:
+                session.rollback()
+            self._stats['errors'] += 1
+            self.logger.error(f"校对统计计数器失败: {e}")
+            raise
+        finally:
+            if session is not None:
+                session.close()
+            if connection is not None:
+                connection.close()
+            if lock_connection is not None:
+                try:
+                    lock_connection.execute(text("SELECT RELEASE_LOCK(:name)"), {'name': self.LOCK_NAME})
+                finally:
+                    lock_connection.close()
+
+        self._stats['reconciles'] += 1
+        self._stats['repaired_counters'] += len(drift)
+        self._stats['last_reconciled_at'] = datetime.utcnow().isoformat()
+        self._stats['last_drift'] = drift
+        if drift:
+            self.logger.warning(f"统计计数器偏差已修复: {drift}")
+        return expected
+
+    def _ensure_rows(self):
+        """创建缺失的计数器行（值为0，随后由校对写入实际值；版本计数器只由增量维护）"""
+        names = COUNTER_NAMES + [PROJECT_VERSION_COUNTER]
+        session = Session(bind=db.engine)
+        try:
+            if session.bind.dialect.name == 'mysql':
+                session.execute(text(
+                    "INSERT IGNORE INTO stat_counters (name, value, updated_at) VALUES (:name, 0, UTC_TIMESTAMP())"
+                ), [{'name': name} for name in names])
+            else:
+                existing = {name for (name,) in session.query(StatCounter.name).all()}
+                for name in names:
+                    if name not in existing:
+                        session.add(StatCounter(name=name, value=0))
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def get_values(self):
+        """
+        按主键读取所有计数器
+
+        Returns:
+            dict: 与 StatsAggregator.all_stats() 字段相同的统计数据（含 average_score）
+        """
+        values = dict(db.session.query(StatCounter.name, StatCounter.value).filter(
+            StatCounter.name.in_(COUNTER_NAMES)
+        ).all())
+
+        if len(values) < len(COUNTER_NAMES):
+            # 计数器尚未初始化
+            values = self.reconcile()
+            if values is None:
+                return StatsAggregator.all_stats()
+
+        values = {name: int(value) for name, value in values.items()}
+        values['average_score'] = average_score(values['project_score_sum'], values['scored_projects'])
+        # 最近活跃用户数随时间变化，按 last_login 索引实时统计，不使用校对时的快照
+        since = datetime.utcnow() - timedelta(days=self.recent_days)
+        values['recently_active_users'] = db.session.query(User.id).filter(User.last_login >= since).count()
+        return values
+
+    def get_counter(self, name):
+        """按主键读取单个计数器（不存在时为0）"""
+        value = db.session.query(StatCounter.value).filter(StatCounter.name == name).scalar()
+        return int(value or 0)
+
+    def get_stats(self):
+        """获取校对指标"""
+        return dict(self._stats)
+
+
+# 全局计数器服务实例
+stat_counter_service = StatCounterService()
@@ -0,0 +1,209 @@
+"""
+统计聚合模块
+仪表板、实时统计和每日统计任务共用：每张表只扫描一次，
+各状态、类型、风险等级的数量用条件聚合（COUNT(CASE ...)）在同一条查询中计算；
+项目分布按 GROUP BY 查询，评分区间用 CASE 分桶后一次分组
+"""
+
+import os
+import time
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import func, case, and_, or_
+
+from database import db
+from db_models import (
+    Project, Document, User, UserRole,
+    ProjectStatus, ProjectType, DocumentStatus, RiskLevel
+)
+
+
+# 评分区间边界和名称（最后一个区间包含上边界）
+SCORE_BUCKET_EDGES = [int(edge) for edge in os.environ.get('STATS_SCORE_BUCKET_EDGES', '0,60,80,90,100').split(',')]
+SCORE_BUCKET_LABELS = os.environ.get('STATS_SCORE_BUCKET_LABELS', '低分,中等,良好,优秀').split(',')
+# 项目分布缓存的最长有效期（项目变更时通过版本计数器提前失效）
+DISTRIBUTION_CACHE_TTL = float(os.environ.get('STATS_DISTRIBUTION_CACHE_TTL', 300))
+_distribution_cache = {}
+_distribution_cache_lock = threading.Lock()
+
+
+def _count_when(condition):
+    """满足条件的行数（CASE不满足时为NULL，COUNT不计入）"""
+    return func.count(case((condition, 1)))
+
+
+def _aggregate(model, columns, session=None):
+    """
+    对一张表执行一次条件聚合查询
+
+    Args:
+        model: 模型类
+        columns: {结果字段名: 聚合表达式}
+        session: 执行查询的会话，默认使用 db.session
+
+    Returns:
+        dict: {结果字段名: 值}
+    """
+    labels = list(columns)
+    row = (session or db.session).query(*[columns[label].label(label) for label in labels]).select_from(model).one()
+    return dict(zip(labels, row))
+
+
+def average_score(score_sum, scored_count):
+    """由评分总和和有评分的项目数计算平均评分（保留一位小数）"""
+    return round(float(score_sum) / scored_count, 1) if scored_count and score_sum else 0.0
+
+
+class StatsAggregator:
+    """统计聚合"""
+
+    @staticmethod
+    def project_stats(session=None):
+        """项目统计：总数、各状态/类型/风险等级数量、平均评分"""
+        columns = {'total_projects': func.count(Project.id)}
+        for status in ProjectStatus:
+            columns[f'{status.value}_projects'] = _count_when(Project.status == status)
+        for project_type in ProjectType:
+            columns[f'{project_type.value}_projects'] = _count_when(Project.type == project_type)
+        for risk_level in RiskLevel:
+            columns[f'{risk_level.value}_risk_projects'] = _count_when(Project.risk_level == risk_level)
+        # 平均评分 = 评分总和 / 有评分的项目数（与AVG一样忽略NULL）
+        columns['project_score_sum'] = func.coalesce(func.sum(Project.score), 0)
+        columns['scored_projects'] = func.count(Project.score)
+
+        stats = _aggregate(Project, columns, session)
+        stats['project_score_sum'] = int(stats['project_score_sum'])
+        stats['average_score'] = average_score(stats['project_score_sum'], stats['scored_projects'])
+        return stats
+
+    @staticmethod
+    def document_stats(session=None):
+        """文档统计：总数、各状态数量"""
+        columns = {'total_documents': func.count(Document.id)}
+        for status in DocumentStatus:
+            columns[f'{status.value}_documents'] = _count_when(Document.status == status)
+        return _aggregate(Document, columns, session)
+
+    @staticmethod
+    def user_stats(recent_days=30, session=None):
+        """
+        用户统计
+
+        Args:
+            recent_days: 最近登录的天数范围
+            session: 执行查询的会话，默认使用 db.session
+
+        Returns:
+            dict: total_users、active_users（未禁用）、recently_active_users（最近登录过）
+        """
+        since = datetime.utcnow() - timedelta(days=recent_days)
+        return _aggregate(User, {
+            'total_users': func.count(User.id),
+            'active_users': _count_when(User.is_active.is_(True)),
+            'recently_active_users': _count_when(User.last_login >= since)
+        }, session)
+
+    @staticmethod
+    def all_stats(session=None):
+        """项目、文档、用户统计合并为一个字典（共三次查询）"""
+        stats = StatsAggregator.project_stats(session=session)
+        stats.update(StatsAggregator.document_stats(session=session))
+        stats.update(StatsAggregator.user_stats(session=session))
+        return stats
+
+    @staticmethod
+    def project_document_counts(project_ids, user=None, session=None):
+        """
+        一次 GROUP BY 查询统计多个项目的文档数量
+
+        Args:
+            project_ids: 项目ID列表（如项目列表的一页）
+            user: 当前用户，非管理员只统计可访问的文档
+                （自己上传的，或自己创建/负责的项目中的全部文档）
+            session: 执行查询的会话，默认使用 db.session
+
+        Returns:
+            dict: {项目ID: 文档数量}，没有文档的项目为0
+        """
+        project_ids = list(project_ids)
+        if not project_ids:
+            return {}
+        query = (session or db.session).query(Document.project_id, func.count(Document.id)).filter(
+            Document.project_id.in_(project_ids)
+        )
+        if user is not None and user.role != UserRole.ADMIN:
+            query = query.join(Project, Document.project_id == Project.id).filter(
+                or_(
+                    Document.upload_by == user.id,
+                    Project.created_by == user.id,
+                    Project.assigned_to == user.id
+                )
+            )
+        counts = dict(query.group_by(Document.project_id).all())
+        return {project_id: counts.get(project_id, 0) for project_id in project_ids}
+
+    @staticmethod
+    def project_distribution(score_edges=None, score_labels=None, session=None):
+        """
+        项目分布：类型、状态、风险等级各一次 GROUP BY，评分区间一次 CASE 分桶分组
+
+        Args:
+            score_edges: 评分区间边界（递增），默认 SCORE_BUCKET_EDGES
+            score_labels: 区间名称，数量比边界少1，默认按边界生成（如 "60-80"）
+            session: 执行查询的会话，默认使用 db.session
+
+        Returns:
+            dict: type_distribution、status_distribution、risk_distribution、score_distribution
+        """
+        session = session or db.session
+        score_edges = list(score_edges or SCORE_BUCKET_EDGES)
+        if score_labels is None:
+            if score_edges == SCORE_BUCKET_EDGES and len(SCORE_BUCKET_LABELS) == len(score_edges) - 1:
+                score_labels = SCORE_BUCKET_LABELS
+            else:
+                score_labels = [f'{low}-{high}' for low, high in zip(score_edges, score_edges[1:])]
+
+        def group_counts(column, enum_class):
+            counts = dict(session.query(column, func.count(Project.id)).group_by(column).all())
+            return {item.value: counts.get(item, 0) for item in enum_class}
+
+        # 左闭右开，最后一个区间包含上边界；区间外和无评分的项目不计入
+        last = len(score_edges) - 2
+        bucket = case(*[
+            (and_(Project.score >= low, Project.score <= high if i == last else Project.score < high), i)
+            for i, (low, high) in enumerate(zip(score_edges, score_edges[1:]))
+        ]).label('bucket')
+        bucket_counts = dict(session.query(bucket, func.count(Project.id)).group_by(bucket).all())
+
+        return {
+            'type_distribution': group_counts(Project.type, ProjectType),
+            'status_distribution': group_counts(Project.status, ProjectStatus),
+            'risk_distribution': group_counts(Project.risk_level, RiskLevel),
+            'score_distribution': {label: bucket_counts.get(i, 0) for i, label in enumerate(score_labels)}
+        }
+
+    @staticmethod
+    def cached_project_distribution(score_edges=None):
+        """
+        带缓存的项目分布
+
+        缓存按评分区间边界区分，项目类型、状态、风险等级或评分变化时版本计数器加1，
+        读取时先按主键读取版本，版本不变且未超过有效期时直接返回缓存
+        """
+        from services.stat_counters import stat_counter_service, PROJECT_VERSION_COUNTER
+
+        key = tuple(score_edges or SCORE_BUCKET_EDGES)
+        version = stat_counter_service.get_counter(PROJECT_VERSION_COUNTER)
+        now = time.time()
+        with _distribution_cache_lock:
+            cached = _distribution_cache.get(key)
+            if cached and cached[0] == version and cached[1] > now:
+                return cached[2]
+
+        distribution = StatsAggregator.project_distribution(list(key))
+        with _distribution_cache_lock:
+            _distribution_cache[key] = (version, now + DISTRIBUTION_CACHE_TTL, distribution)
+            # 自定义区间的缓存数量有限
+            while len(_distribution_cache) > 32:
+                _distribution_cache.pop(next(iter(_distribution_cache)))
+        return distribution
@@ -10,6 +10,7 @@ from db_models import (
     Project, Document, User, AnalysisReport,
     DashboardStats, ActivityLog, ProjectStatus, DocumentStatus, RiskLevel
 )
+from services.stats_aggregator import StatsAggregator
 
 
 class StatsService:
@@ -41,47 +42,25 @@ class StatsService:
 
     @staticmethod
     def _calculate_current_stats():
-        """计算当前统计数据"""
-        # 项目统计
-        total_projects = Project.query.count()
-        completed_projects = Project.query.filter_by(status=ProjectStatus.COMPLETED).count()
-        processing_projects = Project.query.filter_by(status=ProjectStatus.PROCESSING).count()
-        collecting_projects = Project.query.filter_by(status=ProjectStatus.COLLECTING).count()
-
-        # 文档统计
-        total_documents = Document.query.count()
-        completed_documents = Document.query.filter_by(status=DocumentStatus.COMPLETED).count()
-        processing_documents = Document.query.filter_by(status=DocumentStatus.PROCESSING).count()
-        failed_documents = Document.query.filter_by(status=DocumentStatus.FAILED).count()
-
-        # 用户统计
-        total_users = User.query.count()
-        active_users = User.query.filter_by(is_active=True).count()
-
-        # 平均分数
-        avg_score_result = db.session.query(func.avg(Project.score)).scalar()
-        average_score = round(avg_score_result, 1) if avg_score_result else 0.0
-
-        # 风险等级统计
-        high_risk_projects = Project.query.filter_by(risk_level=RiskLevel.HIGH).count()
-        medium_risk_projects = Project.query.filter_by(risk_level=RiskLevel.MEDIUM).count()
-        low_risk_projects = Project.query.filter_by(risk_level=RiskLevel.LOW).count()
+        """计算当前统计数据（项目、文档、用户表各一次条件聚合查询）"""
+        stats = StatsAggregator.all_stats()
 
         return {
-            'total_projects': total_projects,
-            'completed_projects': completed_projects,
-            'processing_projects': processing_projects,
-            'collecting_projects': collecting_projects,
-            'total_documents': total_documents,
-            'completed_documents': completed_documents,
-            'processing_documents': processing_documents,
-            'failed_documents': failed_documents,
-            'total_users': total_users,
-            'active_users': active_users,
-            'average_score': average_score,
-            'high_risk_projects': high_risk_projects,
-            'medium_risk_projects': medium_risk_projects,
-            'low_risk_projects': low_risk_projects
+            'total_projects': stats['total_projects'],
+            'completed_projects': stats['completed_projects'],
+            'processing_projects': stats['processing_projects'],
+            'collecting_projects': stats['collecting_projects'],
+            'archived_projects': 0,  # 项目状态中没有归档状态
+            'total_documents': stats['total_documents'],
+            'completed_documents': stats['completed_documents'],
+            'processing_documents': stats['processing_documents'],
+            'failed_documents': stats['failed_documents'],
+            'total_users': stats['total_users'],
+            'active_users': stats['active_users'],
+            'average_score': stats['average_score'],
+            'high_risk_projects': stats['high_risk_projects'],
+            'medium_risk_projects': stats['medium_risk_projects'],
+            'low_risk_projects': stats['low_risk_projects']
         }
 
     @staticmethod
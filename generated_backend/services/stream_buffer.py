@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+流式内容缓冲区
+按块追加内容并记录总长度，需要完整内容时才拼接一次，避免逐块字符串拼接带来的平方级复制
+"""
+
+
+class ChunkBuffer:
+    """内容块缓冲区"""
+
+    def __init__(self, initial=None):
+        self._chunks = []
+        self._length = 0
+        if initial:
+            self.append(initial)
+
+    def append(self, chunk):
+        """
+        追加内容块
+
+        Args:
+            chunk: 内容块，空内容直接忽略
+        """
+        if not chunk:
+            return
+        self._chunks.append(chunk)
+        self._length += len(chunk)
+
+    def getvalue(self):
+        """
+        获取完整内容，拼接结果会被缓存，连续调用不会重复拼接
+
+        Returns:
+            str: 完整内容
+        """
+        if len(self._chunks) > 1:
+            self._chunks = [''.join(self._chunks)]
+        return self._chunks[0] if self._chunks else ''
+
+    def tail(self, size):
+        """
+        获取末尾的若干字符（只拼接末尾涉及的内容块）
+
+        Args:
+            size: 字符数
+
+        Returns:
+            str: 末尾内容
+        """
+        parts = []
+        remaining = size
+        for chunk in reversed(self._chunks):
+            if remaining <= 0:
+                break
+            parts.append(chunk[-remaining:])
+            remaining -= len(chunk)
+        return ''.join(reversed(parts))
+
+    def replace(self, content):
+        """用新内容替换缓冲区"""
+        self._chunks = [content] if content else []
+        self._length = len(content) if content else 0
+
+    def clear(self):
+        """清空缓冲区"""
+        self._chunks = []
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def __bool__(self):
+        return self._length > 0
+
+    def __str__(self):
+        return self.getvalue()
@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+"""
+跨worker的报告生成工作流注册表
+记录每个项目正在进行的报告生成（所属worker、task_id、停止标志、心跳），
+多worker部署使用Redis存储并通过发布订阅通知取消，单机部署使用SQLite文件存储
+"""
+
+import os
+import json
+import time
+import socket
+import sqlite3
+import logging
+import threading
+
+
+class RedisWorkflowBackend:
+    """Redis存储：每个项目一个键，过期时间即心跳TTL，取消通过发布订阅通知"""
+
+    KEY_PREFIX = 'credit:workflow:active:'
+    CANCEL_CHANNEL = 'credit:workflow:cancel'
+    # 键不存在时才创建（相当于对哈希的 SET NX EX）
+    CREATE_SCRIPT = (
+        "if redis.call('EXISTS', KEYS[1]) == 1 then return 0 end "
+        "redis.call('HSET', KEYS[1], unpack(ARGV, 2)) "
+        "redis.call('EXPIRE', KEYS[1], ARGV[1]) return 1"
+    )
+    UPDATE_SCRIPT = (
+        "if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end "
+        "redis.call('HSET', KEYS[1], unpack(ARGV)) return 1"
+    )
+    # 所属worker一致时才删除
+    DELETE_OWNED_SCRIPT = (
+        "if redis.call('HGET', KEYS[1], 'owner') == ARGV[1] then "
+        "return redis.call('DEL', KEYS[1]) end return 0"
+    )
+
+    def __init__(self, redis_url):
+        import redis
+
+        self.client = redis.from_url(redis_url, socket_connect_timeout=2, socket_timeout=5)
+        self.client.ping()
+        # 订阅连接长时间阻塞等待消息，不能设置读超时，单独建立客户端
+        self.pubsub_client = redis.from_url(redis_url, socket_connect_timeout=2, socket_timeout=None,
+                                            socket_keepalive=True)
+
+    def _key(self, project_id):
+        return f"{self.KEY_PREFIX}{project_id}"
+
+    def create(self, project_id, info, ttl):
+        """
+        项目没有正在进行的工作流时创建记录
+
+        Returns:
+            bool: 是否创建成功（已被其他worker注册时为False）
+        """
+        args = [ttl]
+        for field, value in info.items():
+            args.extend([field, json.dumps(value, ensure_ascii=False)])
+        return bool(self.client.eval(self.CREATE_SCRIPT, 1, self._key(project_id), *args))
+
+    def load(self, project_id):
+        data = self.client.hgetall(self._key(project_id))
+        if not data:
+            return None
+        return {field.decode('utf-8'): json.loads(value) for field, value in data.items()}
+
+    def update(self, project_id, fields):
+        """只更新指定字段（HSET为原子操作，不会覆盖其他worker同时写入的字段）"""
+        args = []
+        for field, value in fields.items():
+            args.extend([field, json.dumps(value, ensure_ascii=False)])
+        # 键已过期时不再写入，避免生成没有TTL的残留记录
+        if not self.client.eval(self.UPDATE_SCRIPT, 1, self._key(project_id), *args):
+            return None
+        return self.load(project_id)
+
+    def touch(self, project_id, ttl):
+        return bool(self.client.expire(self._key(project_id), ttl))
+
+    def delete(self, project_id, owner=None):
+        if owner is None:
+            self.client.delete(self._key(project_id))
+            return
+        # 只删除自己注册的工作流，避免误删其他worker重新发起的生成（检查和删除在脚本中原子执行）
+        self.client.eval(self.DELETE_OWNED_SCRIPT, 1, self._key(project_id), json.dumps(owner, ensure_ascii=False))
+
+    def publish_cancel(self, project_id):
+        self.client.publish(self.CANCEL_CHANNEL, str(project_id))
+
+    def listen_cancel(self, callback):
+        """阻塞监听取消通知（在后台线程中运行）"""
+        pubsub = self.pubsub_client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.CANCEL_CHANNEL)
+        for message in pubsub.listen():
+            data = message.get('data')
+            if isinstance(data, bytes):
+                data = data.decode('utf-8')
+            callback(data)
+
+
+class SQLiteWorkflowBackend:
+    """SQLite文件存储：单机多worker共享，取消通过停止标志轮询"""
+
+    def __init__(self, db_path):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS active_workflows ('
+                'project_id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def create(self, project_id, info, ttl):
+        """项目没有未过期的记录时创建（过期记录直接覆盖），返回是否创建成功"""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'INSERT INTO active_workflows (project_id, data, expires_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(project_id) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at '
+                'WHERE active_workflows.expires_at < ?',
+                (str(project_id), json.dumps(info, ensure_ascii=False), now + ttl, now)
+            )
+            return cursor.rowcount > 0
+
+    def load(self, project_id):
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT data, expires_at FROM active_workflows WHERE project_id = ?',
+                (str(project_id),)
+            ).fetchone()
+        if not row or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def update(self, project_id, fields):
+        """在写事务中读取并更新字段，避免并发写入互相覆盖"""
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT data FROM active_workflows WHERE project_id = ? AND expires_at >= ?',
+                (str(project_id), time.time())
+            ).fetchone()
+            if not row:
+                conn.rollback()
+                return None
+            info = json.loads(row[0])
+            info.update(fields)
+            conn.execute(
+                'UPDATE active_workflows SET data = ? WHERE project_id = ?',
+                (json.dumps(info, ensure_ascii=False), str(project_id))
+            )
+            conn.commit()
+            return info
+        finally:
+            conn.close()
+
+    def touch(self, project_id, ttl):
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'UPDATE active_workflows SET expires_at = ? WHERE project_id = ? AND expires_at >= ?',
+                (time.time() + ttl, str(project_id), time.time())
+            )
+            return cursor.rowcount > 0
+
+    def delete(self, project_id, owner=None):
+        with self._connect() as conn:
+            if owner is None:
+                conn.execute('DELETE FROM active_workflows WHERE project_id = ?', (str(project_id),))
+            else:
+                conn.execute(
+                    "DELETE FROM active_workflows WHERE project_id = ? AND json_extract(data, '$.owner') = ?",
+                    (str(project_id), owner)
+                )
+            # 顺带清理过期记录
+            conn.execute('DELETE FROM active_workflows WHERE expires_at < ?', (time.time(),))
+
+    def publish_cancel(self, project_id):
+        # SQLite没有发布订阅，停止标志已写入记录，由所属worker轮询
+        pass
+
+    listen_cancel = None
+
+
+class WorkflowRegistry:
+    """报告生成工作流注册表"""
+
+    DEFAULT_SQLITE_PATH = os.path.join('output', '.workflow_registry.sqlite3')
+
+    def __init__(self, ttl=None, heartbeat_interval=None, stop_check_interval=None):
+        self.logger = logging.getLogger(__name__)
+        self.ttl = ttl or int(os.environ.get('WORKFLOW_REGISTRY_TTL', 120))
+        self.heartbeat_interval = heartbeat_interval or int(os.environ.get('WORKFLOW_HEARTBEAT_INTERVAL', 15))
+        self.stop_check_interval = stop_check_interval or float(os.environ.get('WORKFLOW_STOP_CHECK_INTERVAL', 1))
+        self._backend = None
+        self._backend_pid = None
+        self._lock = threading.Lock()
+        self._owned = {}          # 本worker注册的工作流 {project_id: 上次检查停止标志的时间}
+        self._cancelled = set()   # 本worker收到取消通知的项目
+        self._background_started = False
+
+    @property
+    def owner(self):
+        """当前worker标识"""
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def _create_backend(self):
+        """根据配置创建存储后端，Redis不可用时回退到SQLite"""
+        backend_name = os.environ.get('WORKFLOW_REGISTRY_BACKEND', '').lower()
+        if not backend_name:
+            use_redis = os.environ.get('USE_REDIS_BROKER', 'false').lower() == 'true'
+            backend_name = 'redis' if use_redis else 'sqlite'
+
+        if backend_name == 'redis':
+            redis_url = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+            try:
+                backend = RedisWorkflowBackend(redis_url)
+                self.logger.info(f"工作流注册表使用Redis: {redis_url}")
+                return backend
+            except Exception as e:
+                self.logger.error(f"连接Redis失败，工作流注册表回退到SQLite: {e}")
+
+        db_path = os.environ.get('WORKFLOW_REGISTRY_PATH') or self.DEFAULT_SQLITE_PATH
+        self.logger.info(f"工作流注册表使用SQLite: {db_path}")
+        return SQLiteWorkflowBackend(db_path)
+
+    @property
+    def backend(self):
+        """按进程延迟创建存储后端（gunicorn fork后各worker独立连接）"""
+        if self._backend is None or self._backend_pid != os.getpid():
+            with self._lock:
+                if self._backend is None or self._backend_pid != os.getpid():
+                    self._backend = self._create_backend()
+                    self._backend_pid = os.getpid()
+                    self._owned = {}
+                    self._cancelled = set()
+                    self._background_started = False
+        return self._backend
+
+    def _start_background(self):
+        """启动心跳线程和取消通知监听线程"""
+        with self._lock:
+            if self._background_started:
+                return
+            self._background_started = True
+
+        heartbeat = threading.Thread(target=self._heartbeat_loop, name='workflow-heartbeat', daemon=True)
+        heartbeat.start()
+        if self.backend.listen_cancel:
+            listener = threading.Thread(target=self._listen_loop, name='workflow-cancel-listener', daemon=True)
+            listener.start()
+
+    def _heartbeat_loop(self):
+        """定期刷新本worker工作流的TTL"""
+        while True:
+            time.sleep(self.heartbeat_interval)
+            with self._lock:
+                project_ids = list(self._owned)
+            for project_id in project_ids:
+                try:
+                    self.backend.touch(project_id, self.ttl)
+                except Exception as e:
+                    self.logger.warning(f"工作流心跳失败: 项目 {project_id}, {e}")
+
+    def _listen_loop(self):
+        """监听取消通知，连接断开后重试"""
+        while True:
+            try:
+                self.backend.listen_cancel(self._on_cancel)
+            except Exception as e:
+                self.logger.warning(f"工作流取消通知监听中断，稍后重试: {e}")
+            time.sleep(5)
+
+    def _on_cancel(self, project_id):
+        """收到取消通知：只记录本worker负责的项目"""
+        with self._lock:
+            for owned_id in self._owned:
+                if str(owned_id) == str(project_id):
+                    self._cancelled.add(owned_id)
+                    self.logger.info(f"收到项目 {project_id} 的取消通知")
+
+    def register(self, project_id, workflow_run_id):
+        """
+        注册本worker发起的工作流
+
+        Args:
+            project_id: 项目ID
+            workflow_run_id: 工作流运行ID
+
+        Returns:
+            dict: 工作流信息；项目已有其他正在进行的工作流时返回None
+        """
+        info = {
+            'project_id': project_id,
+            'workflow_run_id': workflow_run_id,
+            'owner': self.owner,
+            'task_id': None,
+            'stop_flag': False,
+            'started_at': time.time()
+        }
+        if not self.backend.create(project_id, info, self.ttl):
+            return None
+        with self._lock:
+            self._owned[project_id] = 0
+            self._cancelled.discard(project_id)
+        self._start_background()
+        return info
+
+    def get(self, project_id):
+        """获取项目正在进行的工作流信息，不存在或心跳已过期时返回None"""
+        try:
+            return self.backend.load(project_id)
+        except Exception as e:
+            self.logger.error(f"读取工作流注册表失败: {e}")
+            return None
+
+    def is_active(self, project_id):
+        """项目是否有正在进行的工作流"""
+        return self.get(project_id) is not None
+
+    def _update(self, project_id, **fields):
+        try:
+            return self.backend.update(project_id, fields)
+        except Exception as e:
+            self.logger.error(f"更新工作流注册表失败: 项目 {project_id}, {e}")
+            return None
+
+    def set_task_id(self, project_id, task_id):
+        """记录Dify的task_id，供其他worker调用停止接口"""
+        return self._update(project_id, task_id=task_id)
+
+    def request_stop(self, project_id):
+        """
+        请求停止项目的工作流（可在任意worker调用）
+
+        Returns:
+            dict: 工作流信息（包含task_id），没有正在进行的工作流时返回None
+        """
+        info = self._update(project_id, stop_flag=True)
+        if info is not None:
+            try:
+                self.backend.publish_cancel(project_id)
+            except Exception as e:
+                self.logger.warning(f"发布取消通知失败，所属worker将通过停止标志发现: {e}")
+            with self._lock:
+                if project_id in self._owned:
+                    self._cancelled.add(project_id)
+        return info
+
+    def should_stop(self, project_id):
+        """
+        本worker的工作流是否需要停止（流式处理中逐行调用，存储读取按间隔节流）
+        """
+        with self._lock:
+            if project_id in self._cancelled:
+                return True
+            last_check = self._owned.get(project_id)
+            now = time.time()
+            if last_check is None or now - last_check < self.stop_check_interval:
+                return False
+            self._owned[project_id] = now
+
+        info = self.get(project_id)
+        if info is not None and info.get('stop_flag'):
+            with self._lock:
+                self._cancelled.add(project_id)
+            return True
+        return False
+
+    def unregister(self, project_id, force=False):
+        """
+        移除工作流
+
+        Args:
+            project_id: 项目ID
+            force: 是否不论所属worker都移除（如删除报告时）
+        """
+        with self._lock:
+            self._owned.pop(project_id, None)
+            self._cancelled.discard(project_id)
+        try:
+            self.backend.delete(project_id, None if force else self.owner)
+        except Exception as e:
+            self.logger.error(f"移除工作流注册失败: 项目 {project_id}, {e}")
+
+
+# 全局注册表实例
+workflow_registry = WorkflowRegistry()
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Markdown后处理引擎的金样测试
+fixtures/markdown 下每个 <name>.md 是输入，<name>.postprocess.md 和 <name>.html.md
+是原分步实现（MarkdownPostProcessor 逐步修复、MarkdownToPDFConverter 通用后处理+通用修复）的输出
+"""
+
+import os
+
+import pytest
+
+from services.markdown_engine import markdown_engine, IncrementalMarkdownProcessor
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'markdown')
+CASES = sorted(
+    name[:-3] for name in os.listdir(FIXTURE_DIR)
+    if name.endswith('.md') and not name.endswith(('.postprocess.md', '.html.md'))
+)
+
+
+def _read(name):
+    # 保留原始换行符（部分输入包含CRLF）
+    with open(os.path.join(FIXTURE_DIR, name), encoding='utf-8', newline='') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('case', CASES)
+def test_postprocess_matches_golden(case):
+    assert markdown_engine.postprocess(_read(f'{case}.md')) == _read(f'{case}.postprocess.md')
+
+
+@pytest.mark.parametrize('case', CASES)
+def test_preprocess_for_html_matches_golden(case):
+    assert markdown_engine.preprocess_for_html(_read(f'{case}.md')) == _read(f'{case}.html.md')
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 64])
+@pytest.mark.parametrize('case', CASES)
+def test_incremental_matches_golden(case, chunk_size):
+    content = _read(f'{case}.md')
+    processor = IncrementalMarkdownProcessor()
+    for start in range(0, len(content), chunk_size):
+        processor.feed(content[start:start + chunk_size])
+    assert processor.finish() == _read(f'{case}.postprocess.md')
+
+
+def test_empty_content_is_returned_unchanged():
+    assert markdown_engine.postprocess('') == ''
+    assert markdown_engine.preprocess_for_html('') == ''
+    assert IncrementalMarkdownProcessor().finish() == ''
@@ -2,6 +2,8 @@
 工具函数和装饰器
 """
 
+import os
+import hashlib
 import logging
 import asyncio
 from functools import wraps
@@ -95,3 +97,22 @@ def format_response(success=True, data=None, message=None, error=None, status_co
         response['error'] = error
 
     return jsonify(response), status_code
+
+def compute_file_hash(file_path, chunk_size=1024 * 1024):
+    """
+    计算文件内容的SHA-256哈希（分块读取，不把整个文件读入内存）
+
+    Args:
+        file_path: 文件路径
+        chunk_size: 每次读取的字节数
+
+    Returns:
+        str: 十六进制哈希值，文件不存在时返回None
+    """
+    if not file_path or not os.path.exists(file_path):
+        return None
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -4,13 +4,440 @@ WebSocket事件处理器
 """
 
 from flask_socketio import emit, join_room, leave_room
-from flask import current_app, request
+from flask import current_app, request, has_app_context
+import os
 import json
 import time
+import logging
+import threading
+from collections import deque
+
+from services.stream_buffer import ChunkBuffer
+
+logger = logging.getLogger(__name__)
 
 # 存储活跃的WebSocket连接
 active_connections = {}
 
+
+class MemoryReplayStore:
+    """
+    进程内的重连补发帧存储（未启用Redis时使用）
+    帧只保存在发送进程中，只适用于单worker部署；多worker部署需启用Redis
+    """
+
+    def __init__(self, history_size, retention_seconds, active_ttl):
+        self.history_size = history_size
+        self.retention_seconds = retention_seconds
+        self.active_ttl = active_ttl
+        self._lock = threading.Lock()
+        # {房间ID: {'seq', 'history', 'finished_at', 'updated_at'}}
+        self._rooms = {}
+        self._last_expire = 0
+
+    def _expire_rooms(self, now):
+        """清理已结束超过保留时间、或未结束但长时间没有新帧的房间（调用方需持有锁）"""
+        if now - self._last_expire < 60:
+            return
+        self._last_expire = now
+        expired = [room for room, state in self._rooms.items()
+                   if (state['finished_at'] and now - state['finished_at'] > self.retention_seconds) or
+                   (not state['finished_at'] and now - state['updated_at'] > self.active_ttl)]
+        for room in expired:
+            del self._rooms[room]
+
+    def append(self, room, event_name, message):
+        """分配序号并记录帧；已结束的房间开始新一轮生成时清空历史，序号继续递增"""
+        now = time.time()
+        with self._lock:
+            self._expire_rooms(now)
+            state = self._rooms.get(room)
+            if state is None:
+                state = {'seq': 0, 'history': deque(maxlen=self.history_size), 'finished_at': None}
+                self._rooms[room] = state
+            elif state['finished_at']:
+                state['history'].clear()
+                state['finished_at'] = None
+            state['seq'] += 1
+            state['updated_at'] = now
+            message['seq'] = state['seq']
+            state['history'].append((state['seq'], event_name, message))
+            return state['seq']
+
+    def finish(self, room):
+        with self._lock:
+            state = self._rooms.get(room)
+            if state:
+                state['finished_at'] = time.time()
+
+    def frames_since(self, room, last_seq):
+        with self._lock:
+            state = self._rooms.get(room)
+            if state is None:
+                return [], 0, False
+            frames = [frame for frame in state['history'] if frame[0] > last_seq]
+            oldest_seq = state['history'][0][0] if state['history'] else state['seq'] + 1
+            return frames, state['seq'], last_seq + 1 < oldest_seq
+
+    def current_seq(self, room):
+        with self._lock:
+            state = self._rooms.get(room)
+            return state['seq'] if state else 0
+
+
+class RedisReplayStore:
+    """
+    Redis中的重连补发帧存储（USE_REDIS_BROKER开启时使用）
+    每个房间一个序号键和一个定长列表，发送帧的进程写入，任意worker处理重连时读取；
+    未结束的房间在active_ttl内没有新帧时过期，结束后保留retention_seconds秒
+    """
+
+    KEY_PREFIX = 'credit:ws:replay:'
+    # KEYS: 序号, 帧列表, 结束标志; ARGV: 事件名, 消息JSON, 保留帧数, 过期秒数
+    APPEND_SCRIPT = (
+        "if redis.call('EXISTS', KEYS[3]) == 1 then redis.call('DEL', KEYS[2], KEYS[3]) end "
+        "local seq = redis.call('INCR', KEYS[1]) "
+        "redis.call('RPUSH', KEYS[2], seq .. ' ' .. ARGV[1] .. ' ' .. ARGV[2]) "
+        "redis.call('LTRIM', KEYS[2], -tonumber(ARGV[3]), -1) "
+        "redis.call('EXPIRE', KEYS[1], ARGV[4]) "
+        "redis.call('EXPIRE', KEYS[2], ARGV[4]) "
+        "return seq"
+    )
+    FINISH_SCRIPT = (
+        "redis.call('SET', KEYS[3], '1', 'EX', ARGV[1]) "
+        "redis.call('EXPIRE', KEYS[1], ARGV[1]) "
+        "redis.call('EXPIRE', KEYS[2], ARGV[1]) "
+        "return 1"
+    )
+
+    def __init__(self, redis_url, history_size, retention_seconds, active_ttl):
+        import redis
+
+        self.client = redis.from_url(redis_url, socket_connect_timeout=2, socket_timeout=5)
+        self.client.ping()
+        self.history_size = history_size
+        self.retention_seconds = retention_seconds
+        self.active_ttl = active_ttl
+
+    def _keys(self, room):
+        prefix = f"{self.KEY_PREFIX}{room}"
+        return f"{prefix}:seq", f"{prefix}:frames", f"{prefix}:finished"
+
+    def append(self, room, event_name, message):
+        payload = json.dumps(message, ensure_ascii=False, default=str)
+        seq = int(self.client.eval(self.APPEND_SCRIPT, 3, *self._keys(room),
+                                   event_name, payload, self.history_size, self.active_ttl))
+        message['seq'] = seq
+        return seq
+
+    def finish(self, room):
+        self.client.eval(self.FINISH_SCRIPT, 3, *self._keys(room), self.retention_seconds)
+
+    def frames_since(self, room, last_seq):
+        seq_key, frames_key, _ = self._keys(room)
+        pipe = self.client.pipeline()
+        pipe.get(seq_key)
+        pipe.lrange(frames_key, 0, -1)
+        current_seq, entries = pipe.execute()
+        current_seq = int(current_seq or 0)
+
+        frames = []
+        oldest_seq = None
+        for entry in entries:
+            seq, event_name, payload = entry.decode('utf-8').split(' ', 2)
+            seq = int(seq)
+            if oldest_seq is None:
+                oldest_seq = seq
+            if seq > last_seq:
+                message = json.loads(payload)
+                message['seq'] = seq
+                frames.append((seq, event_name, message))
+        if oldest_seq is None:
+            oldest_seq = current_seq + 1
+        return frames, current_seq, last_seq + 1 < oldest_seq
+
+    def current_seq(self, room):
+        return int(self.client.get(self._keys(room)[0]) or 0)
+
+
+class ContentBroadcaster:
+    """
+    按房间合并内容块的广播器
+    内容块先写入房间缓冲区，距上次发送超过flush_interval_ms或缓冲超过flush_bytes时合并为一帧发送；
+    内容帧和事件共用房间内递增的序号，节点、完成、错误事件发送前先发送缓冲中的内容，保证顺序。
+    每个房间保留最近的帧（多worker部署时保存在Redis中），客户端断线重连到任意worker时都可按序号补发错过的帧。
+    每个房间有独立的锁，发送（使用Redis消息队列时为网络发布）只阻塞同一房间，不影响其他房间
+    """
+
+    def __init__(self, flush_interval_ms=None, flush_bytes=None, history_size=None, retention_seconds=None,
+                 active_ttl=None):
+        self.flush_interval_ms = flush_interval_ms
+        self.flush_bytes = flush_bytes
+        self._history_size = history_size
+        self._retention_seconds = retention_seconds
+        self._active_ttl = active_ttl
+        # 只保护房间字典、存储和统计，不在持有时发送
+        self._lock = threading.Lock()
+        self._store = None
+        self._store_pid = None
+        # 当前进程发送中的房间 {房间ID: {'lock', 'buffer', 'last_seq', 'last_flush', 'timer_scheduled', 'finished_at'}}
+        self._rooms = {}
+        self._last_expire = 0
+        self._stats = {'chunks': 0, 'frames': 0, 'events': 0, 'replayed_frames': 0, 'store_errors': 0}
+
+    @property
+    def store(self):
+        """按进程延迟创建补发帧存储，启用Redis时使用Redis，连接失败时回退到进程内存储"""
+        if self._store is None or self._store_pid != os.getpid():
+            with self._lock:
+                if self._store is None or self._store_pid != os.getpid():
+                    self._store = self._create_store()
+                    self._store_pid = os.getpid()
+        return self._store
+
+    def _get_replay_setting(self, value, name, default):
+        """获取补发配置：优先使用构造参数，其次应用配置，最后环境变量"""
+        if has_app_context():
+            value = value or current_app.config.get(name)
+        return int(value or os.environ.get(name, default))
+
+    @property
+    def history_size(self):
+        """每个房间保留的最近帧数"""
+        return self._get_replay_setting(self._history_size, 'WS_REPLAY_BUFFER_FRAMES', 2000)
+
+    @property
+    def retention_seconds(self):
+        """工作流结束后房间历史保留的秒数"""
+        return self._get_replay_setting(self._retention_seconds, 'WS_REPLAY_RETENTION_SECONDS', 600)
+
+    @property
+    def active_ttl(self):
+        """未结束的房间没有新帧后过期的秒数"""
+        return self._get_replay_setting(self._active_ttl, 'WS_REPLAY_ACTIVE_TTL_SECONDS', 3600)
+
+    def _create_store(self):
+        backend = os.environ.get('WS_REPLAY_STORE', '').lower()
+        if not backend:
+            use_redis = os.environ.get('USE_REDIS_BROKER', 'false').lower() == 'true'
+            backend = 'redis' if use_redis else 'memory'
+        if backend == 'redis':
+            redis_url = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+            try:
+                store = RedisReplayStore(redis_url, self.history_size, self.retention_seconds, self.active_ttl)
+                logger.info(f"WebSocket补发帧存储使用Redis: {redis_url}")
+                return store
+            except Exception as e:
+                logger.error(f"连接Redis失败，WebSocket补发帧存储回退到进程内存: {e}")
+        return MemoryReplayStore(self.history_size, self.retention_seconds, self.active_ttl)
+
+    def _get_policy(self):
+        """获取发送策略（毫秒间隔, 字节数）"""
+        interval_ms = self.flush_interval_ms
+        flush_bytes = self.flush_bytes
+        if has_app_context():
+            interval_ms = interval_ms or current_app.config.get('WS_CONTENT_FLUSH_INTERVAL_MS')
+            flush_bytes = flush_bytes or current_app.config.get('WS_CONTENT_FLUSH_BYTES')
+        interval_ms = int(interval_ms or os.environ.get('WS_CONTENT_FLUSH_INTERVAL_MS', 200))
+        flush_bytes = int(flush_bytes or os.environ.get('WS_CONTENT_FLUSH_BYTES', 4096))
+        return interval_ms, flush_bytes
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self._stats[name] += value
+
+    def _expire_rooms(self, now):
+        """
+        清理本进程的发送状态：已结束超过保留时间、或未结束但长时间没有新内容的房间
+        （调用方需持有全局锁，每分钟最多执行一次）
+        """
+        if now - self._last_expire < 60:
+            return
+        self._last_expire = now
+        retention_seconds, active_ttl = self.retention_seconds, self.active_ttl
+        expired = [room for room, state in self._rooms.items()
+                   if (state['finished_at'] and now - state['finished_at'] > retention_seconds) or
+                   (not state['finished_at'] and now - state['last_flush'] > active_ttl)]
+        for room in expired:
+            del self._rooms[room]
+
+    def _get_state(self, room, create=False):
+        """获取本进程的房间发送状态，create为True时不存在则创建"""
+        with self._lock:
+            self._expire_rooms(time.time())
+            state = self._rooms.get(room)
+            if state is None and create:
+                state = {
+                    'lock': threading.RLock(),
+                    'buffer': ChunkBuffer(),
+                    'last_seq': 0,
+                    'last_flush': time.time(),
+                    'timer_scheduled': False,
+                    'finished_at': None
+                }
+                self._rooms[room] = state
+            return state
+
+    def _send(self, socketio, room, state, event_name, message):
+        """分配序号、记录到补发存储并发送（调用方需持有房间锁，保证同一房间按序号顺序发出）"""
+        try:
+            seq = self.store.append(room, event_name, message)
+        except Exception as e:
+            # 存储不可用时仍然实时发送，只是无法补发
+            self._count('store_errors')
+            logger.warning(f"记录补发帧失败: {e}")
+            seq = state['last_seq'] + 1
+            message['seq'] = seq
+        state['last_seq'] = seq
+        state['finished_at'] = None
+        try:
+            socketio.emit(event_name, message, room=room)
+        except Exception as e:
+            logger.error(f"广播{event_name}失败: {e}")
+        return seq
+
+    def _flush_locked(self, socketio, room, state):
+        """发送房间缓冲区中的内容（调用方需持有房间锁）"""
+        if not state['buffer']:
+            return None
+        content = state['buffer'].getvalue()
+        state['buffer'].clear()
+        state['last_flush'] = time.time()
+        self._count('frames')
+        message = {
+            'workflow_run_id': room,
+            'content_chunk': content,
+            'timestamp': state['last_flush']
+        }
+        seq = self._send(socketio, room, state, 'workflow_content', message)
+        logger.debug(f"广播工作流内容到房间 {room}: 帧 {seq}, {len(content)} 字符")
+        return seq
+
+    def push(self, socketio, room, content_chunk):
+        """
+        写入内容块，满足发送条件时合并发送
+
+        Args:
+            socketio: SocketIO实例
+            room: 房间ID
+            content_chunk: 内容块
+        """
+        if not content_chunk:
+            return
+        interval_ms, flush_bytes = self._get_policy()
+        schedule_timer = False
+        state = self._get_state(room, create=True)
+        with state['lock']:
+            state['buffer'].append(content_chunk)
+            self._count('chunks')
+            if (len(state['buffer']) >= flush_bytes or
+                    (time.time() - state['last_flush']) * 1000 >= interval_ms):
+                self._flush_locked(socketio, room, state)
+            elif not state['timer_scheduled']:
+                # 未到发送条件时安排延迟发送，避免内容长时间停留在缓冲区
+                state['timer_scheduled'] = True
+                schedule_timer = True
+
+        if schedule_timer:
+            socketio.start_background_task(self._delayed_flush, socketio, room, interval_ms / 1000.0)
+
+    def _delayed_flush(self, socketio, room, delay):
+        """延迟发送房间缓冲区中的内容"""
+        socketio.sleep(delay)
+        state = self._get_state(room)
+        if state is None:
+            return
+        with state['lock']:
+            state['timer_scheduled'] = False
+            self._flush_locked(socketio, room, state)
+
+    def flush(self, socketio, room):
+        """
+        立即发送本进程中该房间缓冲区的内容
+
+        Args:
+            socketio: SocketIO实例
+            room: 房间ID
+
+        Returns:
+            int: 发送的帧序号，缓冲区为空时返回None
+        """
+        state = self._get_state(room)
+        if state is None:
+            return None
+        with state['lock']:
+            return self._flush_locked(socketio, room, state)
+
+    def publish(self, socketio, room, event_name, message, finished=False):
+        """
+        发送事件：先发送缓冲中的内容，再为事件分配序号并记录
+
+        Args:
+            socketio: SocketIO实例
+            room: 房间ID
+            event_name: Socket.IO事件名
+            message: 事件消息
+            finished: 是否为工作流结束事件（完成/错误），结束后房间历史保留retention_seconds秒
+
+        Returns:
+            int: 事件序号
+        """
+        state = self._get_state(room, create=True)
+        with state['lock']:
+            self._flush_locked(socketio, room, state)
+            self._count('events')
+            seq = self._send(socketio, room, state, event_name, message)
+            if finished:
+                state['finished_at'] = time.time()
+                try:
+                    self.store.finish(room)
+                except Exception as e:
+                    self._count('store_errors')
+                    logger.warning(f"标记补发帧结束失败: {e}")
+            return seq
+
+    def get_frames_since(self, room, last_seq):
+        """
+        获取序号大于last_seq的帧，用于客户端重连后补发（可在任意worker调用）
+
+        Args:
+            room: 房间ID
+            last_seq: 客户端已收到的最大序号
+
+        Returns:
+            Tuple[List[Tuple[int, str, dict]], int, bool]: (帧列表, 当前序号, 是否有帧已被淘汰无法补发)
+        """
+        try:
+            frames, current_seq, truncated = self.store.frames_since(room, last_seq)
+        except Exception as e:
+            self._count('store_errors')
+            logger.warning(f"读取补发帧失败: {e}")
+            return [], 0, True
+        self._count('replayed_frames', len(frames))
+        return frames, current_seq, truncated
+
+    def get_current_seq(self, room):
+        """获取房间当前的最大序号"""
+        try:
+            return self.store.current_seq(room)
+        except Exception as e:
+            self._count('store_errors')
+            logger.warning(f"读取房间序号失败: {e}")
+            return 0
+
+    def get_stats(self):
+        """获取本进程的广播统计：收到的内容块数、实际发送的帧数、事件数、补发帧数"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['active_rooms'] = sum(1 for state in self._rooms.values() if not state['finished_at'])
+            stats['retained_rooms'] = len(self._rooms)
+            stats['replay_store'] = type(self._store).__name__ if self._store else None
+        return stats
+
+
+# 全局内容广播器实例
+content_broadcaster = ContentBroadcaster()
+
 def register_websocket_handlers(socketio):
     """注册WebSocket事件处理器"""
     
@@ -44,9 +471,35 @@ def register_websocket_handlers(socketio):
         }
         
         current_app.logger.info(f"客户端 {request.sid} 加入工作流房间: {workflow_run_id}")
+
+        # 断线重连：客户端携带已收到的最大序号时，只补发错过的帧
+        last_seq = data.get('last_seq')
+        if last_seq is not None:
+            try:
+                last_seq = int(last_seq)
+            except (TypeError, ValueError):
+                emit('error', {'message': 'last_seq参数无效'})
+                return
+
+            content_broadcaster.flush(socketio, workflow_run_id)
+            frames, current_seq, truncated = content_broadcaster.get_frames_since(workflow_run_id, last_seq)
+            emit('joined_workflow', {
+                'workflow_run_id': workflow_run_id,
+                'message': f'已加入工作流 {workflow_run_id}',
+                'last_seq': current_seq,
+                'replay_count': len(frames),
+                'replay_truncated': truncated
+            })
+            # 补发的帧与实时帧可能重复，客户端按seq去重
+            for _, event_name, message in frames:
+                emit(event_name, dict(message, replay=True))
+            current_app.logger.info(f"客户端 {request.sid} 重连补发 {len(frames)} 帧 (last_seq={last_seq})")
+            return
+
         emit('joined_workflow', {
             'workflow_run_id': workflow_run_id,
-            'message': f'已加入工作流 {workflow_run_id}'
+            'message': f'已加入工作流 {workflow_run_id}',
+            'last_seq': content_broadcaster.get_current_seq(workflow_run_id)
         })
     
     @socketio.on('leave_workflow')
@@ -87,8 +540,8 @@ def broadcast_workflow_event(socketio, workflow_run_id, event_type, event_data=N
         if content:
             message['content'] = content
         
-        # 向房间内的所有客户端广播
-        socketio.emit('workflow_event', message, room=workflow_run_id)
+        # 先发送缓冲中的内容，再向房间内的所有客户端广播（带序号，可重连补发）
+        content_broadcaster.publish(socketio, workflow_run_id, 'workflow_event', message)
         
         current_app.logger.info(f"广播工作流事件: {event_type} 到房间 {workflow_run_id}")
         
@@ -97,7 +550,7 @@ def broadcast_workflow_event(socketio, workflow_run_id, event_type, event_data=N
 
 def broadcast_workflow_content(socketio, workflow_run_id, content_chunk):
     """
-    向指定工作流房间广播内容块
+    向指定工作流房间广播内容块（按房间合并后发送，发送策略见 ContentBroadcaster）
 
     Args:
         socketio: SocketIO实例
@@ -105,20 +558,7 @@ def broadcast_workflow_content(socketio, workflow_run_id, content_chunk):
         content_chunk: 内容块
     """
     try:
-        # 确保content_chunk不为None
-        safe_content = content_chunk if content_chunk is not None else ""
-
-        message = {
-            'workflow_run_id': workflow_run_id,
-            'content_chunk': safe_content,
-            'timestamp': time.time()
-        }
-
-        # 向房间内的所有客户端广播
-        socketio.emit('workflow_content', message, room=workflow_run_id)
-
-        current_app.logger.info(f"广播工作流内容到房间 {workflow_run_id}: {safe_content[:50]}...")
-
+        content_broadcaster.push(socketio, workflow_run_id, content_chunk)
     except Exception as e:
         current_app.logger.error(f"广播工作流内容失败: {e}")
 
@@ -146,8 +586,8 @@ def broadcast_workflow_complete(socketio, workflow_run_id, final_content, projec
         if project_id:
             message['project_id'] = project_id
 
-        # 向房间内的所有客户端广播
-        socketio.emit('workflow_complete', message, room=workflow_run_id)
+        # 先发送缓冲中的内容，再向房间内的所有客户端广播
+        content_broadcaster.publish(socketio, workflow_run_id, 'workflow_complete', message, finished=True)
 
         current_app.logger.info(f"广播工作流完成事件到房间 {workflow_run_id}")
 
@@ -175,8 +615,8 @@ def broadcast_workflow_error(socketio, workflow_run_id, error_message, project_i
         if project_id:
             message['project_id'] = project_id
 
-        # 向房间内的所有客户端广播
-        socketio.emit('workflow_error', message, room=workflow_run_id)
+        # 先发送缓冲中的内容，再向房间内的所有客户端广播
+        content_broadcaster.publish(socketio, workflow_run_id, 'workflow_error', message, finished=True)
 
         current_app.logger.error(f"广播工作流错误到房间 {workflow_run_id}: {error_message}")
 